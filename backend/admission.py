@@ -0,0 +1,226 @@
+"""Admission control and load shedding.
+
+Two layers protect the worker and the Mongo pool from bots and refresh
+storms on the public booking endpoints:
+
+* Token-bucket rate limits per client IP and per phone number, checked by
+  the public POST handlers via ``check_rate_limits``. Bucket state lives
+  in a pluggable store: in-memory per worker, or a shared Mongo
+  collection (RATE_LIMIT_STORE=mongo) for multi-worker deployments.
+* AdmissionMiddleware, a per-worker concurrency limiter with priority
+  classes. Anonymous traffic may only use part of the capacity and is
+  rejected immediately when it is full; authenticated staff use the rest,
+  wait briefly for a slot, and are handed freed slots first.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+
+from auth import decode_token
+from database import pool_metrics, rate_limits_collection, MONGO_MAX_POOL_SIZE
+from metrics import registry
+from models import normalize_phone
+
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory")  # "memory" or "mongo"
+RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", "10"))
+RATE_LIMIT_IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", "20"))
+RATE_LIMIT_PHONE_PER_HOUR = float(os.environ.get("RATE_LIMIT_PHONE_PER_HOUR", "6"))
+RATE_LIMIT_PHONE_BURST = float(os.environ.get("RATE_LIMIT_PHONE_BURST", "4"))
+TRUST_FORWARDED_FOR = os.environ.get("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", "200"))
+PUBLIC_CONCURRENCY_SHARE = float(os.environ.get("PUBLIC_CONCURRENCY_SHARE", "0.7"))
+STAFF_QUEUE_TIMEOUT_MS = int(os.environ.get("STAFF_QUEUE_TIMEOUT_MS", "2000"))
+PUBLIC_SHED_POOL_UTILIZATION = float(os.environ.get("PUBLIC_SHED_POOL_UTILIZATION", "0.9"))
+
+# Never shed probes and scrapes; live streams are capped by their broker
+EXEMPT_PATHS = ("/api/health", "/api/metrics", "/api/live")
+
+# ==================== Rate limit stores ====================
+class InMemoryRateLimitStore:
+    """Token buckets in a dict; state is per worker process"""
+
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def take(self, key, capacity, refill_per_second) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.MAX_KEYS:
+            self._prune(now)
+        retry_after = 0.0 if allowed else (1 - tokens) / refill_per_second
+        return allowed, retry_after
+
+    def _prune(self, now):
+        # Buckets idle long enough to be full again carry no state
+        self._buckets = {
+            k: (tokens, updated) for k, (tokens, updated) in self._buckets.items()
+            if now - updated < 3600
+        }
+
+class MongoRateLimitStore:
+    """Token buckets shared by all workers, updated atomically in one round trip"""
+
+    async def take(self, key, capacity, refill_per_second) -> Tuple[bool, float]:
+        now = datetime.utcnow()
+        elapsed_seconds = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        refilled = {"$min": [
+            capacity,
+            {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed_seconds, refill_per_second]}]},
+        ]}
+        bucket = await rate_limits_collection.find_one_and_update(
+            {"key": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": now + timedelta(seconds=capacity / refill_per_second),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        allowed = bucket["allowed"]
+        retry_after = 0.0 if allowed else (1 - bucket["tokens"]) / refill_per_second
+        return allowed, retry_after
+
+rate_limit_store = MongoRateLimitStore() if RATE_LIMIT_STORE == "mongo" else InMemoryRateLimitStore()
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def check_rate_limits(scope: str, request: Request, phone: Optional[str] = None):
+    """Raise 429 when the client IP or phone number is over its budget for ``scope``"""
+    checks = [(f"{scope}:ip:{client_ip(request)}", RATE_LIMIT_IP_BURST, RATE_LIMIT_IP_PER_MINUTE / 60, "ip")]
+    if normalize_phone(phone):
+        checks.append((
+            f"{scope}:phone:{normalize_phone(phone)}",
+            RATE_LIMIT_PHONE_BURST, RATE_LIMIT_PHONE_PER_HOUR / 3600, "phone",
+        ))
+    for key, capacity, refill, kind in checks:
+        allowed, retry_after = await rate_limit_store.take(key, capacity, refill)
+        if not allowed:
+            registry.inc(
+                "rate_limited_requests_total", "Requests rejected by rate limits",
+                ("scope", "key"), (scope, kind),
+            )
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests. Please try again later.",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+            )
+
+# ==================== Concurrency limiter ====================
+STAFF = "staff"
+PUBLIC = "public"
+
+class ConcurrencyLimiter:
+    """Caps in-flight requests per worker with reserved capacity for staff"""
+
+    def __init__(self, limit, public_share, staff_timeout):
+        self.limit = limit
+        self.public_limit = max(1, int(limit * public_share))
+        self.staff_timeout = staff_timeout
+        self.active = 0
+        self._staff_waiters = deque()
+
+    async def acquire(self, priority) -> Optional[str]:
+        """Take a slot; return a rejection reason instead when shedding"""
+        if priority == PUBLIC:
+            if self.active >= self.public_limit:
+                return "capacity"
+            if MONGO_MAX_POOL_SIZE and pool_metrics.checked_out >= MONGO_MAX_POOL_SIZE * PUBLIC_SHED_POOL_UTILIZATION:
+                return "db_pool"
+            self.active += 1
+            return None
+        if self.active < self.limit:
+            self.active += 1
+            return None
+        waiter = asyncio.get_running_loop().create_future()
+        self._staff_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.staff_timeout)
+            return None
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # The slot was handed over just as we timed out; keep it
+                return None
+            waiter.cancel()
+            return "capacity"
+
+    def release(self):
+        while self._staff_waiters:
+            waiter = self._staff_waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to a waiting staff request
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+concurrency_limiter = ConcurrencyLimiter(
+    MAX_CONCURRENT_REQUESTS, PUBLIC_CONCURRENCY_SHARE, STAFF_QUEUE_TIMEOUT_MS / 1000
+)
+
+def request_priority(scope) -> str:
+    """STAFF only for a valid bearer token; logging in is public like any anonymous call"""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            token = value.decode("latin-1")
+            if token.lower().startswith("bearer ") and decode_token(token[7:]) is not None:
+                return STAFF
+    return PUBLIC
+
+class AdmissionMiddleware:
+    """ASGI middleware that sheds excess load with fast 503 responses"""
+
+    def __init__(self, app, limiter: ConcurrencyLimiter = concurrency_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PATHS) or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        priority = request_priority(scope)
+        rejected = await self.limiter.acquire(priority)
+        if rejected:
+            registry.inc(
+                "shed_requests_total", "Requests rejected by admission control",
+                ("priority", "reason"), (priority, rejected),
+            )
+            body = json.dumps({"detail": "Server is busy. Please try again shortly."}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", b"1"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
@@ -0,0 +1,205 @@
+"""Vectorized doctor utilization, no-show and peak-hour analytics.
+
+Everything for a window is loaded once into pandas frames: active
+schedules, schedule exceptions and the window's appointment timestamps.
+Slot capacity is computed for every (doctor, day) pair at once by joining
+the calendar with the weekly schedules and applying exceptions the same
+way ``get_available_slots`` does (first schedule per weekday, leave days
+drop the day, custom hours override it), instead of generating each day's
+slots in Python.
+
+The frame builders and ``compute_*`` functions take plain documents and
+frames so benchmarks/analytics_benchmark.py can time them without Mongo.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from archival import may_be_archived
+from database import (
+    appointments_reporting_collection, appointments_archive_reporting_collection,
+    doctors_reporting_collection, schedules_reporting_collection,
+    schedule_exceptions_reporting_collection
+)
+
+STATUSES = ["new", "confirmed", "completed", "cancelled", "no_show"]
+# Statuses that occupy a slot
+OCCUPYING_STATUSES = ["new", "confirmed", "completed", "no_show"]
+BOOKING_FIELDS = ["doctor_id", "date_time", "status", "created_at"]
+
+def _to_minutes(values: pd.Series) -> np.ndarray:
+    """"HH:MM" strings to minutes after midnight; NaN where missing"""
+    parts = values.astype("string").str.extract(r"^(\d{1,2}):(\d{2})").astype(float)
+    return (parts[0] * 60 + parts[1]).to_numpy()
+
+# ==================== Frame builders ====================
+def schedules_frame(schedules: Iterable[dict]) -> pd.DataFrame:
+    frame = pd.DataFrame(
+        list(schedules), columns=["doctor_id", "day_of_week", "start_time", "end_time", "slot_minutes", "active"]
+    )
+    frame = frame[frame["active"].fillna(True).astype(bool)]
+    # get_available_slots uses the first matching schedule for a weekday
+    frame = frame.drop_duplicates(["doctor_id", "day_of_week"])
+    return pd.DataFrame({
+        "doctor_id": frame["doctor_id"].to_numpy(),
+        "day_of_week": frame["day_of_week"].astype(int).to_numpy(),
+        "start_min": _to_minutes(frame["start_time"]),
+        "end_min": _to_minutes(frame["end_time"]),
+        "slot_minutes": frame["slot_minutes"].fillna(15).astype(int).to_numpy(),
+    })
+
+def exceptions_frame(exceptions: Iterable[dict]) -> pd.DataFrame:
+    frame = pd.DataFrame(
+        list(exceptions),
+        columns=["doctor_id", "date", "is_available", "custom_start_time", "custom_end_time"],
+    ).drop_duplicates(["doctor_id", "date"])
+    return pd.DataFrame({
+        "doctor_id": frame["doctor_id"].to_numpy(),
+        "date": pd.to_datetime(frame["date"], format="%Y-%m-%d", errors="coerce").to_numpy(),
+        "is_available": frame["is_available"].fillna(False).astype(bool).to_numpy(),
+        "custom_start_min": _to_minutes(frame["custom_start_time"]),
+        "custom_end_min": _to_minutes(frame["custom_end_time"]),
+    })
+
+def bookings_frame(columns: Dict[str, list]) -> pd.DataFrame:
+    """Build the bookings frame from column lists (see ``load_bookings``)"""
+    return pd.DataFrame({
+        "doctor_id": pd.Series(columns["doctor_id"], dtype="object"),
+        "date_time": pd.to_datetime(
+            pd.Series(columns["date_time"], dtype="object"), format="%Y-%m-%d %H:%M", errors="coerce"
+        ),
+        "status": pd.Categorical(columns["status"], categories=STATUSES),
+        "created_at": pd.to_datetime(pd.Series(columns["created_at"], dtype="object"), errors="coerce"),
+    })
+
+# ==================== Computations ====================
+def schedule_capacity(schedules: pd.DataFrame, exceptions: pd.DataFrame, start: datetime, end: datetime) -> pd.DataFrame:
+    """Bookable slots per (doctor, day) for days in [start, end)"""
+    days = pd.DataFrame({"date": pd.date_range(start, end, freq="D", inclusive="left")})
+    days["day_of_week"] = days["date"].dt.weekday
+    grid = days.merge(schedules, on="day_of_week")
+    grid = grid.merge(exceptions, on=["doctor_id", "date"], how="left")
+
+    has_exception = grid["is_available"].notna().to_numpy()
+    available = ~has_exception | grid["is_available"].fillna(False).astype(bool).to_numpy()
+    start_min = np.where(np.isnan(grid["custom_start_min"]), grid["start_min"], grid["custom_start_min"])
+    end_min = np.where(np.isnan(grid["custom_end_min"]), grid["end_min"], grid["custom_end_min"])
+    # Slots start every slot_minutes while before the end time
+    slots = np.ceil(np.maximum(end_min - start_min, 0) / grid["slot_minutes"].to_numpy())
+    slots = np.where(available & ~np.isnan(slots), slots, 0).astype(np.int64)
+    return pd.DataFrame({"doctor_id": grid["doctor_id"], "date": grid["date"], "slots": slots})
+
+def compute_utilization(capacity: pd.DataFrame, bookings: pd.DataFrame) -> pd.DataFrame:
+    """Per-doctor capacity, status counts, utilization, no-show rate and lead time"""
+    slots = capacity.groupby("doctor_id")["slots"].sum().rename("capacity_slots")
+    counts = pd.crosstab(bookings["doctor_id"], bookings["status"], dropna=False).reindex(columns=STATUSES, fill_value=0)
+    report = pd.concat([slots, counts], axis=1).fillna(0).astype(np.int64)
+    report.index.name = "doctor_id"
+
+    booked = report[OCCUPYING_STATUSES].sum(axis=1)
+    attended = report["completed"] + report["no_show"]
+    report["booked_slots"] = booked
+    report["utilization"] = (booked / report["capacity_slots"].where(report["capacity_slots"] > 0)).round(4)
+    report["no_show_rate"] = (report["no_show"] / attended.where(attended > 0)).round(4)
+
+    lead = bookings[["doctor_id"]].assign(
+        hours=(bookings["date_time"] - bookings["created_at"]).dt.total_seconds() / 3600
+    ).dropna()
+    lead = lead[lead["hours"] >= 0]
+    quantiles = lead.groupby("doctor_id")["hours"].quantile([0.5, 0.9]).unstack()
+    if quantiles.empty:
+        quantiles = pd.DataFrame(columns=[0.5, 0.9])
+    report["lead_time_hours_median"] = quantiles[0.5].reindex(report.index).round(1)
+    report["lead_time_hours_p90"] = quantiles[0.9].reindex(report.index).round(1)
+    return report.reset_index().sort_values("utilization", ascending=False, na_position="last")
+
+def compute_heatmap(bookings: pd.DataFrame) -> np.ndarray:
+    """7x24 counts of slot-occupying bookings by weekday (Mon=0) and hour"""
+    occupied = bookings[bookings["status"].isin(OCCUPYING_STATUSES) & bookings["date_time"].notna()]
+    cells = occupied["date_time"].dt.weekday.to_numpy() * 24 + occupied["date_time"].dt.hour.to_numpy()
+    return np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+
+# ==================== Loading ====================
+async def load_bookings(start: datetime, end: datetime, doctor_id: Optional[str] = None) -> pd.DataFrame:
+    """Appointment timestamps for [start, end) from both storage tiers"""
+    query = {"date_time": {"$gte": start.strftime("%Y-%m-%d"), "$lt": end.strftime("%Y-%m-%d")}}
+    if doctor_id:
+        query["doctor_id"] = doctor_id
+    projection = {"_id": 0, **{field: 1 for field in BOOKING_FIELDS}}
+    tiers = [appointments_reporting_collection]
+    if may_be_archived(start.strftime("%Y-%m-%d")):
+        tiers.append(appointments_archive_reporting_collection)
+
+    columns: Dict[str, list] = {field: [] for field in BOOKING_FIELDS}
+    seen = set()
+    for tier in tiers:
+        async for doc in tier.find(query, {**projection, "id": 1}, batch_size=10000):
+            if len(tiers) > 1:
+                # A booking caught mid-archive is counted once
+                if doc.get("id") in seen:
+                    continue
+                seen.add(doc.get("id"))
+            for field in BOOKING_FIELDS:
+                columns[field].append(doc.get(field))
+    return bookings_frame(columns)
+
+async def _load_window(start: datetime, end: datetime, doctor_id: Optional[str]):
+    doctor_query = {"doctor_id": doctor_id} if doctor_id else {}
+    schedules, exceptions, bookings = await asyncio.gather(
+        schedules_reporting_collection.find({**doctor_query, "active": True}, {"_id": 0}).to_list(None),
+        schedule_exceptions_reporting_collection.find({
+            **doctor_query,
+            "date": {"$gte": start.strftime("%Y-%m-%d"), "$lt": end.strftime("%Y-%m-%d")},
+        }, {"_id": 0}).to_list(None),
+        load_bookings(start, end, doctor_id),
+    )
+    return schedules_frame(schedules), exceptions_frame(exceptions), bookings
+
+def _records(frame: pd.DataFrame) -> List[dict]:
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+async def utilization_report(start: datetime, end: datetime, doctor_id: Optional[str] = None) -> dict:
+    schedules, exceptions, bookings = await _load_window(start, end, doctor_id)
+    doctor_names = {
+        d["id"]: d["name"]
+        for d in await doctors_reporting_collection.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    }
+
+    def compute():
+        capacity = schedule_capacity(schedules, exceptions, start, end)
+        report = compute_utilization(capacity, bookings)
+        if doctor_id:
+            report = report[report["doctor_id"] == doctor_id]
+        report.insert(1, "doctor_name", report["doctor_id"].map(doctor_names))
+        return report
+
+    # pandas work is CPU-bound; keep it off the event loop
+    report = await asyncio.to_thread(compute)
+    capacity_total = int(report["capacity_slots"].sum())
+    booked_total = int(report["booked_slots"].sum())
+    attended_total = int(report["completed"].sum() + report["no_show"].sum())
+    return {
+        "start_date": start.strftime("%Y-%m-%d"),
+        "end_date": (end - timedelta(days=1)).strftime("%Y-%m-%d"),
+        "totals": {
+            "capacity_slots": capacity_total,
+            "booked_slots": booked_total,
+            "utilization": round(booked_total / capacity_total, 4) if capacity_total else None,
+            "no_show_rate": round(int(report["no_show"].sum()) / attended_total, 4) if attended_total else None,
+        },
+        "doctors": _records(report),
+    }
+
+async def heatmap_report(start: datetime, end: datetime, doctor_id: Optional[str] = None) -> dict:
+    bookings = await load_bookings(start, end, doctor_id)
+    counts = await asyncio.to_thread(compute_heatmap, bookings)
+    return {
+        "start_date": start.strftime("%Y-%m-%d"),
+        "end_date": (end - timedelta(days=1)).strftime("%Y-%m-%d"),
+        "days": ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
+        "hours": list(range(24)),
+        "counts": counts.tolist(),
+    }
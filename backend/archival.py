@@ -0,0 +1,120 @@
+"""Hot/cold tiering for historical bookings.
+
+Completed, cancelled and no-show bookings older than ARCHIVE_AFTER_DAYS
+are moved in batches from ``appointments`` and ``diagnostic_bookings``
+into ``*_archive`` collections (created with a stronger block compressor).
+The booking path and dashboards only ever touch the hot collections, so
+their indexes stay small enough to remain in RAM; exports and patient
+history read both tiers via ``find_across``.
+
+Each batch is copied before it is deleted, so an interrupted run leaves
+at worst a document in both tiers; readers prefer the hot copy and the
+next run finishes the move.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+from database import (
+    appointments_collection, diagnostic_bookings_collection,
+    appointments_archive_collection, diagnostic_bookings_archive_collection
+)
+from metrics import registry
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_BATCH_PAUSE_SECONDS = float(os.environ.get("ARCHIVE_BATCH_PAUSE_SECONDS", "0.2"))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get("ARCHIVE_INTERVAL_HOURS", "24"))  # 0 disables the loop
+
+# Statuses that no longer change; new and confirmed bookings always stay hot
+ARCHIVED_STATUSES = ["completed", "cancelled", "no_show"]
+
+# (kind, hot collection, cold collection)
+TIERS = [
+    ("appointments", appointments_collection, appointments_archive_collection),
+    ("diagnostic_bookings", diagnostic_bookings_collection, diagnostic_bookings_archive_collection),
+]
+
+def archive_cutoff(now: Optional[datetime] = None) -> str:
+    """date_time prefix before which finished bookings may live in the archive"""
+    return ((now or datetime.utcnow()) - timedelta(days=ARCHIVE_AFTER_DAYS)).strftime("%Y-%m-%d")
+
+def may_be_archived(start_date: Optional[str]) -> bool:
+    """False when a date range starts after everything the archive can hold"""
+    return not start_date or start_date < archive_cutoff()
+
+async def archive_collection(kind, hot, cold, cutoff: str, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move finished bookings dated before ``cutoff`` from ``hot`` to ``cold``"""
+    query = {"status": {"$in": ARCHIVED_STATUSES}, "date_time": {"$lt": cutoff}}
+    moved = 0
+    while True:
+        batch = await hot.find(query).sort("date_time", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        try:
+            await cold.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Documents copied by an interrupted earlier run are already there
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        result = await hot.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}, **query})
+        moved += result.deleted_count
+        registry.inc(
+            "archived_bookings_total", "Bookings moved to the archive tier",
+            ("collection",), (kind,), result.deleted_count,
+        )
+        if len(batch) < batch_size:
+            break
+        # Leave room for booking traffic between batches
+        await asyncio.sleep(ARCHIVE_BATCH_PAUSE_SECONDS)
+    return moved
+
+async def run_archival() -> Dict[str, object]:
+    cutoff = archive_cutoff()
+    moved = {}
+    for kind, hot, cold in TIERS:
+        moved[kind] = await archive_collection(kind, hot, cold, cutoff)
+    print(f"Archived bookings before {cutoff}: {moved}")
+    return {"cutoff": cutoff, "moved": moved}
+
+async def run_archive_loop(interval_hours: Optional[float] = None):
+    """Background task started by the app lifespan"""
+    interval = (interval_hours or ARCHIVE_INTERVAL_HOURS) * 3600
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_archival()
+        except Exception as e:
+            print(f"Error archiving bookings: {e}")
+
+async def find_across(
+    hot,
+    cold,
+    query: dict,
+    sort: List[tuple],
+    limit: int,
+    include_cold: bool = True,
+    pipeline_tail: Optional[list] = None,
+) -> List[dict]:
+    """Query both tiers and merge them in ``sort`` order.
+
+    ``sort`` must be on plain fields (e.g. date_time, id). A document present
+    in both tiers (an interrupted move) is returned once, from the hot tier.
+    """
+    pipeline = [{"$match": query}, {"$sort": dict(sort)}, {"$limit": limit}, *(pipeline_tail or [])]
+    tiers = [hot, cold] if include_cold else [hot]
+    results = await asyncio.gather(*(
+        tier.aggregate(pipeline, batchSize=min(limit, 5000)).to_list(limit) for tier in tiers
+    ))
+    merged = {}
+    for docs in results:
+        for doc in docs:
+            doc.pop("_id", None)
+            merged.setdefault(doc["id"], doc)
+    rows = list(merged.values())
+    for field, direction in reversed(sort):
+        rows.sort(key=lambda doc: doc.get(field) or "", reverse=direction < 0)
+    return rows[:limit]
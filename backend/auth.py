@@ -12,6 +12,9 @@ load_dotenv()
 SECRET_KEY = os.environ.get("JWT_SECRET", "your-secret-key")
 ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+# Live feed tokens travel in the EventSource URL, so they only open the feed and expire fast
+STREAM_TOKEN_AUDIENCE = "live"
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.environ.get("STREAM_TOKEN_EXPIRE_SECONDS", "60"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
@@ -39,6 +42,22 @@ def decode_token(token: str):
     except JWTError:
         return None
 
+def create_stream_token(user: dict) -> str:
+    """Token for opening the live feed; decode_token rejects it because of its audience"""
+    return create_access_token(
+        {"sub": user["sub"], "aud": STREAM_TOKEN_AUDIENCE},
+        timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS),
+    )
+
+def decode_stream_token(token: str):
+    try:
+        return jwt.decode(
+            token, SECRET_KEY, algorithms=[ALGORITHM], audience=STREAM_TOKEN_AUDIENCE,
+            options={"require_aud": True},
+        )
+    except JWTError:
+        return None
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     payload = decode_token(token)
@@ -0,0 +1,152 @@
+"""Benchmark of the vectorized utilization analytics.
+
+Generates a year of schedules, leave days and appointments for 200
+doctors in memory (no Mongo needed), then times the pandas pipeline in
+analytics.py against the per-doctor, per-day slot loop that
+get_available_slots performs, and checks both agree on total capacity.
+
+    python benchmarks/analytics_benchmark.py --doctors 200 --days 365
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from analytics import (  # noqa: E402
+    bookings_frame, compute_heatmap, compute_utilization, exceptions_frame, schedule_capacity,
+    schedules_frame, BOOKING_FIELDS
+)
+from fixtures import (  # noqa: E402
+    generate_appointments, generate_doctors, generate_schedules, generate_specialties
+)
+
+def generate_exceptions(doctors, start, days, rate, rng):
+    """Leave days plus a few shortened sessions"""
+    exceptions = []
+    for doctor in doctors:
+        for offset in range(days):
+            if rng.random() >= rate:
+                continue
+            date = (start + timedelta(days=offset)).strftime("%Y-%m-%d")
+            shortened = rng.random() < 0.3
+            exceptions.append({
+                "doctor_id": doctor["id"],
+                "date": date,
+                "is_available": shortened,
+                "custom_start_time": "10:00" if shortened else None,
+                "custom_end_time": "12:00" if shortened else None,
+            })
+    return exceptions
+
+def loop_capacity(schedules, exceptions, start, days):
+    """Slot counting the way get_available_slots does it, one doctor-day at a time"""
+    schedule_map = {}
+    for s in schedules:
+        if s.get("active", True):
+            schedule_map.setdefault((s["doctor_id"], s["day_of_week"]), s)
+    exception_map = {}
+    for e in exceptions:
+        exception_map.setdefault((e["doctor_id"], e["date"]), e)
+    doctor_ids = {s["doctor_id"] for s in schedules}
+
+    total = 0
+    for doctor_id in doctor_ids:
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            date = day.strftime("%Y-%m-%d")
+            exception = exception_map.get((doctor_id, date))
+            if exception and not exception.get("is_available", False):
+                continue
+            schedule = schedule_map.get((doctor_id, day.weekday()))
+            if not schedule:
+                continue
+            start_time = (exception.get("custom_start_time") if exception else None) or schedule["start_time"]
+            end_time = (exception.get("custom_end_time") if exception else None) or schedule["end_time"]
+            current = datetime.strptime(f"{date} {start_time}", "%Y-%m-%d %H:%M")
+            end = datetime.strptime(f"{date} {end_time}", "%Y-%m-%d %H:%M")
+            slots = []
+            while current < end:
+                slots.append(current.strftime("%Y-%m-%d %H:%M"))
+                current += timedelta(minutes=schedule.get("slot_minutes", 15))
+            total += len(slots)
+    return total
+
+def timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, round(best * 1000, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Utilization analytics benchmark")
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--appointments", type=int, default=500000)
+    parser.add_argument("--exception-rate", type=float, default=0.03, help="Share of doctor-days with an exception")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-loop", action="store_true", help="Do not time the Python slot loop")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = (datetime.utcnow() - timedelta(days=args.days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = start + timedelta(days=args.days)
+
+    started = time.perf_counter()
+    doctors = generate_doctors(args.doctors, generate_specialties(8), rng)
+    schedules = generate_schedules(doctors, rng)
+    exceptions = generate_exceptions(doctors, start, args.days, args.exception_rate, rng)
+    columns = {field: [] for field in BOOKING_FIELDS}
+    for doc in generate_appointments(args.appointments, doctors, schedules, start, args.days, rng):
+        for field in BOOKING_FIELDS:
+            columns[field].append(doc[field])
+    print(f"Generated {args.appointments} appointments in {time.perf_counter() - started:.1f}s")
+
+    timings = {}
+    (schedule_df, exception_df, bookings), timings["build_frames_ms"] = timed(
+        lambda: (schedules_frame(schedules), exceptions_frame(exceptions), bookings_frame(columns)), args.repeat
+    )
+    capacity, timings["capacity_ms"] = timed(
+        lambda: schedule_capacity(schedule_df, exception_df, start, end), args.repeat
+    )
+    report, timings["utilization_ms"] = timed(lambda: compute_utilization(capacity, bookings), args.repeat)
+    _, timings["heatmap_ms"] = timed(lambda: compute_heatmap(bookings), args.repeat)
+
+    result = {
+        "doctors": args.doctors,
+        "days": args.days,
+        "appointments": args.appointments,
+        "exceptions": len(exceptions),
+        "capacity_slots": int(capacity["slots"].sum()),
+        "doctor_days": len(capacity),
+        "vectorized": timings,
+        "vectorized_total_ms": round(sum(timings.values()), 1),
+        "overall_utilization": round(int(report["booked_slots"].sum()) / int(report["capacity_slots"].sum()), 4),
+    }
+    if not args.skip_loop:
+        loop_total, result["loop_capacity_ms"] = timed(
+            lambda: loop_capacity(schedules, exceptions, start, args.days), 1
+        )
+        result["capacity_matches_loop"] = loop_total == result["capacity_slots"]
+        result["capacity_speedup"] = round(result["loop_capacity_ms"] / max(timings["capacity_ms"], 0.1), 1)
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0 if result.get("capacity_matches_loop", True) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Reproducible benchmark of the hot API routes with regression gates.
+
+Drives a fixed, seeded request mix at a fixed concurrency against the app
+and records throughput, p50/p95/p99 latency and DB ops per request for
+each route. With --baseline the results are compared to a stored run and
+the script exits non-zero on regression; --update-baseline rewrites it.
+
+    python benchmarks/api_benchmark.py --appointments 500000 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from harness import (
+    add_common_arguments, db_ops_by_route, db_ops_delta, login, running_server,
+    seed_database, summarize
+)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# (name, method, route template, weight)
+REQUEST_MIX = [
+    ("available_slots", "GET", "/api/available-slots/{doctor_id}", 35),
+    ("doctors", "GET", "/api/doctors", 20),
+    ("blog_post", "GET", "/api/blog/{slug}", 15),
+    ("create_appointment", "POST", "/api/appointments", 15),
+    ("dashboard", "GET", "/api/analytics/dashboard", 10),
+    ("export_appointments", "GET", "/api/export/appointments", 5),
+]
+
+class RequestFactory:
+    """Builds deterministic requests for each entry in REQUEST_MIX"""
+
+    def __init__(self, rng, doctors, slugs, auth_headers):
+        self.rng = rng
+        self.doctors = doctors
+        self.slugs = slugs
+        self.auth_headers = auth_headers
+        self.booking_counter = 0
+        self.today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def build(self, name):
+        rng = self.rng
+        if name == "available_slots":
+            date = (self.today + timedelta(days=rng.randrange(30))).strftime("%Y-%m-%d")
+            return "GET", f"/api/available-slots/{rng.choice(self.doctors)}", {"params": {"date": date}}
+        if name == "doctors":
+            return "GET", "/api/doctors", {}
+        if name == "blog_post":
+            return "GET", f"/api/blog/{rng.choice(self.slugs)}", {}
+        if name == "create_appointment":
+            # Far-future unique slots so bookings never collide between runs
+            self.booking_counter += 1
+            slot = datetime(2090, 1, 1) + timedelta(minutes=15 * (self.booking_counter + rng.randrange(10 ** 7)))
+            return "POST", "/api/appointments", {"json": {
+                "doctor_id": rng.choice(self.doctors),
+                "date_time": slot.strftime("%Y-%m-%d %H:%M"),
+                "patient_name": "Benchmark Patient",
+                "patient_phone": f"+92-300-{rng.randrange(10 ** 7):07d}",
+            }}
+        if name == "dashboard":
+            return "GET", "/api/analytics/dashboard", {"headers": self.auth_headers}
+        if name == "export_appointments":
+            start = self.today - timedelta(days=rng.randrange(7, 180))
+            return "GET", "/api/export/appointments", {
+                "headers": self.auth_headers,
+                "params": {
+                    "start_date": start.strftime("%Y-%m-%d"),
+                    "end_date": (start + timedelta(days=7)).strftime("%Y-%m-%d"),
+                },
+            }
+        raise ValueError(name)
+
+async def run_mix(base_url, args):
+    rng = random.Random(args.seed)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        auth_headers = await login(client)
+        doctors = [d["id"] for d in (await client.get("/api/doctors")).json()]
+        slugs = [p["slug"] for p in (await client.get("/api/blog", params={"limit": 100})).json()]
+        factory = RequestFactory(rng, doctors, slugs, auth_headers)
+
+        names = [m[0] for m in REQUEST_MIX]
+        weights = [m[3] for m in REQUEST_MIX]
+        plan = [factory.build(name) + (name,) for name in rng.choices(names, weights=weights, k=args.requests)]
+
+        # Warm-up pass, excluded from the results
+        for method, url, kwargs, _ in plan[:args.warmup]:
+            await client.request(method, url, **kwargs)
+
+        latencies = {name: [] for name in names}
+        errors = {name: 0 for name in names}
+        queue = iter(plan[args.warmup:])
+
+        async def worker():
+            for method, url, kwargs, name in queue:
+                started = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                latencies[name].append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors[name] += 1
+
+        ops_before = await db_ops_by_route(client)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        db_ops = db_ops_delta(ops_before, await db_ops_by_route(client))
+
+    routes = {}
+    for name, method, template, _ in REQUEST_MIX:
+        routes[name] = summarize(latencies[name], errors[name], elapsed)
+        routes[name]["db_ops_per_request"] = round(db_ops.get(f"{method} {template}", 0.0), 2)
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "overall": summarize(all_latencies, sum(errors.values()), elapsed),
+        "routes": routes,
+    }
+
+def compare(results, baseline, threshold):
+    """Return a list of regressions beyond ``threshold`` (a fraction)"""
+    regressions = []
+    for name, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(name)
+        if not previous or not current["requests"]:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if previous[metric] and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {previous[metric]} -> {current[metric]}")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name} throughput_rps: {previous['throughput_rps']} -> {current['throughput_rps']}")
+        # Any extra round trip per request is a regression regardless of timing noise
+        if current["db_ops_per_request"] > previous.get("db_ops_per_request", 0) + 0.5:
+            regressions.append(
+                f"{name} db_ops_per_request: {previous.get('db_ops_per_request')} -> {current['db_ops_per_request']}"
+            )
+        if current["errors"] > previous.get("errors", 0):
+            regressions.append(f"{name} errors: {previous.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+async def main(args):
+    await seed_database(args)
+    async with running_server(args, workers=args.workers) as base_url:
+        results = await run_mix(base_url, args)
+
+    results["config"] = {
+        "appointments": args.appointments,
+        "diagnostic_bookings": args.diagnostic_bookings,
+        "doctors": args.doctors,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "recorded_at": datetime.utcnow().isoformat(),
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the hot API routes")
+    add_common_arguments(parser)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Uvicorn workers; keep at 1 so /api/metrics covers all requests")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed regression, e.g. 0.2 = 20%%")
+    parser.add_argument("--output", help="Also write results to this file")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,173 @@
+"""Shared helpers for the API benchmark and load-test scripts.
+
+Starts the FastAPI app from server.py under uvicorn against a dedicated
+benchmark database, seeds it with fixtures.py at a configurable scale and
+reads per-route DB round trips back from /api/metrics.
+"""
+import asyncio
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DEFAULT_DATABASE = "sadiqabad_medical_bench"
+# Every benchmark client books from 127.0.0.1 and reuses fixture phone
+# numbers, so the production rate limits would turn most bookings into 429s
+BENCHMARK_ENV = {
+    "RATE_LIMIT_IP_PER_MINUTE": "1000000",
+    "RATE_LIMIT_IP_BURST": "1000000",
+    "RATE_LIMIT_PHONE_PER_HOUR": "1000000",
+    "RATE_LIMIT_PHONE_BURST": "1000000",
+}
+
+def add_common_arguments(parser):
+    parser.add_argument("--mongo-url", default=DEFAULT_MONGO_URL)
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument("--appointments", type=int, default=200000, help="Seeded appointments")
+    parser.add_argument("--diagnostic-bookings", type=int, default=50000)
+    parser.add_argument("--blog-posts", type=int, default=200)
+    parser.add_argument("--contact-messages", type=int, default=10000)
+    parser.add_argument("--doctors", type=int, default=40, help="Extra synthetic doctors")
+    parser.add_argument("--reseed", action="store_true", help="Drop and reseed the benchmark database")
+    parser.add_argument("--seed", type=int, default=42)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def seed_database(args):
+    """Seed the benchmark database once; reuse it across runs unless --reseed.
+
+    Runs before ``running_server``: the drop removes indexes and the admin
+    user, so init_db and seed_initial_data are re-run here, like fixtures.py.
+    """
+    import database
+    from fixtures import load_fixtures
+    from server import seed_initial_data
+
+    database.MONGO_URL = args.mongo_url
+    database.DATABASE_NAME = args.database
+    db = database.connect()
+    try:
+        if args.reseed:
+            await database.client.drop_database(args.database)
+        await database.init_db()
+        await seed_initial_data()
+        existing = await db["appointments"].estimated_document_count()
+        if existing >= args.appointments:
+            print(f"Reusing {args.database} with {existing} appointments")
+            return
+        started = time.perf_counter()
+        counts = await load_fixtures(
+            db,
+            appointments=args.appointments - existing,
+            diagnostic_bookings=args.diagnostic_bookings,
+            blog_posts=args.blog_posts,
+            contact_messages=args.contact_messages,
+            doctors=args.doctors,
+            seed=args.seed,
+        )
+        print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s")
+    finally:
+        database.close()
+
+@asynccontextmanager
+async def running_server(args, workers=1, env=None):
+    """Run ``uvicorn server:app`` and yield its base URL once healthy"""
+    port = free_port()
+    server_env = dict(os.environ)
+    server_env.update({"MONGO_URL": args.mongo_url, "DATABASE_NAME": args.database})
+    server_env.update(BENCHMARK_ENV)
+    server_env.update(env or {})
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "server:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=BACKEND_DIR,
+        env=server_env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            for _ in range(300):
+                if process.poll() is not None:
+                    raise RuntimeError("Server exited during startup")
+                try:
+                    if (await client.get("/api/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("Server did not become healthy")
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+async def login(client: httpx.AsyncClient, username="admin", password="admin123"):
+    response = await client.post("/api/auth/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+METRIC_LINE = re.compile(r'^(\w+)\{method="([^"]*)",route="([^"]*)"\} (\S+)$')
+
+async def db_ops_by_route(client: httpx.AsyncClient) -> Dict[str, Dict[str, float]]:
+    """Read cumulative DB ops and request counts per route from /api/metrics"""
+    text = (await client.get("/api/metrics")).text
+    totals: Dict[str, Dict[str, float]] = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, method, route, value = match.groups()
+        if name in ("http_request_db_operations_sum", "http_request_db_operations_count"):
+            key = f"{method} {route}"
+            field = "ops" if name.endswith("_sum") else "requests"
+            totals.setdefault(key, {"ops": 0.0, "requests": 0.0})[field] = float(value)
+    return totals
+
+def db_ops_delta(before, after):
+    result = {}
+    for key, values in after.items():
+        prior = before.get(key, {"ops": 0.0, "requests": 0.0})
+        requests = values["requests"] - prior["requests"]
+        if requests > 0:
+            result[key] = (values["ops"] - prior["ops"]) / requests
+    return result
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))) - 1)
+    return sorted_values[rank]
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
@@ -0,0 +1,226 @@
+"""Booking-day load-test scenarios.
+
+Replays our real traffic shape against the existing endpoints with an
+open (arrival-rate) model, so queueing inside the server shows up as
+latency instead of being hidden by a fixed pool of clients:
+
+* patients browsing doctors, a doctor's profile and their free slots
+* a booking burst when a popular specialist opens a new day
+* reception screens polling /api/appointments and the dashboard
+
+``scenario`` runs the ramp-up / steady / spike / recovery profile once.
+``saturation`` steps the arrival rate up for each worker count and
+reports the highest rate that still meets the latency and error SLO.
+
+    python benchmarks/load_test.py scenario --workers 2
+    python benchmarks/load_test.py saturation --workers 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from harness import add_common_arguments, login, running_server, seed_database, summarize
+
+# Share of arrivals per user journey
+BROWSE_MIX = {"browse": 80, "book": 8, "reception": 12}
+BURST_MIX = {"browse": 35, "burst_book": 55, "reception": 10}
+
+# (name, duration seconds, start rate, end rate, mix); rates scale with --base-rate
+BOOKING_DAY_PROFILE = [
+    ("ramp_up", 30, 0.1, 1.0, BROWSE_MIX),
+    ("steady", 60, 1.0, 1.0, BROWSE_MIX),
+    ("spike", 15, 5.0, 5.0, BURST_MIX),
+    ("recovery", 30, 1.0, 1.0, BROWSE_MIX),
+]
+
+class Journeys:
+    """The request sequences each simulated user performs"""
+
+    def __init__(self, client, rng, doctors, auth_headers):
+        self.client = client
+        self.rng = rng
+        self.doctors = doctors
+        self.popular_doctor = doctors[0]
+        self.auth_headers = auth_headers
+        self.today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        # The day a popular specialist "opens"; far enough ahead to be empty
+        self.burst_date = (self.today + timedelta(days=60)).strftime("%Y-%m-%d")
+
+    async def browse(self):
+        doctor_id = self.rng.choice(self.doctors)
+        date = (self.today + timedelta(days=self.rng.randrange(14))).strftime("%Y-%m-%d")
+        await self._get("/api/doctors")
+        await self._get(f"/api/doctors/{doctor_id}")
+        await self._get(f"/api/available-slots/{doctor_id}", params={"date": date})
+
+    async def book(self):
+        doctor_id = self.rng.choice(self.doctors)
+        date = (self.today + timedelta(days=self.rng.randrange(1, 14))).strftime("%Y-%m-%d")
+        await self._book(doctor_id, date)
+
+    async def burst_book(self):
+        await self._book(self.popular_doctor, self.burst_date)
+
+    async def reception(self):
+        today = self.today.strftime("%Y-%m-%d")
+        await self._get("/api/appointments", params={"date": today}, headers=self.auth_headers)
+        await self._get("/api/analytics/dashboard", headers=self.auth_headers)
+
+    async def _book(self, doctor_id, date):
+        slots = (await self._get(f"/api/available-slots/{doctor_id}", params={"date": date})).json()
+        free = slots.get("slots", [])
+        if not free:
+            return
+        # Patients race for the earliest slots, like a real opening
+        slot = free[min(int(self.rng.expovariate(0.3)), len(free) - 1)]
+        response = await self.client.post("/api/appointments", json={
+            "doctor_id": doctor_id,
+            "date_time": slot["datetime"],
+            "patient_name": "Load Test Patient",
+            "patient_phone": f"+92-300-{self.rng.randrange(10 ** 7):07d}",
+        })
+        # Losing a race for a slot is expected behaviour, not a server error
+        if response.status_code >= 500 or response.status_code == 429:
+            response.raise_for_status()
+
+    async def _get(self, url, **kwargs):
+        response = await self.client.get(url, **kwargs)
+        if response.status_code >= 500 or response.status_code == 429:
+            response.raise_for_status()
+        return response
+
+async def run_phase(journeys, rng, duration, start_rate, end_rate, mix, max_in_flight):
+    """Fire journeys at a (linearly changing) arrival rate for ``duration``"""
+    names = list(mix)
+    weights = list(mix.values())
+    latencies = []
+    errors = 0
+    dropped = 0
+    in_flight = set()
+
+    async def fire(name):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            await getattr(journeys, name)()
+            latencies.append(time.perf_counter() - started)
+        except (httpx.HTTPError, ValueError):
+            errors += 1
+
+    phase_start = time.perf_counter()
+    next_arrival = phase_start
+    while True:
+        now = time.perf_counter()
+        elapsed = now - phase_start
+        if elapsed >= duration:
+            break
+        rate = start_rate + (end_rate - start_rate) * (elapsed / duration)
+        if now < next_arrival:
+            await asyncio.sleep(min(next_arrival - now, 0.05))
+            continue
+        next_arrival += rng.expovariate(max(rate, 0.01))
+        if len(in_flight) >= max_in_flight:
+            dropped += 1
+            continue
+        task = asyncio.create_task(fire(rng.choices(names, weights=weights)[0]))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    summary = summarize(latencies, errors, time.perf_counter() - phase_start)
+    summary["dropped"] = dropped
+    summary["target_rps"] = round((start_rate + end_rate) / 2, 2)
+    return summary
+
+async def prepare(client, rng):
+    auth_headers = await login(client)
+    doctors = [d["id"] for d in (await client.get("/api/doctors")).json()]
+    if not doctors:
+        raise RuntimeError("No doctors in the benchmark database")
+    return Journeys(client, rng, doctors, auth_headers)
+
+async def scenario(args):
+    results = {}
+    rng = random.Random(args.seed)
+    await seed_database(args)
+    async with running_server(args, workers=args.workers[0]) as base_url:
+        limits = httpx.Limits(max_connections=args.max_in_flight)
+        async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+            journeys = await prepare(client, rng)
+            for name, duration, start, end, mix in BOOKING_DAY_PROFILE:
+                duration = duration * args.time_scale
+                results[name] = await run_phase(
+                    journeys, rng, duration, start * args.base_rate, end * args.base_rate, mix, args.max_in_flight
+                )
+                print(f"{name}: {json.dumps(results[name])}")
+    return {"profile": "booking_day", "workers": args.workers[0], "phases": results}
+
+def meets_slo(step, args):
+    total = step["requests"] + step["errors"] + step["dropped"]
+    return (
+        total > 0
+        and step["p95_ms"] <= args.slo_p95_ms
+        and (step["errors"] + step["dropped"]) / total <= args.slo_error_rate
+        and step["throughput_rps"] >= 0.9 * step["target_rps"]
+    )
+
+async def saturation(args):
+    report = {}
+    await seed_database(args)
+    for workers in args.workers:
+        rng = random.Random(args.seed)
+        steps = []
+        async with running_server(args, workers=workers) as base_url:
+            limits = httpx.Limits(max_connections=args.max_in_flight)
+            async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+                journeys = await prepare(client, rng)
+                rate = args.start_rate
+                while rate <= args.max_rate:
+                    step = await run_phase(journeys, rng, args.step_seconds, rate, rate, BROWSE_MIX, args.max_in_flight)
+                    step["ok"] = meets_slo(step, args)
+                    steps.append(step)
+                    print(f"workers={workers} rate={rate}: {json.dumps(step)}")
+                    if not step["ok"]:
+                        break
+                    rate += args.step_rate
+        passing = [s["target_rps"] for s in steps if s["ok"]]
+        report[str(workers)] = {
+            "saturation_rps": max(passing) if passing else 0.0,
+            "steps": steps,
+        }
+        print(f"workers={workers}: saturation at {report[str(workers)]['saturation_rps']} journeys/s")
+    return {"slo": {"p95_ms": args.slo_p95_ms, "error_rate": args.slo_error_rate}, "workers": report}
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking-day load tests")
+    parser.add_argument("mode", choices=["scenario", "saturation"])
+    add_common_arguments(parser)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="Uvicorn worker counts")
+    parser.add_argument("--base-rate", type=float, default=20.0, help="Steady journeys/s for the scenario")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiply phase durations")
+    parser.add_argument("--start-rate", type=float, default=10.0)
+    parser.add_argument("--step-rate", type=float, default=10.0)
+    parser.add_argument("--max-rate", type=float, default=1000.0)
+    parser.add_argument("--step-seconds", type=float, default=20.0)
+    parser.add_argument("--slo-p95-ms", type=float, default=500.0)
+    parser.add_argument("--slo-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    runner = scenario if args.mode == "scenario" else saturation
+    report = asyncio.run(runner(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
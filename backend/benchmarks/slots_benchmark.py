@@ -0,0 +1,103 @@
+"""Micro-benchmark of slot generation: datetime loop vs minute offsets.
+
+Builds a month of days for a doctor with a given session length, slot
+size and share of booked slots, then times the old per-slot
+``while current < end`` loop (strftime per slot, set filter) against
+slots.py (NumPy offsets, vectorized set difference, formatting at the
+end) and checks both return identical slots.
+
+    python benchmarks/slots_benchmark.py --days 31 --slot-minutes 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from slots import (  # noqa: E402
+    booked_offsets, bookings_by_date, day_window, format_slots, free_offsets, slot_offsets
+)
+
+def loop_slots(date, schedule, booked_times):
+    """The slot generation get_available_slots used before slots.py"""
+    slots = []
+    start = datetime.strptime(f"{date} {schedule['start_time']}", "%Y-%m-%d %H:%M")
+    end = datetime.strptime(f"{date} {schedule['end_time']}", "%Y-%m-%d %H:%M")
+    current = start
+    while current < end:
+        slot_time = current.strftime("%Y-%m-%d %H:%M")
+        slots.append({
+            "time": current.strftime("%H:%M"),
+            "datetime": slot_time
+        })
+        current += timedelta(minutes=schedule.get("slot_minutes", 15))
+    return [s for s in slots if s["datetime"] not in booked_times]
+
+def offset_slots(date, schedule, booked):
+    window, _ = day_window(schedule, None)
+    return format_slots(date, free_offsets(slot_offsets(*window), booked_offsets(booked)))
+
+def timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Slot generation micro-benchmark")
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--doctors", type=int, default=1, help="Repeat the month for this many doctors")
+    parser.add_argument("--start-time", default="08:00")
+    parser.add_argument("--end-time", default="20:00")
+    parser.add_argument("--slot-minutes", type=int, default=10)
+    parser.add_argument("--booked-share", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    schedule = {"start_time": args.start_time, "end_time": args.end_time, "slot_minutes": args.slot_minutes}
+    first_day = datetime(2025, 1, 1)
+    dates = [(first_day + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(args.days)]
+    window, _ = day_window(schedule, None)
+    booked = []
+    for date in dates:
+        for minute in slot_offsets(*window):
+            if rng.random() < args.booked_share:
+                booked.append(f"{date} {minute // 60:02d}:{minute % 60:02d}")
+
+    def run_loop():
+        booked_times = set(booked)
+        return [loop_slots(date, schedule, booked_times) for _ in range(args.doctors) for date in dates]
+
+    def run_offsets():
+        by_date = bookings_by_date(booked)
+        return [offset_slots(date, schedule, by_date.get(date, [])) for _ in range(args.doctors) for date in dates]
+
+    loop_result, loop_ms = timed(run_loop, args.repeat)
+    offset_result, offset_ms = timed(run_offsets, args.repeat)
+    result = {
+        "days": args.days,
+        "doctors": args.doctors,
+        "slots_per_day": len(slot_offsets(*window)),
+        "booked": len(booked),
+        "loop_ms": round(loop_ms, 2),
+        "offsets_ms": round(offset_ms, 2),
+        "speedup": round(loop_ms / max(offset_ms, 1e-6), 1),
+        "identical": loop_result == offset_result,
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["identical"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Single-flight coalescing for identical concurrent reads.
+
+When a popular schedule opens, hundreds of patients request the same
+doctor and slots within the same second. ``coalesce`` lets concurrent
+calls of a read handler with the same normalized arguments share one
+in-flight computation and its result instead of each querying Mongo.
+Nothing is cached: once the computation finishes the next call starts a
+fresh one.
+"""
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict
+
+from metrics import registry
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Any, asyncio.Future] = {}
+
+    async def do(self, key, fn: Callable[[], Awaitable], route: str = ""):
+        task = self._inflight.get(key)
+        if task is not None:
+            registry.inc(
+                "coalesced_requests_total", "Read requests by single-flight role",
+                ("route", "role"), (route, "follower"),
+            )
+        else:
+            registry.inc(
+                "coalesced_requests_total", "Read requests by single-flight role",
+                ("route", "role"), (route, "leader"),
+            )
+            # Run as its own task so a disconnecting leader does not cancel
+            # the computation the followers are waiting on
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+single_flight = SingleFlight()
+
+def coalesce(route: str):
+    """Decorator for read-only handlers whose result depends only on their arguments"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = (route, tuple(sorted(
+                (name, value) for name, value in kwargs.items() if value is not None
+            )))
+            return await single_flight.do(key, lambda: fn(*args, **kwargs), route=route)
+        return wrapper
+    return decorator
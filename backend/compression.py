@@ -0,0 +1,246 @@
+"""Response compression negotiated from Accept-Encoding.
+
+CompressionMiddleware compresses JSON, text and CSV bodies of at least
+COMPRESSION_MIN_BYTES with the accepted encoding of highest q-value, brotli
+winning ties over gzip, and marks them all ``Vary: Accept-Encoding``. It
+leaves alone responses that already carry a Content-Encoding (such as the
+precompressed snapshots), Server-Sent Events and binary formats.
+
+Public GET responses (no Authorization header) repeat the same bytes for
+every visitor, so their compressed form is kept in an LRU keyed by a
+BLAKE2 digest of the uncompressed body. A repeat payload then costs a hash
+instead of a recompression. Bodies larger than COMPRESSION_THREAD_MIN_BYTES
+are compressed in a worker thread so the event loop keeps serving.
+
+Metrics: compression_responses_total by encoding and outcome, the CPU
+seconds spent compressing, and bytes before and after, so the CPU cost can
+be weighed against bytes saved.
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+from metrics import registry
+
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_THREAD_MIN_BYTES = int(os.environ.get("COMPRESSION_THREAD_MIN_BYTES", str(256 * 1024)))
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get("COMPRESSION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+SKIPPED_TYPES = ("text/event-stream",)
+# Preferred first
+ENCODINGS = ("br", "gzip")
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Supported encoding with the highest q (> 0), ties going to ENCODINGS order, or None"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    ranked = [
+        (accepted.get(encoding, accepted.get("*", 0)), -preference, encoding)
+        for preference, encoding in enumerate(ENCODINGS)
+    ]
+    q, _, encoding = max(ranked)
+    return encoding if q > 0 else None
+
+def compress(body: bytes, encoding: str):
+    """(compressed bytes, CPU seconds); CPU is measured on the calling thread"""
+    started = time.thread_time()
+    if encoding == "br":
+        data = brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    else:
+        data = gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+    return data, time.thread_time() - started
+
+class CompressedCache:
+    """LRU of compressed bodies, bounded by total compressed size"""
+
+    def __init__(self, max_bytes: int = COMPRESSION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+    def get(self, key) -> Optional[bytes]:
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def put(self, key, data: bytes):
+        if len(data) > self.max_bytes // 4 or key in self._entries:
+            return
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+compressed_cache = CompressedCache()
+
+def _record(encoding: str, outcome: str, bytes_in: int = 0, bytes_out: int = 0, cpu: float = 0.0):
+    labels = (encoding,)
+    registry.inc(
+        "compression_responses_total", "Responses seen by the compression middleware",
+        ("encoding", "outcome"), (encoding, outcome),
+    )
+    if bytes_in:
+        registry.inc("compression_bytes_in_total", "Uncompressed bytes of compressed responses", ("encoding",), labels, bytes_in)
+        registry.inc("compression_bytes_out_total", "Bytes sent for compressed responses", ("encoding",), labels, bytes_out)
+        registry.inc("compression_bytes_saved_total", "Bytes saved by compression", ("encoding",), labels, bytes_in - bytes_out)
+    if cpu:
+        registry.inc("compression_cpu_seconds_total", "CPU time spent compressing responses", ("encoding",), labels, cpu)
+
+class _StreamCompressor:
+    """Incremental compressor for streamed bodies; each chunk is flushed so streams stay live"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._gzip = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes, last: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if last else self._brotli.flush())
+        out = self._gzip.compress(data)
+        return out + self._gzip.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    """ASGI middleware compressing eligible responses; see the module docstring"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES, cache: CompressedCache = compressed_cache):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get("accept-encoding", ""))
+        cacheable = scope["method"] == "GET" and "authorization" not in request_headers
+        responder = _Responder(send, encoding, self.minimum_size, self.cache if cacheable else None)
+        await self.app(scope, receive, responder.send)
+
+class _Responder:
+    def __init__(self, send, encoding: Optional[str], minimum_size: int, cache: Optional[CompressedCache]):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.start = None
+        self.mode = None  # "pass", "stream" or None until the first body message
+        self.stream = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu = 0.0
+
+    def _eligible(self, message) -> bool:
+        headers = Headers(raw=message.get("headers", []))
+        if message["status"] < 200 or message["status"] in (204, 304) or "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(SKIPPED_TYPES)
+
+    def _encoded_start(self, length: Optional[int]):
+        headers = MutableHeaders(raw=list(self.start.get("headers", [])))
+        headers["content-encoding"] = self.encoding
+        if length is None:
+            del headers["content-length"]
+        else:
+            headers["content-length"] = str(length)
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # The encoded representation is not byte-identical any more
+            headers["etag"] = f"W/{etag}"
+        return {**self.start, "headers": headers.raw}
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            if not self._eligible(message):
+                self.mode = "pass"
+                await self._send(message)
+                return
+            # Every compressible response varies, including identity ones, so
+            # shared caches never hand one encoding to a client of another
+            headers = MutableHeaders(raw=list(message.get("headers", [])))
+            varies = {v.strip().lower() for v in headers.get("vary", "").split(",")}
+            if not varies & {"accept-encoding", "*"}:
+                headers.add_vary_header("Accept-Encoding")
+            self.start = {**message, "headers": headers.raw}
+            if self.encoding is None:
+                self.mode = "pass"
+                await self._send(self.start)
+            return
+        if message["type"] != "http.response.body" or self.mode == "pass":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.mode is None and not more_body:
+            await self._send_whole(body)
+            return
+        if self.mode is None:
+            self.mode = "stream"
+            self.stream = _StreamCompressor(self.encoding)
+            await self._send(self._encoded_start(None))
+        started = time.thread_time()
+        data = self.stream.chunk(body, last=not more_body)
+        self.cpu += time.thread_time() - started
+        self.bytes_in += len(body)
+        self.bytes_out += len(data)
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+        if not more_body:
+            _record(self.encoding, "streamed", self.bytes_in, self.bytes_out, self.cpu)
+
+    async def _send_whole(self, body: bytes):
+        if len(body) < self.minimum_size:
+            _record(self.encoding, "below_threshold")
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        key = None
+        data = None
+        if self.cache is not None:
+            key = (self.encoding, hashlib.blake2b(body, digest_size=16).digest())
+            data = self.cache.get(key)
+        if data is not None:
+            _record(self.encoding, "cache_hit", len(body), len(data))
+        else:
+            if len(body) >= COMPRESSION_THREAD_MIN_BYTES:
+                data, cpu = await asyncio.to_thread(compress, body, self.encoding)
+            else:
+                data, cpu = compress(body, self.encoding)
+            if len(data) >= len(body):
+                _record(self.encoding, "incompressible", cpu=cpu)
+                await self._send(self.start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            if key is not None:
+                self.cache.put(key, data)
+            _record(self.encoding, "compressed", len(body), len(data), cpu)
+        await self._send(self._encoded_start(len(data)))
+        await self._send({"type": "http.response.body", "body": data})
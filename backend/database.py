@@ -1,36 +1,382 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, monitoring
+from pymongo.errors import CollectionInvalid, OperationFailure
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from metrics import command_metrics
+from models import normalize_phone
+from slow_queries import slow_query_log
 
 load_dotenv()
 
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-DATABASE_NAME = "sadiqabad_medical"
+DATABASE_NAME = os.environ.get("DATABASE_NAME", "sadiqabad_medical")
 
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DATABASE_NAME]
+# Connection pool tuning (per worker process)
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "")  # e.g. "zstd,snappy,zlib"
+MONGO_READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+# WiredTiger block compressor for the cold booking archive
+ARCHIVE_BLOCK_COMPRESSOR = os.environ.get("ARCHIVE_BLOCK_COMPRESSOR", "zstd")
+
+# Read routing: reporting and public catalog reads may be served by
+# secondaries; booking writes and slot checks always use the primary, even
+# when MONGO_READ_PREFERENCE relaxes the client-wide default.
+READ_ROUTES = {
+    "primary": "primary",
+    "reporting": os.environ.get("MONGO_READ_PREFERENCE_REPORTING", "secondaryPreferred"),
+    "catalog": os.environ.get("MONGO_READ_PREFERENCE_CATALOG", "secondaryPreferred"),
+}
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", "-1"))
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool listener tracking utilization and checkout wait times.
+
+    Motor runs pymongo operations on executor threads, so the start of a
+    checkout is kept in thread-local storage until the matching checked-out
+    or failed event arrives on the same thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_open = 0
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkout_timeouts = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+            self.pool_clears = 0
+
+    def _wait_elapsed(self):
+        started = getattr(self._local, "checkout_started", None)
+        self._local.checkout_started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open = max(0, self.connections_open - 1)
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        waited = self._wait_elapsed()
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_checked_out(self, event):
+        waited = self._wait_elapsed()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
+                "connections_open": self.connections_open,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "utilization": round(self.checked_out / MONGO_MAX_POOL_SIZE, 4) if MONGO_MAX_POOL_SIZE else 0,
+                "peak_utilization": round(self.max_checked_out / MONGO_MAX_POOL_SIZE, 4) if MONGO_MAX_POOL_SIZE else 0,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_timeouts": self.checkout_timeouts,
+                "avg_wait_ms": round(self.wait_time_total / self.checkouts * 1000, 3) if self.checkouts else 0,
+                "max_wait_ms": round(self.wait_time_max * 1000, 3),
+                "pool_clears": self.pool_clears,
+            }
+
+pool_metrics = PoolMetrics()
+
+client = None
+db = None
+
+def client_options():
+    """Keyword arguments for AsyncIOMotorClient built from the environment"""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+        "event_listeners": [pool_metrics, command_metrics, slow_query_log],
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+def route_read_preference(route):
+    """Read preference for a read route such as reporting or catalog"""
+    mode = read_pref_mode_from_name(READ_ROUTES[route])
+    max_staleness = MONGO_MAX_STALENESS_SECONDS if mode else -1
+    return make_read_preference(mode, None, max_staleness)
+
+def connect():
+    """Create the Motor client; called from the app lifespan"""
+    global client, db
+    if client is None:
+        client = AsyncIOMotorClient(MONGO_URL, **client_options())
+        db = client[DATABASE_NAME]
+    return db
+
+def close():
+    """Close the Motor client and release all pooled connections"""
+    global client, db
+    if client is not None:
+        client.close()
+        client = None
+        db = None
+
+def get_db():
+    return db if db is not None else connect()
+
+class LazyCollection:
+    """Collection handle resolved against the current client on each use.
+
+    Lets modules import collection handles at import time while the client
+    itself is only created (and closed) by the app lifespan. ``route`` picks
+    the read preference from READ_ROUTES.
+    """
+
+    def __init__(self, name, route="primary"):
+        self.name = name
+        self.route = route
+        self._db = None
+        self._collection = None
+
+    def _resolve(self):
+        current = get_db()
+        if self._db is not current:
+            # Set for every route, including primary, so the client-wide
+            # MONGO_READ_PREFERENCE never moves booking reads to a secondary
+            collection = current[self.name].with_options(read_preference=route_read_preference(self.route))
+            self._db, self._collection = current, collection
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r}, route={self.route!r})"
 
 # Collections
-users_collection = db["users"]
-specialties_collection = db["specialties"]
-doctors_collection = db["doctors"]
-schedules_collection = db["schedules"]
-schedule_exceptions_collection = db["schedule_exceptions"]
-appointments_collection = db["appointments"]
-diagnostic_tests_collection = db["diagnostic_tests"]
-diagnostic_bookings_collection = db["diagnostic_bookings"]
-blog_posts_collection = db["blog_posts"]
-contact_messages_collection = db["contact_messages"]
-settings_collection = db["settings"]
+users_collection = LazyCollection("users")
+specialties_collection = LazyCollection("specialties")
+doctors_collection = LazyCollection("doctors")
+schedules_collection = LazyCollection("schedules")
+schedule_exceptions_collection = LazyCollection("schedule_exceptions")
+appointments_collection = LazyCollection("appointments")
+diagnostic_tests_collection = LazyCollection("diagnostic_tests")
+diagnostic_bookings_collection = LazyCollection("diagnostic_bookings")
+blog_posts_collection = LazyCollection("blog_posts")
+contact_messages_collection = LazyCollection("contact_messages")
+settings_collection = LazyCollection("settings")
+slow_queries_collection = LazyCollection("slow_queries")
+rate_limits_collection = LazyCollection("rate_limits")
+idempotency_keys_collection = LazyCollection("idempotency_keys")
+notifications_collection = LazyCollection("notifications")
+reschedule_jobs_collection = LazyCollection("reschedule_jobs")
+waitlist_collection = LazyCollection("waitlist")
+slot_holds_collection = LazyCollection("slot_holds")
+queue_sessions_collection = LazyCollection("queue_sessions")
+queue_tokens_collection = LazyCollection("queue_tokens")
+counters_collection = LazyCollection("counters")
+images_collection = LazyCollection("images")
+
+# Cold tier for finished bookings (see archival.py)
+appointments_archive_collection = LazyCollection("appointments_archive")
+diagnostic_bookings_archive_collection = LazyCollection("diagnostic_bookings_archive")
+
+# Reporting handles (analytics, exports)
+appointments_reporting_collection = LazyCollection("appointments", route="reporting")
+diagnostic_bookings_reporting_collection = LazyCollection("diagnostic_bookings", route="reporting")
+appointments_archive_reporting_collection = LazyCollection("appointments_archive", route="reporting")
+diagnostic_bookings_archive_reporting_collection = LazyCollection("diagnostic_bookings_archive", route="reporting")
+doctors_reporting_collection = LazyCollection("doctors", route="reporting")
+diagnostic_tests_reporting_collection = LazyCollection("diagnostic_tests", route="reporting")
+contact_messages_reporting_collection = LazyCollection("contact_messages", route="reporting")
+schedules_reporting_collection = LazyCollection("schedules", route="reporting")
+schedule_exceptions_reporting_collection = LazyCollection("schedule_exceptions", route="reporting")
+
+# Public catalog handles
+specialties_catalog_collection = LazyCollection("specialties", route="catalog")
+doctors_catalog_collection = LazyCollection("doctors", route="catalog")
+schedules_catalog_collection = LazyCollection("schedules", route="catalog")
+diagnostic_tests_catalog_collection = LazyCollection("diagnostic_tests", route="catalog")
+blog_posts_catalog_collection = LazyCollection("blog_posts", route="catalog")
+settings_catalog_collection = LazyCollection("settings", route="catalog")
+
+# Patient booking history: newest first, keyset-paged on (date_time, id)
+PATIENT_HISTORY_INDEX = [("patient_phone_normalized", 1), ("date_time", -1), ("id", -1)]
+
+async def backfill_normalized_phones(collection, batch_size=1000):
+    """Set patient_phone_normalized on bookings created before it existed"""
+    # Equality with None matches missing fields and can use the history index
+    cursor = collection.find({"patient_phone_normalized": None}, {"_id": 1, "patient_phone": 1})
+    batch = []
+    updated = 0
+    async for doc in cursor:
+        batch.append(UpdateOne(
+            # Guarded so workers racing on the same document write it once
+            {"_id": doc["_id"], "patient_phone_normalized": None},
+            {"$set": {"patient_phone_normalized": normalize_phone(doc.get("patient_phone"))}}
+        ))
+        if len(batch) >= batch_size:
+            await collection.bulk_write(batch, ordered=False)
+            updated += len(batch)
+            batch = []
+    if batch:
+        await collection.bulk_write(batch, ordered=False)
+        updated += len(batch)
+    if updated:
+        print(f"Normalized patient phones on {updated} {collection.name} documents")
+
+async def run_phone_backfill():
+    """Background task started by the app lifespan.
+
+    Backfilled documents leave the index range of the None query, so once
+    every booking is normalized this is one empty index scan per collection.
+    """
+    for collection in (appointments_collection, diagnostic_bookings_collection):
+        try:
+            await backfill_normalized_phones(collection)
+        except Exception as e:
+            print(f"Error normalizing patient phones on {collection.name}: {e}")
+
+async def create_archive_collections():
+    """Create the archive tier with a stronger block compressor than the default"""
+    existing = await get_db().list_collection_names()
+    for collection in (appointments_archive_collection, diagnostic_bookings_archive_collection):
+        if collection.name in existing:
+            continue
+        try:
+            await get_db().create_collection(
+                collection.name,
+                storageEngine={"wiredTiger": {"configString": f"block_compressor={ARCHIVE_BLOCK_COMPRESSOR}"}}
+            )
+        except CollectionInvalid:
+            pass  # Created concurrently by another worker
 
 async def init_db():
     """Initialize database with indexes"""
     # Create indexes
     await users_collection.create_index("username", unique=True)
+    await doctors_collection.create_index("id", unique=True)
     await doctors_collection.create_index("specialty_id")
+    await diagnostic_tests_collection.create_index("id", unique=True)
     await schedules_collection.create_index("doctor_id")
     await appointments_collection.create_index([("doctor_id", 1), ("date_time", 1)])
+    await appointments_collection.create_index("id", unique=True)
     await appointments_collection.create_index("reference_number", unique=True)
+    await appointments_collection.create_index(PATIENT_HISTORY_INDEX)
+    await appointments_collection.create_index([("status", 1), ("date_time", 1)])
+    try:
+        # At most one active booking per doctor and time, whichever path writes it
+        await appointments_collection.create_index(
+            [("doctor_id", 1), ("date_time", 1)],
+            name="active_slot_unique",
+            unique=True,
+            partialFilterExpression={"status": {"$in": ["new", "confirmed"]}},
+        )
+    except OperationFailure as e:
+        # $in in a partial filter needs MongoDB 6.0, and existing double bookings block the build
+        print(f"Warning: unique active-slot index not created: {e}")
+    await diagnostic_bookings_collection.create_index("id", unique=True)
     await diagnostic_bookings_collection.create_index("reference_number", unique=True)
+    await diagnostic_bookings_collection.create_index(PATIENT_HISTORY_INDEX)
+    await diagnostic_bookings_collection.create_index([("status", 1), ("date_time", 1)])
+    await create_archive_collections()
+    for archive in (appointments_archive_collection, diagnostic_bookings_archive_collection):
+        await archive.create_index("id", unique=True)
+        await archive.create_index("reference_number", unique=True)
+        await archive.create_index("date_time")
+        await archive.create_index(PATIENT_HISTORY_INDEX)
     await blog_posts_collection.create_index("slug", unique=True)
+    await slow_queries_collection.create_index("key", unique=True)
+    await rate_limits_collection.create_index("key", unique=True)
+    await rate_limits_collection.create_index("expires_at", expireAfterSeconds=0)
+    await idempotency_keys_collection.create_index("key", unique=True)
+    await idempotency_keys_collection.create_index("expires_at", expireAfterSeconds=0)
+    await schedule_exceptions_collection.create_index([("doctor_id", 1), ("date", 1)])
+    await notifications_collection.create_index("id", unique=True)
+    await notifications_collection.create_index([("email_status", 1), ("created_at", 1)])
+    await notifications_collection.create_index([("acknowledged", 1), ("created_at", -1)])
+    await reschedule_jobs_collection.create_index("id", unique=True)
+    await reschedule_jobs_collection.create_index([("status", 1), ("claimed_at", 1)])
+    await waitlist_collection.create_index("id", unique=True)
+    await waitlist_collection.create_index([("doctor_id", 1), ("status", 1), ("created_at", 1)])
+    await waitlist_collection.create_index([("status", 1), ("offer.expires_at", 1)])
+    await slot_holds_collection.create_index([("doctor_id", 1), ("date_time", 1)], unique=True)
+    await slot_holds_collection.create_index("expires_at", expireAfterSeconds=0)
+    await counters_collection.create_index("id", unique=True)
+    await images_collection.create_index("id", unique=True)
+    await images_collection.create_index([("status", 1), ("created_at", 1)])
+    await doctors_collection.create_index("photo_image_id", sparse=True)
+    await blog_posts_collection.create_index("featured_image_image_id", sparse=True)
+    await queue_sessions_collection.create_index("id", unique=True)
+    await queue_sessions_collection.create_index("date")
+    await queue_tokens_collection.create_index("id", unique=True)
+    await queue_tokens_collection.create_index(
+        [("doctor_id", 1), ("date", 1), ("status", 1), ("queue_minute", 1), ("token_number", 1)]
+    )
+    await queue_tokens_collection.create_index(
+        "appointment_id", unique=True, partialFilterExpression={"appointment_id": {"$type": "string"}}
+    )
     print("Database indexes created successfully")
@@ -97,3 +97,103 @@ Test: {service_name}
 Date/Time: {date_time}
 
 For queries: {HOSPITAL_PHONE}"""
+
+def get_reschedule_message(
+    patient_name: str,
+    reference_number: str,
+    old_date_time: str,
+    new_date_time: str,
+    doctor_name: str
+):
+    """Subject and body telling a patient their appointment was moved"""
+    subject = f"Appointment Rescheduled - {reference_number} | {HOSPITAL_NAME}"
+    body = f"""Dear {patient_name},
+
+Your doctor is unavailable at the time you booked, so your appointment at {HOSPITAL_NAME} has been moved.
+
+Booking Details:
+- Reference Number: {reference_number}
+- Previous Date & Time: {old_date_time}
+- New Date & Time: {new_date_time}
+- Doctor: {doctor_name}
+
+If the new time does not suit you, please contact us:
+Phone: {HOSPITAL_PHONE}
+Email: {HOSPITAL_EMAIL}
+
+Best regards,
+{HOSPITAL_NAME}
+"""
+    return subject, body
+
+def get_reschedule_whatsapp_message(
+    patient_name: str,
+    reference_number: str,
+    new_date_time: str,
+    doctor_name: str
+):
+    """Generate WhatsApp rescheduling message template for staff"""
+    return f"""Dear {patient_name}, your appointment at {HOSPITAL_NAME} has been rescheduled as the doctor is unavailable.
+
+Ref: {reference_number}
+Doctor: {doctor_name}
+New Date/Time: {new_date_time}
+
+If this time does not suit you, please call: {HOSPITAL_PHONE}"""
+
+def get_waitlist_offer_message(
+    patient_name: str,
+    offer_code: str,
+    date_time: str,
+    doctor_name: str,
+    expires_at: str
+):
+    """Subject and body offering a freed slot to a waitlisted patient"""
+    subject = f"Appointment Slot Available - {doctor_name} | {HOSPITAL_NAME}"
+    body = f"""Dear {patient_name},
+
+A slot has opened up with {doctor_name} at {HOSPITAL_NAME} and is being held for you.
+
+Slot Details:
+- Date & Time: {date_time}
+- Doctor: {doctor_name}
+- Offer Code: {offer_code}
+
+The slot is held until {expires_at} (UTC). To confirm it, call us with your offer code:
+Phone: {HOSPITAL_PHONE}
+Email: {HOSPITAL_EMAIL}
+
+If you no longer need it, simply ignore this message and the slot will be offered to the next patient.
+
+Best regards,
+{HOSPITAL_NAME}
+"""
+    return subject, body
+
+def get_waitlist_offer_whatsapp_message(
+    patient_name: str,
+    offer_code: str,
+    date_time: str,
+    doctor_name: str,
+    expires_at: str
+):
+    """Generate WhatsApp waitlist offer message template for staff"""
+    return f"""Dear {patient_name}, a slot has opened up at {HOSPITAL_NAME} and is held for you.
+
+Doctor: {doctor_name}
+Date/Time: {date_time}
+Offer Code: {offer_code}
+
+Please confirm before {expires_at} (UTC) by calling: {HOSPITAL_PHONE}"""
+
+async def send_email(to_email: str, subject: str, body: str):
+    """Send a prepared email"""
+    try:
+        # Log the email (for now, actual sending would require SMTP setup)
+        print(f"Email notification prepared for {to_email}")
+        print(f"Subject: {subject}")
+        print(f"Body: {body[:200]}...")
+        return True
+    except Exception as e:
+        print(f"Error preparing email: {e}")
+        return False
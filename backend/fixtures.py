@@ -0,0 +1,444 @@
+"""Synthetic data generator for load tests and benchmarks.
+
+Builds documents shaped after the schemas in models.py and bulk-loads them
+with unordered ``insert_many`` batches. Usage:
+
+    python fixtures.py --appointments 1000000 --diagnostic-bookings 300000
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+
+from models import (
+    Appointment, AppointmentStatus, BlogPost, ContactMessage, DiagnosticBooking,
+    Doctor, DoctorSchedule, Gender, Specialty, normalize_phone
+)
+from references import appointment_references, diagnostic_references, format_reference
+
+BATCH_SIZE = 5000
+MAX_CONCURRENT_BATCHES = 4
+# Random days tried per doctor before an appointment goes to another doctor
+SLOT_ATTEMPTS = 20
+
+FIRST_NAMES = [
+    "Ahmed", "Ali", "Hassan", "Usman", "Bilal", "Imran", "Tariq", "Kamran", "Faisal", "Zubair",
+    "Fatima", "Ayesha", "Zainab", "Sana", "Maryam", "Hina", "Rabia", "Nadia", "Amna", "Saima",
+]
+LAST_NAMES = [
+    "Khan", "Malik", "Sheikh", "Hussain", "Qureshi", "Chaudhry", "Butt", "Raza", "Iqbal", "Anwar",
+    "Shah", "Abbasi", "Javed", "Akhtar", "Siddiqui", "Mirza", "Baloch", "Tariq", "Aslam", "Nawaz",
+]
+SPECIALTY_NAMES = [
+    "Neurology", "Cardiology", "Eye Specialist", "Chest Specialist", "General Medicine",
+    "Orthopedics", "Dermatology", "ENT", "Gynecology", "Pediatrics", "Urology", "Psychiatry",
+]
+BLOG_CATEGORIES = ["Heart Health", "Eye Care", "Neurology", "Respiratory Health", "General Health"]
+CONTACT_SUBJECTS = ["Appointment query", "Test report", "Billing", "Feedback", "Doctor availability"]
+
+# Share of bookings per status for slots in the past / future
+PAST_STATUS_WEIGHTS = {
+    AppointmentStatus.COMPLETED: 72,
+    AppointmentStatus.NO_SHOW: 12,
+    AppointmentStatus.CANCELLED: 10,
+    AppointmentStatus.CONFIRMED: 4,
+    AppointmentStatus.NEW: 2,
+}
+FUTURE_STATUS_WEIGHTS = {
+    AppointmentStatus.NEW: 55,
+    AppointmentStatus.CONFIRMED: 38,
+    AppointmentStatus.CANCELLED: 7,
+}
+
+def _patient(rng: random.Random) -> Dict:
+    first = rng.choice(FIRST_NAMES)
+    gender = Gender.FEMALE if FIRST_NAMES.index(first) >= 10 else Gender.MALE
+    # A bounded phone space so repeat patients occur, as in real traffic
+    phone = f"+92-3{rng.randint(0, 49):02d}-{rng.randint(0, 99999):05d}{rng.randint(0, 99):02d}"
+    return {
+        "patient_name": f"{first} {rng.choice(LAST_NAMES)}",
+        "patient_phone": phone,
+        "patient_phone_normalized": normalize_phone(phone),
+        "patient_email": f"{first.lower()}{rng.randint(1, 9999)}@example.com" if rng.random() < 0.4 else None,
+        "patient_gender": gender.value,
+        "patient_dob": f"{rng.randint(1940, 2022)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+    }
+
+def _weighted_statuses(weights: Dict[AppointmentStatus, int]):
+    return [s.value for s in weights], list(weights.values())
+
+def _zipf_weights(n: int, skew: float = 1.1) -> List[float]:
+    """Popularity weights so a few specialists attract most bookings"""
+    return [1.0 / ((i + 1) ** skew) for i in range(n)]
+
+def _check_schema(model, doc: Dict):
+    """Validate a sample document against its models.py schema"""
+    model(**doc)
+
+def generate_specialties(count: int) -> List[Dict]:
+    specialties = []
+    for i in range(count):
+        name = SPECIALTY_NAMES[i % len(SPECIALTY_NAMES)]
+        if i >= len(SPECIALTY_NAMES):
+            name = f"{name} {i // len(SPECIALTY_NAMES) + 1}"
+        specialties.append({
+            "id": str(uuid.uuid4()), "name": name, "description": f"{name} department",
+            "icon": None, "active": True, "created_at": datetime.utcnow(),
+        })
+    _check_schema(Specialty, specialties[0])
+    return specialties
+
+def generate_doctors(count: int, specialties: List[Dict], rng: random.Random) -> List[Dict]:
+    doctors = []
+    for _ in range(count):
+        first = rng.choice(FIRST_NAMES)
+        doctors.append({
+            "id": str(uuid.uuid4()),
+            "name": f"Dr. {first} {rng.choice(LAST_NAMES)}",
+            "specialty_id": rng.choice(specialties)["id"],
+            "qualifications": "MBBS, FCPS",
+            "bio": None, "photo": None, "fee": "Call for price", "tags": [],
+            "gender": (Gender.FEMALE if FIRST_NAMES.index(first) >= 10 else Gender.MALE).value,
+            "languages": ["Urdu", "English"],
+            "experience_years": rng.randint(2, 30),
+            "phone": None, "email": None,
+            "active": True, "created_at": datetime.utcnow(),
+        })
+    _check_schema(Doctor, doctors[0])
+    return doctors
+
+def generate_schedules(doctors: List[Dict], rng: random.Random) -> List[Dict]:
+    """Mon-Sat morning or evening sessions, matching seed_initial_data"""
+    schedules = []
+    for doctor in doctors:
+        slot_minutes = rng.choice([10, 15, 15, 15, 20, 30])
+        for day in range(6):
+            morning = rng.random() < 0.5
+            schedules.append({
+                "id": str(uuid.uuid4()),
+                "doctor_id": doctor["id"],
+                "day_of_week": day,
+                "start_time": "09:00" if morning else "14:00",
+                "end_time": "14:00" if morning else "20:00",
+                "slot_minutes": slot_minutes,
+                "active": True,
+            })
+    _check_schema(DoctorSchedule, schedules[0])
+    return schedules
+
+def generate_appointments(
+    count: int,
+    doctors: List[Dict],
+    schedules: List[Dict],
+    start_date: datetime,
+    days: int,
+    rng: random.Random,
+    first_reference: int = 1,
+) -> Iterator[Dict]:
+    """Yield appointment documents on real schedule slots.
+
+    Doctors are picked with a Zipf-like popularity skew; within a doctor's
+    session, earlier slots are slightly more popular than late ones. No
+    slot is booked twice; bookings for a fully booked doctor go to another.
+    References are sequential from ``first_reference``, as references.py
+    mints them.
+    """
+    schedule_map: Dict[str, Dict[int, Dict]] = {}
+    for s in schedules:
+        if s.get("active", True):
+            schedule_map.setdefault(s["doctor_id"], {})[s["day_of_week"]] = s
+    doctors = [d for d in doctors if d["id"] in schedule_map]
+    if not doctors:
+        return
+    weights = _zipf_weights(len(doctors))
+    now = datetime.utcnow()
+    past_statuses, past_weights = _weighted_statuses(PAST_STATUS_WEIGHTS)
+    future_statuses, future_weights = _weighted_statuses(FUTURE_STATUS_WEIGHTS)
+
+    # Slot indexes already booked per (doctor_id, date), so no slot is booked twice
+    taken: Dict[Tuple[str, datetime], Set[int]] = {}
+
+    def place(doctor: Dict) -> Optional[datetime]:
+        """A free slot of ``doctor``, or None when the days tried are full"""
+        doctor_schedules = schedule_map[doctor["id"]]
+        for _ in range(SLOT_ATTEMPTS):
+            day = start_date + timedelta(days=rng.randrange(days))
+            schedule = doctor_schedules.get(day.weekday())
+            if schedule is None:
+                # Move to the nearest working day of this doctor
+                day_of_week = rng.choice(list(doctor_schedules))
+                day += timedelta(days=(day_of_week - day.weekday()) % 7)
+                schedule = doctor_schedules[day_of_week]
+            sh, sm = map(int, schedule["start_time"].split(":"))
+            eh, em = map(int, schedule["end_time"].split(":"))
+            slot_minutes = schedule.get("slot_minutes", 15)
+            slot_count = max(1, ((eh * 60 + em) - (sh * 60 + sm)) // slot_minutes)
+            booked = taken.setdefault((doctor["id"], day), set())
+            if len(booked) >= slot_count:
+                continue
+            slot = min(int(rng.triangular(0, slot_count, 0)), slot_count - 1)
+            # Next free slot, wrapping around, keeps the skew towards early slots
+            slot = next(s % slot_count for s in range(slot, slot + slot_count) if s % slot_count not in booked)
+            booked.add(slot)
+            return day.replace(hour=sh, minute=sm) + timedelta(minutes=slot * slot_minutes)
+        return None
+
+    emitted = 0
+    while emitted < count:
+        chunk = min(BATCH_SIZE, count - emitted)
+        picked = rng.choices(doctors, weights=weights, k=chunk)
+        for doctor in picked:
+            slot_at = place(doctor)
+            for _ in range(SLOT_ATTEMPTS):
+                if slot_at is not None:
+                    break
+                # This doctor is (nearly) fully booked; overflow to another one
+                doctor = rng.choice(doctors)
+                slot_at = place(doctor)
+            if slot_at is None:
+                raise ValueError(
+                    f"Schedules cannot fit {count} appointments in {days} days; "
+                    "add doctors or widen the date range"
+                )
+            if slot_at < now:
+                status = rng.choices(past_statuses, weights=past_weights)[0]
+            else:
+                status = rng.choices(future_statuses, weights=future_weights)[0]
+            lead_days = min(int(rng.expovariate(1 / 3.0)), 60)
+            doc = {
+                "id": str(uuid.uuid4()),
+                "reference_number": format_reference(appointment_references.prefix, first_reference + emitted),
+                "doctor_id": doctor["id"],
+                "date_time": slot_at.strftime("%Y-%m-%d %H:%M"),
+                "status": status,
+                "notes": None,
+                "created_at": slot_at - timedelta(days=lead_days, minutes=rng.randint(0, 720)),
+            }
+            doc.update(_patient(rng))
+            if emitted == 0:
+                _check_schema(Appointment, doc)
+            emitted += 1
+            yield doc
+
+def generate_diagnostic_bookings(
+    count: int,
+    tests: List[Dict],
+    start_date: datetime,
+    days: int,
+    rng: random.Random,
+    first_reference: int = 1,
+) -> Iterator[Dict]:
+    """Yield diagnostic bookings; lab tests dominate and mornings are busiest"""
+    if not tests:
+        return
+    weights = [4.0 if t.get("category") == "lab_tests" else 1.0 for t in tests]
+    now = datetime.utcnow()
+    past_statuses, past_weights = _weighted_statuses(PAST_STATUS_WEIGHTS)
+    future_statuses, future_weights = _weighted_statuses(FUTURE_STATUS_WEIGHTS)
+
+    emitted = 0
+    while emitted < count:
+        chunk = min(BATCH_SIZE, count - emitted)
+        for test in rng.choices(tests, weights=weights, k=chunk):
+            day = start_date + timedelta(days=rng.randrange(days))
+            hour = min(int(rng.triangular(8, 20, 9)), 19)
+            slot_at = day.replace(hour=hour, minute=rng.choice([0, 15, 30, 45]))
+            if slot_at < now:
+                status = rng.choices(past_statuses, weights=past_weights)[0]
+            else:
+                status = rng.choices(future_statuses, weights=future_weights)[0]
+            doc = {
+                "id": str(uuid.uuid4()),
+                "reference_number": format_reference(diagnostic_references.prefix, first_reference + emitted),
+                "test_id": test["id"],
+                "date_time": slot_at.strftime("%Y-%m-%d %H:%M"),
+                "status": status,
+                "notes": None,
+                "created_at": slot_at - timedelta(days=min(int(rng.expovariate(1.0)), 14)),
+            }
+            doc.update(_patient(rng))
+            if emitted == 0:
+                _check_schema(DiagnosticBooking, doc)
+            emitted += 1
+            yield doc
+
+def generate_blog_posts(count: int, start_date: datetime, days: int, rng: random.Random) -> Iterator[Dict]:
+    for i in range(count):
+        published_at = start_date + timedelta(days=rng.randrange(days), hours=rng.randint(8, 20))
+        category = rng.choice(BLOG_CATEGORIES)
+        doc = {
+            "id": str(uuid.uuid4()),
+            "title": f"{category} article {i + 1}",
+            "slug": f"synthetic-{category.lower().replace(' ', '-')}-{i + 1}-{uuid.uuid4().hex[:6]}",
+            "content": "<p>" + " ".join(rng.choice(LAST_NAMES).lower() for _ in range(rng.randint(150, 900))) + "</p>",
+            "excerpt": f"Synthetic {category.lower()} post",
+            "category": category,
+            "tags": rng.sample(["prevention", "lifestyle", "checkup", "wellness", "diet", "exercise"], 2),
+            "author": f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "featured_image": None, "meta_title": None, "meta_description": None,
+            "published": rng.random() < 0.9,
+            "views": int(rng.paretovariate(1.2) * 20),
+            "published_at": published_at,
+            "created_at": published_at,
+        }
+        if i == 0:
+            _check_schema(BlogPost, doc)
+        yield doc
+
+def generate_contact_messages(count: int, start_date: datetime, days: int, rng: random.Random) -> Iterator[Dict]:
+    for i in range(count):
+        first = rng.choice(FIRST_NAMES)
+        doc = {
+            "id": str(uuid.uuid4()),
+            "name": f"{first} {rng.choice(LAST_NAMES)}",
+            "email": f"{first.lower()}{rng.randint(1, 9999)}@example.com",
+            "phone": f"+92-3{rng.randint(0, 49):02d}-{rng.randint(0, 9999999):07d}" if rng.random() < 0.7 else None,
+            "subject": rng.choice(CONTACT_SUBJECTS),
+            "message": "Please call me back regarding my visit.",
+            "read": rng.random() < 0.8,
+            "created_at": start_date + timedelta(days=rng.randrange(days), seconds=rng.randint(0, 86399)),
+        }
+        if i == 0:
+            _check_schema(ContactMessage, doc)
+        yield doc
+
+async def bulk_insert(collection, documents: Iterator[Dict], batch_size: int = BATCH_SIZE) -> int:
+    """Insert documents in unordered batches, keeping a few batches in flight"""
+    inserted = 0
+    pending = set()
+    batch = []
+
+    async def flush(docs):
+        result = await collection.insert_many(docs, ordered=False)
+        return len(result.inserted_ids)
+
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            pending.add(asyncio.ensure_future(flush(batch)))
+            batch = []
+            if len(pending) >= MAX_CONCURRENT_BATCHES:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                inserted += sum(t.result() for t in done)
+    if batch:
+        pending.add(asyncio.ensure_future(flush(batch)))
+    if pending:
+        done, _ = await asyncio.wait(pending)
+        inserted += sum(t.result() for t in done)
+    return inserted
+
+async def _reserve_references(db, prefix: str, count: int) -> int:
+    """Take ``count`` numbers from the counter references.py uses; returns the first"""
+    counter = await db["counters"].find_one_and_update(
+        {"id": f"reference:{prefix}"},
+        {"$inc": {"value": count}},
+        projection={"_id": 0, "value": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["value"] - count + 1
+
+async def load_fixtures(
+    db,
+    appointments: int = 0,
+    diagnostic_bookings: int = 0,
+    blog_posts: int = 0,
+    contact_messages: int = 0,
+    doctors: int = 0,
+    specialties: int = 0,
+    days_back: int = 365,
+    days_ahead: int = 30,
+    seed: Optional[int] = 42,
+) -> Dict[str, int]:
+    """Load a synthetic dataset into ``db`` and return inserted counts.
+
+    Existing specialties, doctors, schedules and diagnostic tests are reused;
+    ``doctors``/``specialties`` add synthetic ones on top when requested.
+    """
+    rng = random.Random(seed)
+    start_date = (datetime.utcnow() - timedelta(days=days_back)).replace(hour=0, minute=0, second=0, microsecond=0)
+    days = days_back + days_ahead
+    counts = {}
+
+    if specialties or (doctors and await db["specialties"].count_documents({}) == 0):
+        new_specialties = generate_specialties(specialties or len(SPECIALTY_NAMES))
+        counts["specialties"] = await bulk_insert(db["specialties"], iter(new_specialties))
+    if doctors:
+        specialty_docs = await db["specialties"].find({"active": True}).to_list(None)
+        new_doctors = generate_doctors(doctors, specialty_docs, rng)
+        counts["doctors"] = await bulk_insert(db["doctors"], iter(new_doctors))
+        counts["schedules"] = await bulk_insert(db["schedules"], iter(generate_schedules(new_doctors, rng)))
+
+    doctor_docs = await db["doctors"].find({"active": True}).to_list(None)
+    schedule_docs = await db["schedules"].find({"active": True}).to_list(None)
+    test_docs = await db["diagnostic_tests"].find({"active": True}).to_list(None)
+
+    if appointments:
+        counts["appointments"] = await bulk_insert(
+            db["appointments"],
+            generate_appointments(
+                appointments, doctor_docs, schedule_docs, start_date, days, rng,
+                first_reference=await _reserve_references(db, appointment_references.prefix, appointments),
+            ),
+        )
+    if diagnostic_bookings:
+        counts["diagnostic_bookings"] = await bulk_insert(
+            db["diagnostic_bookings"],
+            generate_diagnostic_bookings(
+                diagnostic_bookings, test_docs, start_date, days, rng,
+                first_reference=await _reserve_references(db, diagnostic_references.prefix, diagnostic_bookings),
+            ),
+        )
+    if blog_posts:
+        counts["blog_posts"] = await bulk_insert(
+            db["blog_posts"], generate_blog_posts(blog_posts, start_date, days_back, rng), batch_size=500
+        )
+    if contact_messages:
+        counts["contact_messages"] = await bulk_insert(
+            db["contact_messages"], generate_contact_messages(contact_messages, start_date, days_back, rng)
+        )
+    return counts
+
+async def _main(args):
+    from database import connect, close, init_db
+    from server import seed_initial_data
+
+    db = connect()
+    await init_db()
+    await seed_initial_data()
+    started = time.perf_counter()
+    counts = await load_fixtures(
+        db,
+        appointments=args.appointments,
+        diagnostic_bookings=args.diagnostic_bookings,
+        blog_posts=args.blog_posts,
+        contact_messages=args.contact_messages,
+        doctors=args.doctors,
+        specialties=args.specialties,
+        days_back=args.days_back,
+        days_ahead=args.days_ahead,
+        seed=args.seed,
+    )
+    elapsed = time.perf_counter() - started
+    for name, inserted in counts.items():
+        print(f"{name}: {inserted}")
+    print(f"Fixtures loaded in {elapsed:.1f}s")
+    close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load synthetic data for load tests and benchmarks")
+    parser.add_argument("--appointments", type=int, default=100000)
+    parser.add_argument("--diagnostic-bookings", type=int, default=30000)
+    parser.add_argument("--blog-posts", type=int, default=200)
+    parser.add_argument("--contact-messages", type=int, default=10000)
+    parser.add_argument("--doctors", type=int, default=0, help="Extra synthetic doctors to add")
+    parser.add_argument("--specialties", type=int, default=0, help="Extra synthetic specialties to add")
+    parser.add_argument("--days-back", type=int, default=365)
+    parser.add_argument("--days-ahead", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,147 @@
+"""Idempotency-Key support for booking creation.
+
+Patients on flaky networks retry POSTs. With an ``Idempotency-Key`` header
+the first request's response is stored in a TTL-indexed collection and
+retries get it back without re-running the handler, so they neither
+insert another booking nor send another confirmation. A replay is looked
+up before ``admit`` (the rate limit) runs, so retries do not use up the
+client's budget. A claim left ``in_progress`` by a worker that died is
+taken over by a retry once it is older than IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Response
+from pymongo.errors import DuplicateKeyError
+
+from database import idempotency_keys_collection
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "5"))
+# In-progress claims older than this are assumed abandoned by a crashed worker
+IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS = float(os.environ.get("IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS", "60"))
+MAX_KEY_LENGTH = 255
+
+# _wait_for_completion result when the first attempt failed and deleted its key
+RELEASED = object()
+
+def fingerprint(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+async def _wait_for_completion(key):
+    """Poll briefly for a concurrent request holding the same key.
+
+    Returns the completed record, RELEASED when the key was deleted, or
+    None when the wait timed out.
+    """
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+    while asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.1)
+        record = await idempotency_keys_collection.find_one({"key": key})
+        if record is None:
+            return RELEASED
+        if record["status"] == "completed":
+            return record
+    return None
+
+def _check_fingerprint(record: Optional[dict], request_hash: str):
+    if record is not None and record["fingerprint"] != request_hash:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request",
+        )
+
+async def _take_over_stale_claim(key, now: datetime) -> bool:
+    """Atomically claim an in_progress record whose owner stopped; True when claimed"""
+    stale = now - timedelta(seconds=IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS)
+    record = await idempotency_keys_collection.find_one_and_update(
+        {"key": key, "status": "in_progress", "$or": [
+            {"claimed_at": {"$lt": stale}},
+            {"claimed_at": {"$exists": False}, "created_at": {"$lt": stale}},
+        ]},
+        {"$set": {"claimed_at": now}},
+    )
+    return record is not None
+
+def _replay(record: dict, response: Response) -> dict:
+    response.headers["Idempotent-Replayed"] = "true"
+    return record["response"]
+
+async def run_idempotent(
+    scope: str,
+    idempotency_key: Optional[str],
+    payload: dict,
+    response: Response,
+    handler: Callable[[], Awaitable[dict]],
+    admit: Optional[Callable[[], Awaitable]] = None,
+) -> dict:
+    """Run ``handler`` once per (scope, key); replay its response afterwards.
+
+    ``admit`` runs only when the handler is about to run, never for a replay.
+    """
+    if idempotency_key and len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+    if not idempotency_key:
+        if admit is not None:
+            await admit()
+        return await handler()
+
+    key = f"{scope}:{idempotency_key}"
+    request_hash = fingerprint(payload)
+    record = await idempotency_keys_collection.find_one({"key": key})
+    _check_fingerprint(record, request_hash)
+    if record is not None and record["status"] == "completed":
+        return _replay(record, response)
+    if admit is not None:
+        await admit()
+
+    # Millisecond precision, as stored by MongoDB, so _run_claimed can match it
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    try:
+        await idempotency_keys_collection.insert_one({
+            "key": key,
+            "fingerprint": request_hash,
+            "status": "in_progress",
+            "created_at": now,
+            "claimed_at": now,
+            "expires_at": now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+        })
+    except DuplicateKeyError:
+        record = await idempotency_keys_collection.find_one({"key": key})
+        _check_fingerprint(record, request_hash)
+        if record is not None and record["status"] != "completed":
+            if await _take_over_stale_claim(key, now):
+                return await _run_claimed(key, now, handler)
+            record = await _wait_for_completion(key)
+            if record is None:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still being processed",
+                )
+        if record is not None and record is not RELEASED:
+            return _replay(record, response)
+        # The first attempt failed and released the key; run again (already admitted)
+        return await run_idempotent(scope, idempotency_key, payload, response, handler)
+    return await _run_claimed(key, now, handler)
+
+async def _run_claimed(key, claimed_at: datetime, handler: Callable[[], Awaitable[dict]]) -> dict:
+    """Run the handler for a key this request holds and store the result"""
+    try:
+        result = await handler()
+    except BaseException:
+        # Failed attempts are not stored, so a retry can succeed later; a
+        # claim since taken over by another request is left alone
+        await idempotency_keys_collection.delete_one(
+            {"key": key, "status": "in_progress", "claimed_at": claimed_at}
+        )
+        raise
+    await idempotency_keys_collection.update_one(
+        {"key": key},
+        {"$set": {"status": "completed", "response": result, "completed_at": datetime.utcnow()}},
+    )
+    return result
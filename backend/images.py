@@ -0,0 +1,344 @@
+"""Image pipeline for doctor photos and blog featured images.
+
+Originals are stored on local disk under IMAGE_STORAGE_DIR and recorded in
+``images``. Uploads are content addressed: the id is a prefix of the SHA-256
+of the bytes, so uploading the same file twice reuses one image. Pasted
+``data:`` URIs are decoded and stored the same way, and pasted http(s) URLs
+are downloaded once by the worker. Downloads only go to public addresses
+(and to IMAGE_FETCH_ALLOWED_HOSTS when set); every redirect hop is checked
+again, so a stored URL cannot reach metadata services or internal ports.
+
+A background worker renders a ``thumb`` and a ``medium`` variant of each
+image in WebP and JPEG. The rendering runs in a thread so the event loop
+stays free. Variant file names carry the content hash, so they are served
+with a one-year immutable Cache-Control. When the variants are ready their
+URLs are copied onto the doctors and blog posts that use the image, and
+list responses return only those small URLs instead of the original
+string.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import httpx
+from PIL import Image, ImageOps
+from pymongo import ReturnDocument
+
+from database import images_collection, doctors_collection, blog_posts_collection
+from metrics import registry
+from snapshots import mark_stale
+
+IMAGE_STORAGE_DIR = os.environ.get(
+    "IMAGE_STORAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", "images")
+)
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_WORKER_POLL_SECONDS = int(os.environ.get("IMAGE_WORKER_POLL_SECONDS", "30"))
+IMAGE_FETCH_TIMEOUT_SECONDS = float(os.environ.get("IMAGE_FETCH_TIMEOUT_SECONDS", "15"))
+IMAGE_FETCH_MAX_REDIRECTS = int(os.environ.get("IMAGE_FETCH_MAX_REDIRECTS", "3"))
+# Comma-separated; empty allows any host that resolves to public addresses
+IMAGE_FETCH_ALLOWED_HOSTS = {
+    h.strip().lower() for h in os.environ.get("IMAGE_FETCH_ALLOWED_HOSTS", "").split(",") if h.strip()
+}
+
+# Longest side in pixels
+VARIANTS = {"thumb": 160, "medium": 640}
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif"}
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+URL_PREFIX = "/api/images/"
+# Claimed images a crashed worker never finished are retried after this
+PROCESSING_TIMEOUT = timedelta(minutes=10)
+
+# Which documents show which image, for copying variant URLs back
+IMAGE_FIELDS = [
+    (doctors_collection, "photo"),
+    (blog_posts_collection, "featured_image"),
+]
+
+ORIGINAL_NAME = re.compile(r"^[0-9a-f]{24}$")
+VARIANT_NAME = re.compile(r"^([0-9a-f]{24})-(thumb|medium)-([0-9a-f]{10})\.(webp|jpeg)$")
+
+_wake = asyncio.Event()
+
+def _original_path(image_id: str) -> str:
+    return os.path.join(IMAGE_STORAGE_DIR, "originals", image_id)
+
+def _variant_path(name: str) -> str:
+    return os.path.join(IMAGE_STORAGE_DIR, "variants", name)
+
+def file_for(name: str):
+    """(path, media type) for a served image name, or None; names are validated against path tricks"""
+    match = VARIANT_NAME.match(name)
+    if match:
+        return _variant_path(name), MEDIA_TYPES[match.group(4)]
+    if ORIGINAL_NAME.match(name):
+        return _original_path(name), None
+    return None
+
+def _inspect(data: bytes):
+    """(format, width, height) of an image, raising ValueError if Pillow cannot read it"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format.lower(), image.width, image.height
+    except Exception as e:
+        raise ValueError(f"Not a supported image: {e}")
+
+def _render(data: bytes) -> Dict[str, Dict[str, tuple]]:
+    """Every variant in every format, as {variant: {format: (bytes, width, height)}}"""
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+        rendered = {}
+        for variant, size in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            rendered[variant] = {}
+            for fmt, (pil_format, options) in FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, pil_format, **options)
+                rendered[variant][fmt] = (buffer.getvalue(), resized.width, resized.height)
+    return rendered
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+async def store_original(data: bytes, source_url: Optional[str] = None) -> dict:
+    """Validate and store an original; returns its image document"""
+    if len(data) > IMAGE_MAX_BYTES:
+        raise ValueError(f"Image larger than {IMAGE_MAX_BYTES // (1024 * 1024)} MB")
+    image_format, width, height = await asyncio.to_thread(_inspect, data)
+    digest = hashlib.sha256(data).hexdigest()
+    image_id = digest[:24]
+    await asyncio.to_thread(_write, _original_path(image_id), data)
+    image = await images_collection.find_one_and_update(
+        {"id": image_id},
+        {"$setOnInsert": {
+            "id": image_id,
+            "content_hash": digest,
+            "format": image_format,
+            "media_type": MEDIA_TYPES.get(image_format, "application/octet-stream"),
+            "width": width,
+            "height": height,
+            "bytes": len(data),
+            "source_url": source_url,
+            "status": "pending",
+            "created_at": datetime.utcnow(),
+        }},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    _wake.set()
+    return image
+
+async def _check_fetch_url(url: httpx.URL):
+    """Raise ValueError unless ``url`` is http(s) to an allowed host with only public addresses"""
+    if url.scheme not in ("http", "https") or not url.host:
+        raise ValueError(f"Refusing to fetch {url}")
+    host = url.host.lower()
+    if IMAGE_FETCH_ALLOWED_HOSTS and host not in IMAGE_FETCH_ALLOWED_HOSTS:
+        raise ValueError(f"Image host {host} is not allowed")
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, url.port or 443, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve {host}: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"Image host {host} resolves to non-public address {address}")
+
+async def _fetch(url: str) -> bytes:
+    async with httpx.AsyncClient(timeout=IMAGE_FETCH_TIMEOUT_SECONDS, follow_redirects=False) as client:
+        target = httpx.URL(url)
+        for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+            await _check_fetch_url(target)
+            async with client.stream("GET", target) as response:
+                if response.is_redirect:
+                    target = target.join(response.headers["location"])
+                    continue
+                response.raise_for_status()
+                chunks, size = [], 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > IMAGE_MAX_BYTES:
+                        raise ValueError(f"Image larger than {IMAGE_MAX_BYTES // (1024 * 1024)} MB")
+                    chunks.append(chunk)
+                return b"".join(chunks)
+    raise ValueError(f"Too many redirects fetching {url}")
+
+async def ingest_reference(value: Optional[str]) -> Optional[str]:
+    """Image id for a photo/featured_image value: one of our URLs, a data URI or an http(s) URL"""
+    if not value:
+        return None
+    if value.startswith(URL_PREFIX):
+        name = value[len(URL_PREFIX):]
+        match = VARIANT_NAME.match(name)
+        image_id = match.group(1) if match else name
+        return image_id if ORIGINAL_NAME.match(image_id) else None
+    if value.startswith("data:"):
+        try:
+            data = base64.b64decode(value.split(",", 1)[1], validate=False)
+        except (IndexError, binascii.Error):
+            return None
+        try:
+            return (await store_original(data))["id"]
+        except ValueError as e:
+            print(f"Ignoring embedded image: {e}")
+            return None
+    if value.startswith(("http://", "https://")):
+        # Download happens in the worker; the URL hash names the image until then
+        image_id = hashlib.sha256(value.encode()).hexdigest()[:24]
+        await images_collection.update_one(
+            {"id": image_id},
+            {"$setOnInsert": {"id": image_id, "source_url": value, "status": "fetch", "created_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        _wake.set()
+        return image_id
+    return None
+
+async def _process(image: dict):
+    if not image.get("content_hash"):
+        data = await _fetch(image["source_url"])
+        image_format, width, height = await asyncio.to_thread(_inspect, data)
+        await asyncio.to_thread(_write, _original_path(image["id"]), data)
+        image.update({
+            "content_hash": hashlib.sha256(data).hexdigest(),
+            "format": image_format,
+            "media_type": MEDIA_TYPES.get(image_format, "application/octet-stream"),
+            "width": width,
+            "height": height,
+            "bytes": len(data),
+        })
+    else:
+        data = await asyncio.to_thread(lambda: open(_original_path(image["id"]), "rb").read())
+
+    rendered = await asyncio.to_thread(_render, data)
+    variants = {}
+    for variant, formats in rendered.items():
+        variants[variant] = {}
+        for fmt, (encoded, width, height) in formats.items():
+            name = f"{image['id']}-{variant}-{image['content_hash'][:10]}.{fmt}"
+            await asyncio.to_thread(_write, _variant_path(name), encoded)
+            variants[variant][fmt] = URL_PREFIX + name
+            variants[variant]["width"], variants[variant]["height"] = width, height
+            variants[variant][f"{fmt}_bytes"] = len(encoded)
+
+    fields = {k: image[k] for k in ("content_hash", "format", "media_type", "width", "height", "bytes")}
+    await images_collection.update_one(
+        {"id": image["id"]},
+        {"$set": {**fields, "status": "ready", "variants": variants, "processed_at": datetime.utcnow()}},
+    )
+    for collection, field in IMAGE_FIELDS:
+        await collection.update_many(
+            {f"{field}_image_id": image["id"]}, {"$set": {f"{field}_variants": variants}}
+        )
+    mark_stale("doctors", "blog")
+
+async def process_pending(limit: int = 20) -> int:
+    """Render variants for up to ``limit`` images; each is claimed atomically"""
+    processed = 0
+    for _ in range(limit):
+        now = datetime.utcnow()
+        image = await images_collection.find_one_and_update(
+            {"$or": [
+                {"status": {"$in": ["pending", "fetch"]}},
+                {"status": "processing", "claimed_at": {"$lt": now - PROCESSING_TIMEOUT}},
+            ]},
+            {"$set": {"status": "processing", "claimed_at": now}},
+            projection={"_id": 0},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if not image:
+            break
+        try:
+            await _process(image)
+            outcome = "ready"
+        except Exception as e:
+            print(f"Error processing image {image['id']}: {e}")
+            await images_collection.update_one(
+                {"id": image["id"]}, {"$set": {"status": "failed", "error": str(e)}}
+            )
+            outcome = "failed"
+        registry.inc("images_processed_total", "Images processed by outcome", ("outcome",), (outcome,))
+        processed += 1
+    return processed
+
+async def link_image(data: dict, field: str) -> dict:
+    """Set ``<field>_image_id`` and any ready variants on a doctor/blog post about to be saved"""
+    image_id = await ingest_reference(data.get(field))
+    data[f"{field}_image_id"] = image_id
+    data[f"{field}_variants"] = None
+    if image_id:
+        image = await images_collection.find_one({"id": image_id}, {"_id": 0, "variants": 1})
+        data[f"{field}_variants"] = (image or {}).get("variants")
+        if data[field].startswith("data:"):
+            # Never keep the inline payload on the document
+            data[field] = URL_PREFIX + image_id
+    return data
+
+def apply_variant(doc: dict, field: str, variant: str) -> dict:
+    """Replace ``field`` with the variant's JPEG URL (WebP in ``<field>_webp``) for a response"""
+    variants = doc.pop(f"{field}_variants", None) or {}
+    doc.pop(f"{field}_image_id", None)
+    if variant in variants:
+        doc[field] = variants[variant]["jpeg"]
+        doc[f"{field}_webp"] = variants[variant]["webp"]
+    elif (doc.get(field) or "").startswith("data:"):
+        doc[field] = None
+    return doc
+
+async def backfill_image_references():
+    """Link doctors and blog posts saved before the pipeline existed"""
+    for collection, field in IMAGE_FIELDS:
+        cursor = collection.find(
+            {field: {"$nin": [None, ""]}, f"{field}_image_id": {"$exists": False}},
+            {"_id": 0, "id": 1, field: 1},
+        )
+        async for doc in cursor:
+            update = await link_image({field: doc[field]}, field)
+            await collection.update_one({"id": doc["id"]}, {"$set": update})
+
+async def run_image_worker(interval: int = IMAGE_WORKER_POLL_SECONDS):
+    """Background task started by the app lifespan; uploads wake it early"""
+    try:
+        await backfill_image_references()
+    except Exception as e:
+        print(f"Error linking existing images: {e}")
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        try:
+            while await process_pending():
+                pass
+        except Exception as e:
+            print(f"Error processing images: {e}")
@@ -0,0 +1,196 @@
+"""Live feed of appointment and diagnostic booking changes over SSE.
+
+Reception screens subscribe once instead of re-fetching lists and the
+dashboard. Events come from a Mongo change stream, so all workers see
+every write, or from the write handlers, which only covers writes handled
+by the same worker. LIVE_EVENTS_SOURCE=auto (the default) uses the change
+stream whenever the deployment is a replica set or sharded cluster.
+
+Each subscriber has a bounded queue. A subscriber that falls behind is
+not allowed to hold memory or slow down publishers: its queue is cleared
+and it receives a single ``resync`` event telling the client to re-fetch.
+
+Event ids are ``<epoch>-<seq>``: the epoch is random per broker, so an id
+from another worker or from before a restart is recognised as unknown and
+answered with ``resync`` instead of a wrong or silently empty replay.
+"""
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+from typing import Optional
+
+from metrics import registry
+
+LIVE_EVENTS_SOURCE = os.environ.get("LIVE_EVENTS_SOURCE", "auto")  # "auto", "handlers" or "change_stream"
+LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", "100"))
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get("LIVE_MAX_SUBSCRIBERS", "200"))
+LIVE_REPLAY_BUFFER = int(os.environ.get("LIVE_REPLAY_BUFFER", "500"))
+LIVE_HEARTBEAT_SECONDS = int(os.environ.get("LIVE_HEARTBEAT_SECONDS", "15"))
+
+# Fields streamed to reception screens
+EVENT_FIELDS = (
+    "id", "reference_number", "doctor_id", "test_id", "date_time", "status",
+    "patient_name", "patient_phone", "notes", "created_at",
+)
+
+class Subscriber:
+    def __init__(self, kinds, date=None, doctor_id=None):
+        self.kinds = kinds
+        self.date = date
+        self.doctor_id = doctor_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.overflowed = False
+
+    def matches(self, event):
+        if event["kind"] not in self.kinds:
+            return False
+        booking = event["booking"]
+        if self.date and not (booking.get("date_time") or "").startswith(self.date):
+            return False
+        if self.doctor_id and booking.get("doctor_id") != self.doctor_id:
+            return False
+        return True
+
+    def offer(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: drop its backlog and ask it to re-fetch
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"id": event["id"], "type": "resync"})
+            self.overflowed = True
+            registry.inc("live_subscriber_overflows_total", "Live feed subscribers that fell behind", (), ())
+
+class EventBroker:
+    def __init__(self):
+        self.subscribers = set()
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.recent = deque(maxlen=LIVE_REPLAY_BUFFER)
+
+    def publish(self, kind, action, booking):
+        """Fan out a booking change; never blocks the publishing handler"""
+        self.seq += 1
+        event = {
+            "seq": self.seq,
+            "id": self.event_id(self.seq),
+            "type": f"{kind}.{action}",
+            "kind": kind,
+            "booking": {k: booking.get(k) for k in EVENT_FIELDS if k in booking},
+        }
+        self.recent.append(event)
+        registry.inc("live_events_published_total", "Live feed events published", ("type",), (event["type"],))
+        for subscriber in list(self.subscribers):
+            if subscriber.matches(event):
+                subscriber.offer(event)
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def _resume_seq(self, last_event_id: str) -> Optional[int]:
+        """The seq to replay after, or None when the id is not this broker's"""
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self.seq:
+            return None
+        return int(seq)
+
+    def subscribe(self, subscriber: Subscriber, last_event_id: Optional[str] = None) -> bool:
+        if len(self.subscribers) >= LIVE_MAX_SUBSCRIBERS:
+            return False
+        if last_event_id:
+            after = self._resume_seq(last_event_id)
+            if after is None or (self.recent and self.recent[0]["seq"] > after + 1):
+                # Another worker's or a previous process's id, or too far
+                # behind for the replay buffer
+                subscriber.offer({"id": self.event_id(self.seq), "type": "resync"})
+            else:
+                for event in self.recent:
+                    if event["seq"] > after and subscriber.matches(event):
+                        subscriber.offer(event)
+        self.subscribers.add(subscriber)
+        return True
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+broker = EventBroker()
+live_source = "handlers" if LIVE_EVENTS_SOURCE == "auto" else LIVE_EVENTS_SOURCE
+
+async def resolve_source(db) -> str:
+    """Settle the event source at startup; called from the app lifespan"""
+    global live_source
+    if LIVE_EVENTS_SOURCE == "auto":
+        try:
+            hello = await db.command("hello")
+        except Exception:
+            hello = {}
+        supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        live_source = "change_stream" if supported else "handlers"
+    if live_source == "handlers":
+        print(
+            "Warning: live booking events come from this worker's handlers only; "
+            "with more than one worker subscribers miss other workers' writes. "
+            "Use a replica set so the change stream source can be used."
+        )
+    return live_source
+
+def publish_booking(kind, action, booking):
+    """Called by write handlers; a no-op when the change stream feeds the broker"""
+    if booking and live_source == "handlers":
+        broker.publish(kind, action, booking)
+
+def _format(event):
+    if event["type"] == "resync":
+        data = {"type": "resync"}
+    else:
+        data = {"type": event["type"], "booking": event["booking"]}
+    return f"id: {event['id']}\nevent: {data['type']}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def event_stream(request, subscriber: Subscriber):
+    """Yield SSE frames until the client disconnects"""
+    try:
+        yield "retry: 3000\n: connected\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), LIVE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": heartbeat\n\n"
+                continue
+            yield _format(event)
+            if event["type"] == "resync":
+                subscriber.overflowed = False
+    finally:
+        broker.unsubscribe(subscriber)
+
+def _action_for(change):
+    operation = change["operationType"]
+    if operation == "insert":
+        return "created"
+    document = change.get("fullDocument") or {}
+    if document.get("status") == "cancelled":
+        return "cancelled"
+    return "updated"
+
+async def watch_collection(collection, kind):
+    """Feed the broker from a change stream; started from the app lifespan"""
+    while True:
+        try:
+            async with collection.watch(
+                [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}],
+                full_document="updateLookup",
+            ) as stream:
+                async for change in stream:
+                    if change.get("fullDocument"):
+                        broker.publish(kind, _action_for(change), change["fullDocument"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Change stream for {kind} failed: {e}; retrying")
+            await asyncio.sleep(5)
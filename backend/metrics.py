@@ -0,0 +1,251 @@
+"""Request and database instrumentation exported in Prometheus text format.
+
+MetricsMiddleware records per-route latency, status codes and response
+bytes. CommandMetrics is a pymongo command listener that attributes each
+Mongo round trip to the request being served (Motor copies context vars
+onto its executor threads), so N+1 query patterns show up per route.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+DB_OPS_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+class RequestStats:
+    """Per-request counters filled in by the command listener"""
+
+    __slots__ = ("db_ops", "db_time", "scope")
+
+    def __init__(self, scope=None):
+        self.db_ops = 0
+        self.db_time = 0.0
+        self.scope = scope
+
+    @property
+    def route(self):
+        """Route path template once routing has matched, else the raw path"""
+        if self.scope is None:
+            return None
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope.get("path")
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+def _labels(names, values, extra=""):
+    parts = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """Minimal thread-safe registry of labelled counters and histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, dict] = {}
+
+    def _metric(self, name, kind, help_text, label_names, buckets=None):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = {
+                "kind": kind, "help": help_text, "labels": label_names,
+                "buckets": buckets, "series": {},
+            }
+            self._metrics[name] = metric
+        return metric
+
+    def inc(self, name, help_text, label_names: Tuple[str, ...], label_values: Tuple, amount=1):
+        with self._lock:
+            series = self._metric(name, "counter", help_text, label_names)["series"]
+            series[label_values] = series.get(label_values, 0) + amount
+
+    def set(self, name, help_text, label_names: Tuple[str, ...], label_values: Tuple, value):
+        with self._lock:
+            self._metric(name, "gauge", help_text, label_names)["series"][label_values] = value
+
+    def observe(self, name, help_text, label_names: Tuple[str, ...], label_values: Tuple, value, buckets):
+        with self._lock:
+            series = self._metric(name, "histogram", help_text, label_names, buckets)["series"]
+            histogram = series.get(label_values)
+            if histogram is None:
+                histogram = series[label_values] = Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, metric in sorted(self._metrics.items()):
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['kind']}")
+                label_names = metric["labels"]
+                for values, data in sorted(metric["series"].items()):
+                    if metric["kind"] != "histogram":
+                        lines.append(f"{name}{_labels(label_names, values)} {_format_number(data)}")
+                        continue
+                    cumulative = 0
+                    inf = 'le="+Inf"'
+                    for bound, count in zip(data.buckets, data.counts):
+                        cumulative += count
+                        le = f'le="{_format_number(bound)}"'
+                        lines.append(f"{name}_bucket{_labels(label_names, values, le)} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(label_names, values, inf)} {data.count}")
+                    lines.append(f"{name}_sum{_labels(label_names, values)} {_format_number(data.total)}")
+                    lines.append(f"{name}_count{_labels(label_names, values)} {data.count}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+ROUTE_LABELS = ("method", "route")
+
+def record_request(method, route, status_code, elapsed, response_bytes, stats: RequestStats):
+    labels = (method, route)
+    registry.inc(
+        "http_requests_total", "HTTP requests by route and status code",
+        ("method", "route", "status"), (method, route, str(status_code)),
+    )
+    registry.observe(
+        "http_request_duration_seconds", "HTTP request latency by route",
+        ROUTE_LABELS, labels, elapsed, LATENCY_BUCKETS,
+    )
+    registry.observe(
+        "http_response_bytes", "HTTP response body size by route",
+        ROUTE_LABELS, labels, response_bytes, BYTES_BUCKETS,
+    )
+    registry.observe(
+        "http_request_db_operations", "MongoDB round trips per request by route",
+        ROUTE_LABELS, labels, stats.db_ops, DB_OPS_BUCKETS,
+    )
+    registry.observe(
+        "http_request_db_seconds", "Time spent in MongoDB per request by route",
+        ROUTE_LABELS, labels, stats.db_time, LATENCY_BUCKETS,
+    )
+
+def set_gauges(prefix, help_text, values: Dict):
+    """Publish a flat dict of numbers (e.g. pool stats) as unlabelled gauges"""
+    for key, value in values.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            registry.set(f"{prefix}_{key}", help_text, (), (), value)
+
+class CommandMetrics(monitoring.CommandListener):
+    """Counts Mongo commands and attributes them to the current request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finished(self, event, failed):
+        elapsed = event.duration_micros / 1_000_000
+        stats = current_request.get()
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+            if stats is not None:
+                stats.db_ops += 1
+                stats.db_time += elapsed
+        labels = (event.command_name, collection)
+        registry.inc(
+            "mongo_commands_total", "MongoDB commands by command and collection",
+            ("command", "collection"), labels,
+        )
+        registry.observe(
+            "mongo_command_duration_seconds", "MongoDB command latency",
+            ("command", "collection"), labels, elapsed, LATENCY_BUCKETS,
+        )
+        if failed:
+            registry.inc(
+                "mongo_command_failures_total", "Failed MongoDB commands",
+                ("command", "collection"), labels,
+            )
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+command_metrics = CommandMetrics()
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and payload size per route.
+
+    Routes are labelled by their path template (e.g. /api/doctors/{doctor_id})
+    so label cardinality stays bounded. A Server-Timing header carries the
+    request's DB round trips for quick inspection in browser dev tools.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_ops} queries"'.encode(),
+                ))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            record_request(
+                scope["method"], route_label, status_code,
+                time.perf_counter() - started, response_bytes, stats,
+            )
@@ -7,6 +7,11 @@ import uuid
 def generate_uuid():
     return str(uuid.uuid4())
 
+def normalize_phone(phone: Optional[str]) -> str:
+    """Last 10 digits, so +92-300-1234567, 0300 1234567 and 923001234567 match"""
+    digits = "".join(c for c in phone or "" if c.isdigit())
+    return digits[-10:]
+
 # Enums
 class AppointmentStatus(str, Enum):
     NEW = "new"
@@ -79,6 +84,8 @@ class Doctor(BaseModel):
     qualifications: str
     bio: Optional[str] = None
     photo: Optional[str] = None
+    photo_image_id: Optional[str] = None
+    photo_variants: Optional[dict] = None  # {"thumb": {"webp": url, "jpeg": url, ...}, "medium": ...}
     fee: str = "Call for price"
     tags: List[str] = []
     gender: Optional[Gender] = None
@@ -143,6 +150,7 @@ class Appointment(BaseModel):
     date_time: str
     patient_name: str
     patient_phone: str
+    patient_phone_normalized: Optional[str] = None
     patient_email: Optional[str] = None
     patient_gender: Optional[Gender] = None
     patient_dob: Optional[str] = None
@@ -196,6 +204,7 @@ class DiagnosticBooking(BaseModel):
     date_time: str
     patient_name: str
     patient_phone: str
+    patient_phone_normalized: Optional[str] = None
     patient_email: Optional[str] = None
     patient_gender: Optional[Gender] = None
     patient_dob: Optional[str] = None
@@ -203,6 +212,49 @@ class DiagnosticBooking(BaseModel):
     notes: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Bulk updates (reception end-of-day processing)
+class BulkBookingUpdate(BaseModel):
+    updates: List[dict]  # each {"id": ..., plus the fields to change}
+
+# Waitlist (freed slots are offered in request order)
+class WaitlistStatus(str, Enum):
+    WAITING = "waiting"
+    OFFERED = "offered"
+    BOOKED = "booked"
+    DECLINED = "declined"
+    EXPIRED = "expired"
+    CANCELLED = "cancelled"
+
+class WaitlistEntryCreate(BaseModel):
+    doctor_id: str
+    date_from: str  # YYYY-MM-DD
+    date_to: str
+    patient_name: str
+    patient_phone: str
+    patient_email: Optional[str] = None
+    patient_gender: Optional[Gender] = None
+    patient_dob: Optional[str] = None
+    notes: Optional[str] = None
+
+class WaitlistOfferResponse(BaseModel):
+    token: str
+
+# Walk-in token queue
+class QueueTokenStatus(str, Enum):
+    WAITING = "waiting"
+    CALLED = "called"
+    SERVED = "served"
+    SKIPPED = "skipped"
+
+class WalkInTokenCreate(BaseModel):
+    doctor_id: str
+    patient_name: str
+    patient_phone: Optional[str] = None
+    notes: Optional[str] = None
+
+class QueueTokenUpdate(BaseModel):
+    status: QueueTokenStatus
+
 # Blog Models
 class BlogPostCreate(BaseModel):
     title: str
@@ -227,6 +279,8 @@ class BlogPost(BaseModel):
     tags: List[str] = []
     author: str = "Admin"
     featured_image: Optional[str] = None
+    featured_image_image_id: Optional[str] = None
+    featured_image_variants: Optional[dict] = None
     meta_title: Optional[str] = None
     meta_description: Optional[str] = None
     published: bool = True
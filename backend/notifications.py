@@ -0,0 +1,82 @@
+"""Outbox of patient notifications.
+
+Jobs that touch many bookings at once (rescheduling, waitlist offers)
+queue one document per patient here with a single insert_many instead
+of sending inline. A background loop delivers the emails; the WhatsApp
+text stays on the document for reception, who work through the
+unacknowledged list in the admin panel.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from pymongo import ReturnDocument
+
+from database import notifications_collection
+from email_service import send_email
+from metrics import registry
+
+NOTIFICATION_POLL_SECONDS = int(os.environ.get("NOTIFICATION_POLL_SECONDS", "10"))
+NOTIFICATION_BATCH_SIZE = int(os.environ.get("NOTIFICATION_BATCH_SIZE", "100"))
+# Claimed emails a crashed worker never finished are retried after this
+SENDING_TIMEOUT = timedelta(minutes=10)
+
+async def queue_notifications(notifications: List[dict]) -> int:
+    """Insert notifications; each needs type, patient fields, subject, message and whatsapp_message"""
+    if not notifications:
+        return 0
+    now = datetime.utcnow()
+    for notification in notifications:
+        notification["id"] = str(uuid.uuid4())
+        notification["email_status"] = "pending" if notification.get("patient_email") else "skipped"
+        notification["acknowledged"] = False
+        notification["created_at"] = now
+    await notifications_collection.insert_many(notifications, ordered=False)
+    registry.inc(
+        "notifications_queued_total", "Patient notifications queued",
+        ("type",), (notifications[0]["type"],), len(notifications),
+    )
+    return len(notifications)
+
+async def deliver_pending(limit: int = NOTIFICATION_BATCH_SIZE) -> int:
+    """Send up to ``limit`` pending emails; each is claimed atomically so workers never double-send.
+
+    A claim older than SENDING_TIMEOUT is taken over, so a worker that died
+    mid-send delays an email rather than losing it.
+    """
+    sent = 0
+    for _ in range(limit):
+        now = datetime.utcnow()
+        notification = await notifications_collection.find_one_and_update(
+            {"$or": [
+                {"email_status": "pending"},
+                {"email_status": "sending", "claimed_at": {"$lt": now - SENDING_TIMEOUT}},
+            ]},
+            {"$set": {"email_status": "sending", "claimed_at": now}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if not notification:
+            break
+        ok = await send_email(notification["patient_email"], notification["subject"], notification["message"])
+        await notifications_collection.update_one(
+            {"id": notification["id"]},
+            {"$set": {"email_status": "sent" if ok else "failed", "sent_at": datetime.utcnow()}},
+        )
+        registry.inc(
+            "notifications_delivered_total", "Notification emails by outcome",
+            ("outcome",), ("sent" if ok else "failed",),
+        )
+        sent += ok
+    return sent
+
+async def run_delivery_loop(interval: int = NOTIFICATION_POLL_SECONDS):
+    """Background task started by the app lifespan"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await deliver_pending()
+        except Exception as e:
+            print(f"Error delivering notifications: {e}")
@@ -0,0 +1,99 @@
+"""Collision-free booking reference numbers.
+
+References used to be ``APT-`` plus eight random hex digits. That is a
+32-bit space, where birthday collisions become likely after tens of
+thousands of bookings and then surface as a DuplicateKeyError on the
+unique reference_number index.
+
+Each prefix now has a counter document in ``counters``. A worker
+reserves a block of REFERENCE_BLOCK_SIZE numbers with one atomic $inc
+and hands them out from memory, so minting a reference normally needs
+no round trip and two workers can never produce the same number. The
+unused part of a block is skipped when the process restarts.
+
+The number is written as at least eight digits plus a Luhn check digit
+(``APT-000012344``). Such references are easy to read over the phone,
+typos are caught before a lookup, and with nine or more characters they
+can never equal a legacy eight-character hex reference.
+"""
+import asyncio
+import os
+import re
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import counters_collection
+from metrics import registry
+
+REFERENCE_BLOCK_SIZE = int(os.environ.get("REFERENCE_BLOCK_SIZE", "100"))
+
+REFERENCE_PATTERN = re.compile(r"^[A-Z]+-(\d{9,})$")
+
+def luhn_digit(digits: str) -> str:
+    """Check digit that makes ``digits`` plus it pass the Luhn test"""
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = int(ch)
+        if i % 2 == 0:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return str((10 - total % 10) % 10)
+
+def format_reference(prefix: str, number: int) -> str:
+    digits = f"{number:08d}"
+    return f"{prefix}-{digits}{luhn_digit(digits)}"
+
+def is_valid_reference(reference: str) -> bool:
+    """False only for a sequential reference whose check digit is wrong; legacy ones pass"""
+    match = REFERENCE_PATTERN.match(reference)
+    if not match:
+        return True
+    digits = match.group(1)
+    return luhn_digit(digits[:-1]) == digits[-1]
+
+class ReferenceAllocator:
+    """Hands out sequential references for one prefix from reserved blocks"""
+
+    def __init__(self, prefix: str, block_size: int = REFERENCE_BLOCK_SIZE):
+        self.prefix = prefix
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def _reserve(self):
+        for attempt in range(2):
+            try:
+                counter = await counters_collection.find_one_and_update(
+                    {"id": f"reference:{self.prefix}"},
+                    {"$inc": {"value": self.block_size}},
+                    projection={"_id": 0, "value": 1},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                break
+            except DuplicateKeyError:
+                # Two workers created the counter at once; the retry finds the document
+                if attempt:
+                    raise
+        self._next = counter["value"] - self.block_size + 1
+        self._end = counter["value"] + 1
+        registry.inc(
+            "reference_blocks_reserved_total", "Reference number blocks reserved from the counter",
+            ("prefix",), (self.prefix,),
+        )
+
+    async def next(self) -> str:
+        if self._next >= self._end:
+            async with self._lock:
+                if self._next >= self._end:
+                    await self._reserve()
+        number = self._next
+        self._next += 1
+        return format_reference(self.prefix, number)
+
+appointment_references = ReferenceAllocator("APT")
+diagnostic_references = ReferenceAllocator("DGN")
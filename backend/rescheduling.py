@@ -0,0 +1,338 @@
+"""Automatic rescheduling of appointments displaced by a schedule exception.
+
+When a leave day (or shortened hours) is added for a doctor, the new and
+confirmed appointments that no longer fit are found with one indexed
+query and moved in bulk:
+
+1. Availability for the doctor and their active same-specialty colleagues
+   over RESCHEDULE_HORIZON_DAYS is loaded with three queries (schedules,
+   exceptions, booked times) and expanded into free slot offsets with
+   slots.py.
+2. All free slots become flat NumPy arrays of absolute minutes. Each
+   displaced appointment, earliest first, takes the slot with the lowest
+   cost: distance from the original time, plus
+   RESCHEDULE_OTHER_DOCTOR_PENALTY_MINUTES when it is with a colleague.
+3. Target slots booked or held since step 1 are dropped with one more
+   query. The remaining moves are applied with one bulk_write, guarded on
+   the original doctor, time and status so concurrent edits by reception
+   win; the unique active-slot index rejects any move that would still
+   double-book. A notification per moved patient is queued in the outbox.
+
+A job whose worker died is picked up again by run_stale_job_loop after
+RESCHEDULE_JOB_TIMEOUT_MINUTES; the plan is recomputed from current data,
+so appointments the first run already moved are not moved twice.
+
+Appointments with no free slot in the horizon are left untouched and
+listed as ``unplaced`` on the job for reception to handle.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import (
+    appointments_collection, doctors_collection, schedules_collection,
+    schedule_exceptions_collection, reschedule_jobs_collection, slot_holds_collection
+)
+from email_service import get_reschedule_message, get_reschedule_whatsapp_message
+from live_events import publish_booking
+from metrics import registry
+from notifications import queue_notifications
+from slots import booked_offsets, day_window, free_offsets, parse_minutes, slot_offsets
+
+RESCHEDULE_HORIZON_DAYS = int(os.environ.get("RESCHEDULE_HORIZON_DAYS", "14"))
+RESCHEDULE_OTHER_DOCTOR_PENALTY_MINUTES = int(os.environ.get("RESCHEDULE_OTHER_DOCTOR_PENALTY_MINUTES", "1440"))
+RESCHEDULE_MIN_NOTICE_MINUTES = int(os.environ.get("RESCHEDULE_MIN_NOTICE_MINUTES", "60"))
+RESCHEDULE_JOB_TIMEOUT = timedelta(minutes=int(os.environ.get("RESCHEDULE_JOB_TIMEOUT_MINUTES", "10")))
+RESCHEDULE_JOB_MAX_ATTEMPTS = int(os.environ.get("RESCHEDULE_JOB_MAX_ATTEMPTS", "3"))
+RESCHEDULE_STALE_POLL_SECONDS = int(os.environ.get("RESCHEDULE_STALE_POLL_SECONDS", "60"))
+
+ACTIVE_STATUSES = ["new", "confirmed"]
+EPOCH = datetime(1970, 1, 1)
+
+# Running jobs, kept referenced until they finish
+_jobs = set()
+
+def _absolute_minutes(date_time: str) -> int:
+    day = datetime.strptime(date_time[:10], "%Y-%m-%d")
+    return (day - EPOCH).days * 1440 + parse_minutes(date_time[11:16])
+
+def _format_minutes(minutes: int) -> str:
+    return (EPOCH + timedelta(minutes=int(minutes))).strftime("%Y-%m-%d %H:%M")
+
+def affects_bookings(exception: dict) -> bool:
+    return not exception.get("is_available", False) or bool(
+        exception.get("custom_start_time") or exception.get("custom_end_time")
+    )
+
+async def find_displaced(exception: dict) -> List[dict]:
+    """Active appointments on the exception's date that fall outside its hours"""
+    date = exception["date"]
+    next_date = (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    appointments = await appointments_collection.find({
+        "doctor_id": exception["doctor_id"],
+        "date_time": {"$gte": date, "$lt": next_date},
+        "status": {"$in": ACTIVE_STATUSES},
+    }, {"_id": 0}).sort("date_time", 1).to_list(None)
+    if not appointments or not exception.get("is_available", False):
+        return appointments
+
+    schedule = await schedules_collection.find_one({
+        "doctor_id": exception["doctor_id"],
+        "day_of_week": datetime.strptime(date, "%Y-%m-%d").weekday(),
+        "active": True,
+    })
+    window, _ = day_window(schedule, exception)
+    if window is None:
+        return appointments
+    valid = set(slot_offsets(*window).tolist())
+    return [apt for apt in appointments if parse_minutes(apt["date_time"][11:16]) not in valid]
+
+async def load_free_slots(doctor_ids: List[str], start: datetime, days: int, exception: dict, not_before: int):
+    """Flat arrays (absolute minute, doctor index) of every free slot in the horizon"""
+    start_date = start.strftime("%Y-%m-%d")
+    end_date = (start + timedelta(days=days)).strftime("%Y-%m-%d")
+    schedules, exceptions, booked = await asyncio.gather(
+        schedules_collection.find({"doctor_id": {"$in": doctor_ids}, "active": True}, {"_id": 0}).to_list(None),
+        schedule_exceptions_collection.find(
+            {"doctor_id": {"$in": doctor_ids}, "date": {"$gte": start_date, "$lt": end_date}}, {"_id": 0}
+        ).to_list(None),
+        appointments_collection.find({
+            "doctor_id": {"$in": doctor_ids},
+            "date_time": {"$gte": start_date, "$lt": end_date},
+            "status": {"$in": ACTIVE_STATUSES},
+        }, {"_id": 0, "doctor_id": 1, "date_time": 1}).to_list(None),
+    )
+    schedule_map: Dict[tuple, dict] = {}
+    for schedule in schedules:
+        schedule_map.setdefault((schedule["doctor_id"], schedule["day_of_week"]), schedule)
+    exception_map: Dict[tuple, dict] = {}
+    for e in exceptions:
+        exception_map.setdefault((e["doctor_id"], e["date"]), e)
+    # The exception being applied wins over any older one for that day
+    exception_map[(exception["doctor_id"], exception["date"])] = exception
+    booked_map: Dict[str, Dict[str, List[str]]] = {}
+    for b in booked:
+        booked_map.setdefault(b["doctor_id"], {}).setdefault(b["date_time"][:10], []).append(b["date_time"])
+
+    minutes, owners = [], []
+    for index, doctor_id in enumerate(doctor_ids):
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            date = day.strftime("%Y-%m-%d")
+            window, _ = day_window(schedule_map.get((doctor_id, day.weekday())), exception_map.get((doctor_id, date)))
+            if window is None:
+                continue
+            free = free_offsets(slot_offsets(*window), booked_offsets(booked_map.get(doctor_id, {}).get(date, [])))
+            absolute = (day - EPOCH).days * 1440 + free.astype(np.int64)
+            absolute = absolute[absolute >= not_before]
+            minutes.append(absolute)
+            owners.append(np.full(absolute.size, index, dtype=np.int32))
+    if not minutes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+    return np.concatenate(minutes), np.concatenate(owners)
+
+def assign_slots(displaced: List[dict], slot_minutes: np.ndarray, slot_owners: np.ndarray, same_doctor_index: int = 0):
+    """Greedy nearest-slot assignment; returns (appointment, minute, doctor index) or None per appointment"""
+    taken = np.zeros(slot_minutes.size, dtype=bool)
+    penalty = np.where(slot_owners == same_doctor_index, 0, RESCHEDULE_OTHER_DOCTOR_PENALTY_MINUTES)
+    assignments = []
+    for apt in displaced:
+        if taken.all():
+            assignments.append((apt, None, None))
+            continue
+        cost = np.abs(slot_minutes - _absolute_minutes(apt["date_time"])) + penalty
+        cost = np.where(taken, np.iinfo(np.int64).max, cost)
+        best = int(np.argmin(cost))
+        taken[best] = True
+        assignments.append((apt, int(slot_minutes[best]), int(slot_owners[best])))
+    return assignments
+
+async def reschedule_for_exception(exception: dict, job_id: Optional[str] = None) -> dict:
+    """Move appointments displaced by ``exception``; returns the job summary"""
+    started = datetime.utcnow()
+    displaced = await find_displaced(exception)
+    summary = {"affected": len(displaced), "moved": [], "unplaced": []}
+    if not displaced:
+        return summary
+
+    doctor = await doctors_collection.find_one({"id": exception["doctor_id"]}, {"_id": 0})
+    colleagues = []
+    if doctor and doctor.get("specialty_id"):
+        colleagues = await doctors_collection.find(
+            {"specialty_id": doctor["specialty_id"], "active": True, "id": {"$ne": exception["doctor_id"]}},
+            {"_id": 0, "id": 1, "name": 1},
+        ).to_list(None)
+    doctor_ids = [exception["doctor_id"]] + [c["id"] for c in colleagues]
+    doctor_names = {c["id"]: c["name"] for c in colleagues}
+    doctor_names[exception["doctor_id"]] = doctor["name"] if doctor else "Doctor"
+
+    not_before = _absolute_minutes(started.strftime("%Y-%m-%d %H:%M")) + RESCHEDULE_MIN_NOTICE_MINUTES
+    search_from = datetime.strptime(exception["date"], "%Y-%m-%d") - timedelta(days=RESCHEDULE_HORIZON_DAYS // 2)
+    search_from = max(search_from, started.replace(hour=0, minute=0, second=0, microsecond=0))
+    slot_minutes, slot_owners = await load_free_slots(
+        doctor_ids, search_from, RESCHEDULE_HORIZON_DAYS + 1, exception, not_before
+    )
+
+    planned = []
+    for apt, minute, owner in assign_slots(displaced, slot_minutes, slot_owners):
+        if minute is None:
+            summary["unplaced"].append({"id": apt["id"], "reference_number": apt.get("reference_number")})
+            continue
+        planned.append((apt, {
+            "id": apt["id"],
+            "reference_number": apt.get("reference_number"),
+            "from_doctor_id": apt["doctor_id"],
+            "from_date_time": apt["date_time"],
+            "to_doctor_id": doctor_ids[owner],
+            "to_date_time": _format_minutes(minute),
+        }))
+
+    # Slots booked or held while the plan was computed are no longer free
+    targets = [{"doctor_id": move["to_doctor_id"], "date_time": move["to_date_time"]} for _, move in planned]
+    taken = set()
+    if targets:
+        booked, held = await asyncio.gather(
+            appointments_collection.find(
+                {"$or": targets, "status": {"$in": ACTIVE_STATUSES}}, {"_id": 0, "doctor_id": 1, "date_time": 1}
+            ).to_list(None),
+            slot_holds_collection.find({"$or": targets}, {"_id": 0, "doctor_id": 1, "date_time": 1}).to_list(None),
+        )
+        taken = {(doc["doctor_id"], doc["date_time"]) for doc in booked + held}
+
+    operations = []
+    for apt, move in planned:
+        if (move["to_doctor_id"], move["to_date_time"]) in taken:
+            # Left unapplied; reported as unplaced below
+            continue
+        operations.append(UpdateOne(
+            {"id": apt["id"], "doctor_id": apt["doctor_id"], "date_time": apt["date_time"], "status": {"$in": ACTIVE_STATUSES}},
+            {"$set": {
+                "doctor_id": move["to_doctor_id"],
+                "date_time": move["to_date_time"],
+                "rescheduled_from": {
+                    "doctor_id": apt["doctor_id"],
+                    "date_time": apt["date_time"],
+                    "exception_id": exception.get("id"),
+                    "job_id": job_id,
+                    "at": started,
+                },
+            }},
+        ))
+    if operations:
+        try:
+            await appointments_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Moves onto a slot booked after the re-check hit the unique index
+            print(f"Rescheduling skipped {len(e.details.get('writeErrors', []))} conflicting moves")
+
+    # Only report and notify moves that actually applied
+    moved_ids = [move["id"] for _, move in planned]
+    current = {
+        doc["id"]: doc
+        for doc in await appointments_collection.find({"id": {"$in": moved_ids}}, {"_id": 0}).to_list(None)
+    }
+    notifications = []
+    for apt, move in planned:
+        doc = current.get(move["id"])
+        if not doc or doc.get("date_time") != move["to_date_time"] or doc.get("doctor_id") != move["to_doctor_id"]:
+            summary["unplaced"].append({"id": apt["id"], "reference_number": apt.get("reference_number")})
+            continue
+        summary["moved"].append(move)
+        publish_booking("appointment", "updated", doc)
+        doctor_name = doctor_names.get(move["to_doctor_id"], "Doctor")
+        subject, message = get_reschedule_message(
+            apt.get("patient_name"), apt.get("reference_number"),
+            move["from_date_time"], move["to_date_time"], doctor_name,
+        )
+        notifications.append({
+            "type": "appointment_rescheduled",
+            "booking_kind": "appointment",
+            "booking_id": apt["id"],
+            "reference_number": apt.get("reference_number"),
+            "patient_name": apt.get("patient_name"),
+            "patient_phone": apt.get("patient_phone"),
+            "patient_email": apt.get("patient_email"),
+            "subject": subject,
+            "message": message,
+            "whatsapp_message": get_reschedule_whatsapp_message(
+                apt.get("patient_name"), apt.get("reference_number"), move["to_date_time"], doctor_name
+            ),
+        })
+    await queue_notifications(notifications)
+    registry.inc(
+        "rescheduled_appointments_total", "Appointments displaced by schedule exceptions",
+        ("outcome",), ("moved",), len(summary["moved"]),
+    )
+    registry.inc(
+        "rescheduled_appointments_total", "Appointments displaced by schedule exceptions",
+        ("outcome",), ("unplaced",), len(summary["unplaced"]),
+    )
+    return summary
+
+async def _run_job(job_id: str, exception: dict):
+    try:
+        summary = await reschedule_for_exception(exception, job_id)
+        update = {"status": "completed", **summary}
+    except Exception as e:
+        print(f"Rescheduling job {job_id} failed: {e}")
+        update = {"status": "failed", "error": str(e)}
+    update["finished_at"] = datetime.utcnow()
+    await reschedule_jobs_collection.update_one({"id": job_id}, {"$set": update})
+
+async def start_reschedule_job(exception: dict) -> str:
+    """Record a job and run it in the background; returns the job id"""
+    job_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    await reschedule_jobs_collection.insert_one({
+        "id": job_id,
+        "exception_id": exception.get("id"),
+        "doctor_id": exception["doctor_id"],
+        "date": exception["date"],
+        "status": "running",
+        "attempts": 1,
+        "created_at": now,
+        "claimed_at": now,
+    })
+    task = asyncio.create_task(_run_job(job_id, exception))
+    _jobs.add(task)
+    task.add_done_callback(_jobs.discard)
+    return job_id
+
+async def resume_stale_jobs() -> int:
+    """Re-run jobs still "running" long after their worker claimed them"""
+    resumed = 0
+    while True:
+        now = datetime.utcnow()
+        job = await reschedule_jobs_collection.find_one_and_update(
+            {"status": "running", "claimed_at": {"$lt": now - RESCHEDULE_JOB_TIMEOUT}},
+            {"$set": {"claimed_at": now}, "$inc": {"attempts": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not job:
+            return resumed
+        exception = await schedule_exceptions_collection.find_one({"id": job.get("exception_id")}, {"_id": 0})
+        if exception is None or job.get("attempts", 1) > RESCHEDULE_JOB_MAX_ATTEMPTS:
+            error = "Schedule exception was deleted" if exception is None else "Gave up after repeated interruptions"
+            await reschedule_jobs_collection.update_one(
+                {"id": job["id"]}, {"$set": {"status": "failed", "error": error, "finished_at": now}}
+            )
+            continue
+        print(f"Resuming interrupted rescheduling job {job['id']}")
+        await _run_job(job["id"], exception)
+        resumed += 1
+
+async def run_stale_job_loop(interval: int = RESCHEDULE_STALE_POLL_SECONDS):
+    """Background task started by the app lifespan"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await resume_stale_jobs()
+        except Exception as e:
+            print(f"Error resuming rescheduling jobs: {e}")
@@ -1,5 +1,10 @@
-from fastapi import FastAPI, HTTPException, Depends, Query, status
+from fastapi import FastAPI, HTTPException, Depends, File, Header, Query, Request, Response, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from contextlib import asynccontextmanager
+import asyncio
 from typing import List, Optional
 from datetime import datetime, timedelta
 import os
@@ -9,30 +14,96 @@ import uuid
 load_dotenv()
 
 from database import (
-    db, init_db, users_collection, specialties_collection, doctors_collection,
-    schedules_collection, schedule_exceptions_collection, appointments_collection,
+    connect, close, get_db, pool_metrics, init_db, run_phone_backfill, users_collection, specialties_collection,
+    doctors_collection, schedules_collection, schedule_exceptions_collection, appointments_collection,
     diagnostic_tests_collection, diagnostic_bookings_collection, blog_posts_collection,
-    contact_messages_collection, settings_collection
+    contact_messages_collection, settings_collection,
+    appointments_reporting_collection, diagnostic_bookings_reporting_collection,
+    doctors_reporting_collection, diagnostic_tests_reporting_collection,
+    contact_messages_reporting_collection, specialties_catalog_collection,
+    doctors_catalog_collection, schedules_catalog_collection,
+    diagnostic_tests_catalog_collection, blog_posts_catalog_collection,
+    settings_catalog_collection, slow_queries_collection,
+    appointments_archive_collection, diagnostic_bookings_archive_collection,
+    appointments_archive_reporting_collection, diagnostic_bookings_archive_reporting_collection,
+    notifications_collection, reschedule_jobs_collection, waitlist_collection, queue_tokens_collection,
+    images_collection
 )
 from models import (
     UserCreate, UserLogin, User, Specialty, SpecialtyCreate,
     Doctor, DoctorCreate, DoctorSchedule, DoctorScheduleCreate,
     ScheduleException, ScheduleExceptionCreate, Appointment, AppointmentCreate,
     DiagnosticTest, DiagnosticTestCreate, DiagnosticBooking, DiagnosticBookingCreate,
-    BlogPost, BlogPostCreate, ContactMessage, SiteSettings, AppointmentStatus, UserRole
+    BulkBookingUpdate, WaitlistEntryCreate, WaitlistOfferResponse, WaitlistStatus,
+    WalkInTokenCreate, QueueTokenUpdate, BlogPost, BlogPostCreate, ContactMessage, SiteSettings, AppointmentStatus, UserRole,
+    normalize_phone
 )
 from auth import (
-    get_password_hash, verify_password, create_access_token,
-    get_current_user, require_admin
+    get_password_hash, verify_password, create_access_token, create_stream_token,
+    decode_token, decode_stream_token, get_current_user, require_admin
 )
 from email_service import send_booking_confirmation_email, get_whatsapp_message
+from metrics import MetricsMiddleware, registry as metrics_registry, set_gauges
+from slow_queries import slow_query_log, run_flush_loop
+from coalescing import coalesce
+from admission import AdmissionMiddleware, check_rate_limits
+from compression import CompressionMiddleware
+from idempotency import run_idempotent
+from columnar_export import (
+    APPOINTMENT_SCHEMA, DIAGNOSTIC_BOOKING_SCHEMA, FORMATS as COLUMNAR_FORMATS, stream_bookings
+)
+from slots import booked_offsets, bookings_by_date, day_window, format_slots, free_offsets, slot_offsets
+from notifications import run_delivery_loop
+from rescheduling import affects_bookings, run_stale_job_loop, start_reschedule_job
+from waitlist import (
+    complete_offer, find_offer, freed_slot, held_times, is_held, join_waitlist, release_offer,
+    run_expiry_loop, schedule_backfill
+)
+import token_queue
+from references import appointment_references, diagnostic_references, is_valid_reference
+from images import CACHE_CONTROL, apply_variant, file_for, link_image, run_image_worker, store_original
+import snapshots
+from snapshots import mark_stale, run_snapshot_worker
+from analytics import heatmap_report, utilization_report
+from archival import ARCHIVE_INTERVAL_HOURS, find_across, may_be_archived, run_archival, run_archive_loop
+from live_events import (
+    Subscriber, broker, event_stream, publish_booking, resolve_source as resolve_live_source, watch_collection
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect()
+    await init_db()
+    await seed_initial_data()
+    background_tasks = [
+        asyncio.create_task(run_flush_loop(get_db)),
+        asyncio.create_task(run_delivery_loop()),
+        asyncio.create_task(run_expiry_loop()),
+        asyncio.create_task(run_image_worker()),
+        asyncio.create_task(run_snapshot_worker()),
+        asyncio.create_task(run_phone_backfill()),
+        asyncio.create_task(run_stale_job_loop()),
+    ]
+    if ARCHIVE_INTERVAL_HOURS > 0:
+        background_tasks.append(asyncio.create_task(run_archive_loop()))
+    if await resolve_live_source(get_db()) == "change_stream":
+        background_tasks.append(asyncio.create_task(watch_collection(appointments_collection, "appointment")))
+        background_tasks.append(asyncio.create_task(watch_collection(diagnostic_bookings_collection, "diagnostic_booking")))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    close()
 
 app = FastAPI(
     title="Sadiqabad Medical Complex API",
     description="Hospital Management System API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Load shedding; registered first so CORS headers are added to 503s
+app.add_middleware(AdmissionMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -42,12 +113,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ==================== Startup Events ====================
-@app.on_event("startup")
-async def startup_event():
-    await init_db()
-    await seed_initial_data()
+# gzip/brotli for large JSON; inside metrics so payload sizes are the bytes sent
+app.add_middleware(CompressionMiddleware)
+
+# Per-route latency, payload and DB round-trip instrumentation
+app.add_middleware(MetricsMiddleware)
 
+# ==================== Startup Data ====================
 async def seed_initial_data():
     """Seed database with initial data if empty"""
     # Check if data exists
@@ -316,6 +388,32 @@ async def seed_initial_data():
 async def health_check():
     return {"status": "healthy", "service": "Sadiqabad Medical Complex API"}
 
+@app.get("/api/health/db-pool")
+async def get_db_pool_stats(current_user: dict = Depends(require_admin)):
+    """Connection pool utilization and checkout wait times for this worker"""
+    return pool_metrics.snapshot()
+
+@app.get("/api/health/slow-queries")
+async def get_slow_queries(limit: int = 50, current_user: dict = Depends(require_admin)):
+    """Top slow query shapes by total time, including explain results"""
+    await slow_query_log.flush(get_db())
+    entries = await slow_queries_collection.find().sort("total_ms", -1).to_list(limit)
+    for e in entries:
+        e.pop("_id", None)
+    return entries
+
+@app.delete("/api/health/slow-queries")
+async def reset_slow_queries(current_user: dict = Depends(require_admin)):
+    slow_query_log.reset()
+    await slow_queries_collection.delete_many({})
+    return {"message": "Slow query log cleared"}
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    set_gauges("mongo_pool", "MongoDB connection pool statistics", pool_metrics.snapshot())
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 # ==================== Authentication ====================
 @app.post("/api/auth/login")
 async def login(user_data: UserLogin):
@@ -363,8 +461,9 @@ async def register_user(user_data: UserCreate, current_user: dict = Depends(requ
 
 # ==================== Site Settings ====================
 @app.get("/api/settings")
+@coalesce("/api/settings")
 async def get_settings():
-    settings = await settings_collection.find_one({"id": "site_settings"})
+    settings = await settings_catalog_collection.find_one({"id": "site_settings"})
     if settings:
         settings.pop("_id", None)
     return settings or {}
@@ -377,20 +476,23 @@ async def update_settings(settings: dict, current_user: dict = Depends(require_a
         settings,
         upsert=True
     )
+    mark_stale("settings")
     return {"message": "Settings updated successfully"}
 
 # ==================== Specialties ====================
 @app.get("/api/specialties")
+@coalesce("/api/specialties")
 async def get_specialties(active_only: bool = True):
     query = {"active": True} if active_only else {}
-    specialties = await specialties_collection.find(query).to_list(100)
+    specialties = await specialties_catalog_collection.find(query).to_list(100)
     for s in specialties:
         s.pop("_id", None)
     return specialties
 
 @app.get("/api/specialties/{specialty_id}")
+@coalesce("/api/specialties/{specialty_id}")
 async def get_specialty(specialty_id: str):
-    specialty = await specialties_collection.find_one({"id": specialty_id})
+    specialty = await specialties_catalog_collection.find_one({"id": specialty_id})
     if not specialty:
         raise HTTPException(status_code=404, detail="Specialty not found")
     specialty.pop("_id", None)
@@ -407,6 +509,7 @@ async def create_specialty(specialty: SpecialtyCreate, current_user: dict = Depe
         "created_at": datetime.utcnow()
     }
     await specialties_collection.insert_one(data)
+    mark_stale("specialties", "doctors")
     return {"message": "Specialty created", "id": data["id"]}
 
 @app.put("/api/specialties/{specialty_id}")
@@ -417,6 +520,7 @@ async def update_specialty(specialty_id: str, specialty: SpecialtyCreate, curren
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Specialty not found")
+    mark_stale("specialties", "doctors")
     return {"message": "Specialty updated"}
 
 @app.delete("/api/specialties/{specialty_id}")
@@ -427,10 +531,12 @@ async def delete_specialty(specialty_id: str, current_user: dict = Depends(requi
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Specialty not found")
+    mark_stale("specialties", "doctors")
     return {"message": "Specialty deactivated"}
 
 # ==================== Doctors ====================
 @app.get("/api/doctors")
+@coalesce("/api/doctors")
 async def get_doctors(
     specialty_id: Optional[str] = None,
     active_only: bool = True,
@@ -442,10 +548,10 @@ async def get_doctors(
     if specialty_id:
         query["specialty_id"] = specialty_id
     
-    doctors = await doctors_collection.find(query).to_list(100)
+    doctors = await doctors_catalog_collection.find(query).to_list(100)
     
     # Get specialties for mapping
-    specialties = await specialties_collection.find().to_list(100)
+    specialties = await specialties_catalog_collection.find().to_list(100)
     specialty_map = {}
     for s in specialties:
         s.pop("_id", None)
@@ -454,6 +560,7 @@ async def get_doctors(
     result = []
     for doc in doctors:
         doc.pop("_id", None)
+        apply_variant(doc, "photo", "thumb")
         doc["specialty"] = specialty_map.get(doc.get("specialty_id"), {})
         if search:
             search_lower = search.lower()
@@ -465,20 +572,22 @@ async def get_doctors(
     return result
 
 @app.get("/api/doctors/{doctor_id}")
+@coalesce("/api/doctors/{doctor_id}")
 async def get_doctor(doctor_id: str):
-    doctor = await doctors_collection.find_one({"id": doctor_id})
+    doctor = await doctors_catalog_collection.find_one({"id": doctor_id})
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
     doctor.pop("_id", None)
+    apply_variant(doctor, "photo", "medium")
     
     # Get specialty
-    specialty = await specialties_collection.find_one({"id": doctor.get("specialty_id")})
+    specialty = await specialties_catalog_collection.find_one({"id": doctor.get("specialty_id")})
     if specialty:
         specialty.pop("_id", None)
         doctor["specialty"] = specialty
     
     # Get schedules
-    schedules = await schedules_collection.find({"doctor_id": doctor_id, "active": True}).to_list(100)
+    schedules = await schedules_catalog_collection.find({"doctor_id": doctor_id, "active": True}).to_list(100)
     for s in schedules:
         s.pop("_id", None)
     doctor["schedules"] = schedules
@@ -487,22 +596,24 @@ async def get_doctor(doctor_id: str):
 
 @app.post("/api/doctors")
 async def create_doctor(doctor: DoctorCreate, current_user: dict = Depends(require_admin)):
-    data = doctor.dict()
+    data = await link_image(doctor.dict(), "photo")
     data["id"] = str(uuid.uuid4())
     data["active"] = True
     data["created_at"] = datetime.utcnow()
     await doctors_collection.insert_one(data)
+    mark_stale("doctors")
     return {"message": "Doctor created", "id": data["id"]}
 
 @app.put("/api/doctors/{doctor_id}")
 async def update_doctor(doctor_id: str, doctor: DoctorCreate, current_user: dict = Depends(require_admin)):
-    data = doctor.dict()
+    data = await link_image(doctor.dict(), "photo")
     result = await doctors_collection.update_one(
         {"id": doctor_id},
         {"$set": data}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Doctor not found")
+    mark_stale("doctors")
     return {"message": "Doctor updated"}
 
 @app.delete("/api/doctors/{doctor_id}")
@@ -513,15 +624,73 @@ async def delete_doctor(doctor_id: str, current_user: dict = Depends(require_adm
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Doctor not found")
+    mark_stale("doctors")
     return {"message": "Doctor deactivated"}
 
+# ==================== Images ====================
+@app.post("/api/images")
+async def upload_image(file: UploadFile = File(...), current_user: dict = Depends(require_admin)):
+    """Store an original; use the returned url as a doctor photo or blog featured image"""
+    data = await file.read()
+    try:
+        image = await store_original(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"id": image["id"], "url": f"/api/images/{image['id']}", "status": image["status"],
+            "width": image["width"], "height": image["height"]}
+
+@app.get("/api/images/{name}")
+async def get_image(name: str):
+    """Originals and resized variants; names are content addressed so caches may keep them forever"""
+    found = file_for(name)
+    if not found:
+        raise HTTPException(status_code=404, detail="Image not found")
+    path, media_type = found
+    if media_type is None:
+        image = await images_collection.find_one({"id": name}, {"_id": 0, "media_type": 1})
+        media_type = (image or {}).get("media_type")
+    if not media_type or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": CACHE_CONTROL})
+
+# ==================== Static Snapshots ====================
+# Blog posts kept in the blog snapshot; the public list asks for fewer
+SNAPSHOT_BLOG_LIMIT = int(os.environ.get("SNAPSHOT_BLOG_LIMIT", "50"))
+
+snapshots.register("settings", lambda: get_settings())
+snapshots.register("specialties", lambda: get_specialties(active_only=True))
+snapshots.register("doctors", lambda: get_doctors(active_only=True))
+snapshots.register("diagnostic-tests", lambda: get_diagnostic_tests(active_only=True))
+snapshots.register("blog", lambda: get_blog_posts(published_only=True, limit=SNAPSHOT_BLOG_LIMIT))
+
+@app.get("/api/snapshots/{file_name}")
+async def get_snapshot(file_name: str, request: Request):
+    """Fallback for when the proxy does not serve SNAPSHOT_DIR itself; never touches Mongo"""
+    found = snapshots.file_for(file_name, request.headers.get("accept-encoding", ""))
+    if not found or not os.path.exists(found[0]):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    path, encoding = found
+    headers = {
+        "Cache-Control": snapshots.MANIFEST_CACHE_CONTROL if file_name == snapshots.MANIFEST else snapshots.CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path, media_type="application/json", headers=headers)
+
+@app.post("/api/snapshots/rebuild")
+async def rebuild_snapshots(current_user: dict = Depends(require_admin)):
+    changed = await snapshots.build_all()
+    return {"changed": changed, "manifest": snapshots.manifest()}
+
 # ==================== Doctor Schedules ====================
 @app.get("/api/schedules")
+@coalesce("/api/schedules")
 async def get_schedules(doctor_id: Optional[str] = None):
     query = {"active": True}
     if doctor_id:
         query["doctor_id"] = doctor_id
-    schedules = await schedules_collection.find(query).to_list(500)
+    schedules = await schedules_catalog_collection.find(query).to_list(500)
     for s in schedules:
         s.pop("_id", None)
     return schedules
@@ -552,6 +721,7 @@ async def delete_schedule(schedule_id: str, current_user: dict = Depends(require
 
 # ==================== Schedule Exceptions ====================
 @app.get("/api/schedule-exceptions")
+@coalesce("/api/schedule-exceptions")
 async def get_schedule_exceptions(doctor_id: Optional[str] = None):
     query = {}
     if doctor_id:
@@ -566,8 +736,19 @@ async def create_schedule_exception(exception: ScheduleExceptionCreate, current_
     data = exception.dict()
     data["id"] = str(uuid.uuid4())
     await schedule_exceptions_collection.insert_one(data)
+    if affects_bookings(data):
+        # Move displaced appointments in the background
+        job_id = await start_reschedule_job(data)
+        return {"message": "Exception created", "id": data["id"], "reschedule_job_id": job_id}
     return {"message": "Exception created", "id": data["id"]}
 
+@app.get("/api/reschedule-jobs/{job_id}")
+async def get_reschedule_job(job_id: str, current_user: dict = Depends(require_admin)):
+    job = await reschedule_jobs_collection.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.delete("/api/schedule-exceptions/{exception_id}")
 async def delete_schedule_exception(exception_id: str, current_user: dict = Depends(require_admin)):
     result = await schedule_exceptions_collection.delete_one({"id": exception_id})
@@ -577,6 +758,7 @@ async def delete_schedule_exception(exception_id: str, current_user: dict = Depe
 
 # ==================== Available Slots ====================
 @app.get("/api/available-slots/{doctor_id}")
+@coalesce("/api/available-slots/{doctor_id}")
 async def get_available_slots(doctor_id: str, date: str):
     """Get available slots for a doctor on a specific date"""
     # Parse the date
@@ -603,88 +785,222 @@ async def get_available_slots(doctor_id: str, date: str):
         "active": True
     })
     
-    if not schedule:
-        return {"slots": [], "message": "No schedule for this day"}
-    
-    # Use custom times if exception has them
-    start_time = exception.get("custom_start_time") if exception else None
-    end_time = exception.get("custom_end_time") if exception else None
-    start_time = start_time or schedule["start_time"]
-    end_time = end_time or schedule["end_time"]
-    slot_minutes = schedule.get("slot_minutes", 15)
-    
-    # Generate slots
-    slots = []
-    start = datetime.strptime(f"{date} {start_time}", "%Y-%m-%d %H:%M")
-    end = datetime.strptime(f"{date} {end_time}", "%Y-%m-%d %H:%M")
-    
-    current = start
-    while current < end:
-        slot_time = current.strftime("%Y-%m-%d %H:%M")
-        slots.append({
-            "time": current.strftime("%H:%M"),
-            "datetime": slot_time
-        })
-        current += timedelta(minutes=slot_minutes)
-    
-    # Get existing appointments
-    existing = await appointments_collection.find({
-        "doctor_id": doctor_id,
-        "date_time": {"$regex": f"^{date}"},
-        "status": {"$in": ["new", "confirmed"]}
-    }).to_list(100)
-    
-    booked_times = {apt["date_time"] for apt in existing}
+    window, message = day_window(schedule, exception)
+    if window is None:
+        return {"slots": [], "message": message}
+    
+    # Get existing appointments, plus slots held for waitlisted patients
+    next_date = (target_date + timedelta(days=1)).strftime("%Y-%m-%d")
+    existing, held = await asyncio.gather(
+        appointments_collection.find({
+            "doctor_id": doctor_id,
+            "date_time": {"$regex": f"^{date}"},
+            "status": {"$in": ["new", "confirmed"]}
+        }, {"_id": 0, "date_time": 1}).to_list(None),
+        held_times(doctor_id, date, next_date),
+    )
     
-    # Filter out booked slots
-    available_slots = [s for s in slots if s["datetime"] not in booked_times]
+    taken = [apt["date_time"] for apt in existing] + held
+    free = free_offsets(slot_offsets(*window), booked_offsets(taken))
+    return {"slots": format_slots(date, free), "date": date}
+
+@app.get("/api/available-slots/{doctor_id}/range")
+@coalesce("/api/available-slots/{doctor_id}/range")
+async def get_available_slots_range(doctor_id: str, start_date: str, days: int = Query(7, ge=1, le=31)):
+    """Available slots for each day of a week or month view, in three queries"""
+    try:
+        first_day = datetime.strptime(start_date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    dates = [(first_day + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    end_date = (first_day + timedelta(days=days)).strftime("%Y-%m-%d")
+    
+    schedules, exceptions, existing, held = await asyncio.gather(
+        schedules_collection.find({"doctor_id": doctor_id, "active": True}, {"_id": 0}).to_list(None),
+        schedule_exceptions_collection.find(
+            {"doctor_id": doctor_id, "date": {"$gte": start_date, "$lt": end_date}}, {"_id": 0}
+        ).to_list(None),
+        appointments_collection.find({
+            "doctor_id": doctor_id,
+            "date_time": {"$gte": start_date, "$lt": end_date},
+            "status": {"$in": ["new", "confirmed"]}
+        }, {"_id": 0, "date_time": 1}).to_list(None),
+        held_times(doctor_id, start_date, end_date),
+    )
+    # First match wins, as with find_one in get_available_slots
+    schedule_by_day = {}
+    for schedule in schedules:
+        schedule_by_day.setdefault(schedule["day_of_week"], schedule)
+    exception_by_date = {}
+    for exception in exceptions:
+        exception_by_date.setdefault(exception["date"], exception)
+    booked_by_date = bookings_by_date([apt["date_time"] for apt in existing] + held)
     
-    return {"slots": available_slots, "date": date}
+    result = []
+    for offset, date in enumerate(dates):
+        window, message = day_window(
+            schedule_by_day.get((first_day + timedelta(days=offset)).weekday()), exception_by_date.get(date)
+        )
+        if window is None:
+            result.append({"date": date, "slots": [], "message": message})
+            continue
+        free = free_offsets(slot_offsets(*window), booked_offsets(booked_by_date.get(date, [])))
+        result.append({"date": date, "slots": format_slots(date, free)})
+    return {"doctor_id": doctor_id, "days": result}
 
 # ==================== Appointments ====================
+# Fields embedded in booking reads; the full profiles stay on their own endpoints
+DOCTOR_SUMMARY_FIELDS = ("id", "name", "specialty_id", "qualifications", "fee")
+TEST_SUMMARY_FIELDS = ("id", "name", "category", "price", "preparation", "report_time")
+
+def lookup_summary(from_collection: str, local_field: str, as_field: str, fields) -> list:
+    """Aggregation stages embedding a summary of the referenced document.
+
+    Joins server-side on the indexed ``id`` field so a booking read is one
+    round trip however many doctors or tests exist. The projection runs
+    inside the join, so only ``fields`` are embedded (no ``_id``, photos
+    or bios). A dangling reference yields an empty object, as before.
+    """
+    return [
+        {"$lookup": {
+            "from": from_collection,
+            "let": {"ref": f"${local_field}"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$id", "$$ref"]}}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, **{f: 1 for f in fields}}},
+            ],
+            "as": as_field,
+        }},
+        {"$addFields": {as_field: {"$ifNull": [{"$arrayElemAt": [f"${as_field}", 0]}, {}]}}},
+        {"$project": {"_id": 0}},
+    ]
+
+# Fields staff may change on an appointment or diagnostic booking
+BOOKING_UPDATE_FIELDS = ["status", "notes", "date_time"]
+MAX_BULK_UPDATES = int(os.environ.get("MAX_BULK_UPDATES", "500"))
+
+async def bulk_update_bookings(collection, kind: str, updates: List[dict]) -> dict:
+    """Apply many per-booking updates with one unordered bulk_write.
+
+    Returns a result per item, in request order: ``updated``, ``not_found``,
+    ``invalid`` (no id or nothing allowed to change) or ``failed``.
+    """
+    if len(updates) > MAX_BULK_UPDATES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_UPDATES} updates per request")
+
+    results = []
+    operations = []
+    op_items = []
+    seen = set()
+    for item in updates:
+        booking_id = item.get("id")
+        update = {k: v for k, v in item.items() if k in BOOKING_UPDATE_FIELDS}
+        if not isinstance(booking_id, str) or not update:
+            results.append({"id": booking_id, "result": "invalid", "detail": "An id and at least one of status, notes, date_time are required"})
+            continue
+        if booking_id in seen:
+            results.append({"id": booking_id, "result": "invalid", "detail": "Duplicate id in request"})
+            continue
+        seen.add(booking_id)
+        results.append({"id": booking_id, "result": "updated"})
+        operations.append(UpdateOne({"id": booking_id}, {"$set": update}))
+        op_items.append(len(results) - 1)
+
+    if not operations:
+        return {"matched": 0, "modified": 0, "results": results}
+
+    # Appointment slots before the write, so freed ones can go to the waitlist
+    before = {}
+    if kind == "appointment":
+        ids = [results[i]["id"] for i in op_items]
+        before = {
+            doc["id"]: doc
+            for doc in await collection.find(
+                {"id": {"$in": ids}}, {"_id": 0, "id": 1, "doctor_id": 1, "date_time": 1, "status": 1}
+            ).to_list(len(ids))
+        }
+
+    failed = set()
+    try:
+        write = await collection.bulk_write(operations, ordered=False)
+        matched, modified = write.matched_count, write.modified_count
+    except BulkWriteError as e:
+        matched, modified = e.details.get("nMatched", 0), e.details.get("nModified", 0)
+        for error in e.details.get("writeErrors", []):
+            result = results[op_items[error["index"]]]
+            result.update({"result": "failed", "detail": error.get("errmsg", "Write failed")})
+            failed.add(result["id"])
+
+    # One read tells apart unmatched ids and feeds the live booking feed
+    ids = [results[i]["id"] for i in op_items if results[i]["id"] not in failed]
+    changed = await collection.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))
+    found = {doc["id"]: doc for doc in changed}
+    for i in op_items:
+        result = results[i]
+        if result["result"] != "updated":
+            continue
+        doc = found.get(result["id"])
+        if doc is None:
+            result.update({"result": "not_found", "detail": "Booking not found"})
+        else:
+            publish_booking(kind, "cancelled" if doc.get("status") == "cancelled" else "updated", doc)
+    if before:
+        schedule_backfill([freed_slot(before.get(doc["id"]), doc) for doc in changed])
+    return {"matched": matched, "modified": modified, "results": results}
+
 @app.get("/api/appointments")
 async def get_appointments(
     doctor_id: Optional[str] = None,
     filter_status: Optional[str] = None,
     date: Optional[str] = None,
+    phone: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     query = {}
     if doctor_id:
         query["doctor_id"] = doctor_id
+    if phone:
+        query["patient_phone_normalized"] = normalize_phone(phone)
     if filter_status:
         query["status"] = filter_status
     if date:
         query["date_time"] = {"$regex": f"^{date}"}
     
-    appointments = await appointments_collection.find(query).sort("date_time", -1).to_list(500)
-    
-    # Get doctors for mapping
-    doctors = await doctors_collection.find().to_list(100)
-    doctor_map = {d["id"]: d for d in doctors}
-    
-    for apt in appointments:
-        apt.pop("_id", None)
-        apt["doctor"] = doctor_map.get(apt.get("doctor_id"), {})
-    
-    return appointments
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"date_time": -1}},
+        {"$limit": 500},
+        *lookup_summary("doctors", "doctor_id", "doctor", DOCTOR_SUMMARY_FIELDS),
+    ]
+    return await appointments_collection.aggregate(pipeline, batchSize=500).to_list(500)
 
 @app.get("/api/appointments/{appointment_id}")
 async def get_appointment(appointment_id: str):
-    apt = await appointments_collection.find_one({"id": appointment_id})
-    if not apt:
+    pipeline = [
+        {"$match": {"id": appointment_id}},
+        {"$limit": 1},
+        *lookup_summary("doctors", "doctor_id", "doctor", DOCTOR_SUMMARY_FIELDS),
+    ]
+    found = await appointments_collection.aggregate(pipeline).to_list(1)
+    if not found:
         raise HTTPException(status_code=404, detail="Appointment not found")
-    apt.pop("_id", None)
-    
-    doctor = await doctors_collection.find_one({"id": apt.get("doctor_id")})
-    if doctor:
-        doctor.pop("_id", None)
-        apt["doctor"] = doctor
-    
-    return apt
+    return found[0]
 
 @app.post("/api/appointments")
-async def create_appointment(appointment: AppointmentCreate):
+async def create_appointment(
+    appointment: AppointmentCreate,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await run_idempotent(
+        "appointments", idempotency_key, appointment.dict(), response,
+        lambda: _create_appointment(appointment),
+        admit=lambda: check_rate_limits("appointments", request, appointment.patient_phone),
+    )
+
+async def _create_appointment(appointment: AppointmentCreate, hold_token: Optional[str] = None):
     # Check if slot is available
     existing = await appointments_collection.find_one({
         "doctor_id": appointment.doctor_id,
@@ -694,14 +1010,22 @@ async def create_appointment(appointment: AppointmentCreate):
     
     if existing:
         raise HTTPException(status_code=400, detail="This slot is already booked")
+    if await is_held(appointment.doctor_id, appointment.date_time, hold_token):
+        raise HTTPException(status_code=400, detail="This slot is being held for a waitlisted patient")
     
     data = appointment.dict()
     data["id"] = str(uuid.uuid4())
-    data["reference_number"] = f"APT-{uuid.uuid4().hex[:8].upper()}"
+    data["patient_phone_normalized"] = normalize_phone(appointment.patient_phone)
+    data["reference_number"] = await appointment_references.next()
     data["status"] = "new"
     data["created_at"] = datetime.utcnow()
     
-    await appointments_collection.insert_one(data)
+    try:
+        await appointments_collection.insert_one(data)
+    except DuplicateKeyError:
+        # Booked concurrently; caught by the unique active-slot index
+        raise HTTPException(status_code=400, detail="This slot is already booked")
+    publish_booking("appointment", "created", data)
     
     # Get doctor info for confirmation
     doctor = await doctors_collection.find_one({"id": appointment.doctor_id})
@@ -736,29 +1060,221 @@ async def create_appointment(appointment: AppointmentCreate):
 
 @app.put("/api/appointments/{appointment_id}")
 async def update_appointment(appointment_id: str, update_data: dict, current_user: dict = Depends(get_current_user)):
-    allowed_fields = ["status", "notes", "date_time"]
-    update = {k: v for k, v in update_data.items() if k in allowed_fields}
+    update = {k: v for k, v in update_data.items() if k in BOOKING_UPDATE_FIELDS}
     
-    result = await appointments_collection.update_one(
-        {"id": appointment_id},
-        {"$set": update}
-    )
-    if result.matched_count == 0:
+    try:
+        before = await appointments_collection.find_one_and_update(
+            {"id": appointment_id},
+            {"$set": update},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="This slot is already booked")
+    if not before:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    apt = {**before, **update}
+    publish_booking("appointment", "cancelled" if apt.get("status") == "cancelled" else "updated", apt)
+    schedule_backfill([freed_slot(before, apt)])
     return {"message": "Appointment updated"}
 
+@app.post("/api/appointments/bulk-update")
+async def bulk_update_appointments(data: BulkBookingUpdate, current_user: dict = Depends(get_current_user)):
+    return await bulk_update_bookings(appointments_collection, "appointment", data.updates)
+
 @app.delete("/api/appointments/{appointment_id}")
 async def cancel_appointment(appointment_id: str, current_user: dict = Depends(get_current_user)):
-    result = await appointments_collection.update_one(
+    before = await appointments_collection.find_one_and_update(
         {"id": appointment_id},
-        {"$set": {"status": "cancelled"}}
+        {"$set": {"status": "cancelled"}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
     )
-    if result.matched_count == 0:
+    if not before:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    apt = {**before, "status": "cancelled"}
+    publish_booking("appointment", "cancelled", apt)
+    schedule_backfill([freed_slot(before, apt)])
     return {"message": "Appointment cancelled"}
 
+# ==================== Waitlist ====================
+@app.post("/api/waitlist")
+async def create_waitlist_entry(entry: WaitlistEntryCreate, request: Request):
+    await check_rate_limits("waitlist", request, entry.patient_phone)
+    try:
+        date_from = datetime.strptime(entry.date_from, "%Y-%m-%d")
+        date_to = datetime.strptime(entry.date_to, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to must not be before date_from")
+    if not await doctors_collection.find_one({"id": entry.doctor_id, "active": True}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    
+    data = entry.dict()
+    data["patient_phone_normalized"] = normalize_phone(entry.patient_phone)
+    data = await join_waitlist(data)
+    return {"message": "Added to waitlist", "id": data["id"]}
+
+@app.get("/api/waitlist")
+async def get_waitlist(
+    doctor_id: Optional[str] = None,
+    filter_status: Optional[WaitlistStatus] = None,
+    limit: int = Query(200, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    query = {}
+    if doctor_id:
+        query["doctor_id"] = doctor_id
+    if filter_status:
+        query["status"] = filter_status.value
+    return await waitlist_collection.find(query, {"_id": 0}).sort("created_at", 1).to_list(limit)
+
+@app.post("/api/waitlist/{entry_id}/accept")
+async def accept_waitlist_offer(entry_id: str, offer: WaitlistOfferResponse, request: Request):
+    """Book the slot held for a waitlisted patient with their offer code"""
+    await check_rate_limits("waitlist", request)
+    entry = await find_offer(entry_id, offer.token)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Offer not found or expired")
+    
+    appointment = AppointmentCreate(
+        doctor_id=entry["doctor_id"],
+        date_time=entry["offer"]["date_time"],
+        patient_name=entry["patient_name"],
+        patient_phone=entry["patient_phone"],
+        patient_email=entry.get("patient_email"),
+        patient_gender=entry.get("patient_gender"),
+        patient_dob=entry.get("patient_dob"),
+        notes=entry.get("notes"),
+    )
+    result = await _create_appointment(appointment, hold_token=entry["offer"]["token"])
+    await complete_offer(entry, result["id"])
+    return result
+
+@app.post("/api/waitlist/{entry_id}/decline")
+async def decline_waitlist_offer(entry_id: str, offer: WaitlistOfferResponse, request: Request):
+    await check_rate_limits("waitlist", request)
+    entry = await find_offer(entry_id, offer.token)
+    if not entry or not await release_offer(entry, "declined"):
+        raise HTTPException(status_code=404, detail="Offer not found or expired")
+    return {"message": "Offer declined"}
+
+@app.delete("/api/waitlist/{entry_id}")
+async def cancel_waitlist_entry(entry_id: str, current_user: dict = Depends(get_current_user)):
+    entry = await waitlist_collection.find_one({"id": entry_id}, {"_id": 0})
+    if not entry:
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+    if entry["status"] == "offered":
+        # Hand the held slot to the next patient
+        await release_offer(entry, "cancelled")
+    else:
+        await waitlist_collection.update_one(
+            {"id": entry_id, "status": "waiting"}, {"$set": {"status": "cancelled"}}
+        )
+    return {"message": "Waitlist entry cancelled"}
+
+# ==================== Walk-in Token Queue ====================
+@app.post("/api/queue/tokens")
+async def issue_walk_in_token(token: WalkInTokenCreate, current_user: dict = Depends(get_current_user)):
+    """Issue the next walk-in token for the doctor's session today"""
+    if not await doctors_collection.find_one({"id": token.doctor_id, "active": True}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    patient = token.dict(exclude={"doctor_id"})
+    patient["issued_by"] = current_user.get("username")
+    return await token_queue.issue_walk_in(token.doctor_id, patient)
+
+@app.post("/api/queue/check-in/{appointment_id}")
+async def check_in_appointment(appointment_id: str, current_user: dict = Depends(get_current_user)):
+    """Add a pre-booked patient to their doctor's queue at their slot time"""
+    apt = await appointments_collection.find_one({"id": appointment_id}, {"_id": 0})
+    if not apt:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    if apt["status"] not in ("new", "confirmed"):
+        raise HTTPException(status_code=400, detail=f"Appointment is {apt['status']}")
+    if await queue_tokens_collection.find_one({"appointment_id": appointment_id}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Appointment already checked in")
+    try:
+        return await token_queue.check_in(apt)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Appointment already checked in")
+
+@app.get("/api/queue/display")
+@coalesce("/api/queue/display")
+async def get_queue_board(date: Optional[str] = None):
+    """Now serving for every doctor, for the lobby screen"""
+    return await token_queue.display_board(date or token_queue.clinic_now().strftime("%Y-%m-%d"))
+
+@app.get("/api/queue/{doctor_id}/display")
+@coalesce("/api/queue/{doctor_id}/display")
+async def get_queue_display(doctor_id: str, date: Optional[str] = None):
+    """Now serving and next tokens for a doctor's room screen"""
+    return await token_queue.display(doctor_id, date or token_queue.clinic_now().strftime("%Y-%m-%d"))
+
+@app.get("/api/queue/{doctor_id}")
+async def get_queue(doctor_id: str, date: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    return await token_queue.session_queue(doctor_id, date or token_queue.clinic_now().strftime("%Y-%m-%d"))
+
+@app.post("/api/queue/{doctor_id}/call-next")
+async def call_next_token(doctor_id: str, date: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    entry = await token_queue.call_next(
+        doctor_id, date or token_queue.clinic_now().strftime("%Y-%m-%d"), current_user.get("username")
+    )
+    if not entry:
+        raise HTTPException(status_code=404, detail="No patients waiting")
+    return entry
+
+@app.put("/api/queue/tokens/{token_id}")
+async def update_queue_token(token_id: str, update: QueueTokenUpdate, current_user: dict = Depends(get_current_user)):
+    entry = await token_queue.set_token_status(token_id, update.status.value)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Token not found")
+    return entry
+
+# ==================== Live Booking Feed ====================
+@app.post("/api/live/token")
+async def create_live_token(current_user: dict = Depends(get_current_user)):
+    """Short-lived token that only opens the live feed, for the EventSource URL"""
+    return {"token": create_stream_token(current_user)}
+
+@app.get("/api/live/bookings")
+async def live_bookings(
+    request: Request,
+    token: Optional[str] = None,
+    kinds: str = "appointment,diagnostic_booking",
+    date: Optional[str] = None,
+    doctor_id: Optional[str] = None,
+    since: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """Server-Sent Events stream of booking create/update/cancel events.
+
+    EventSource cannot send an Authorization header, so the ``token`` query
+    parameter takes a stream token from POST /api/live/token. Access tokens
+    are only accepted in the header, to keep them out of access logs.
+    ``since`` resumes a new EventSource where an earlier one stopped.
+    """
+    authorization = request.headers.get("authorization", "")
+    if token:
+        authorized = decode_stream_token(token) is not None
+    else:
+        authorized = authorization.lower().startswith("bearer ") and decode_token(authorization[7:]) is not None
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    subscriber = Subscriber(set(kinds.split(",")), date=date, doctor_id=doctor_id)
+    resume_from = last_event_id or since
+    if not broker.subscribe(subscriber, resume_from):
+        raise HTTPException(status_code=503, detail="Too many live subscribers")
+    return StreamingResponse(
+        event_stream(request, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ==================== Diagnostic Tests ====================
 @app.get("/api/diagnostic-tests")
+@coalesce("/api/diagnostic-tests")
 async def get_diagnostic_tests(
     category: Optional[str] = None,
     search: Optional[str] = None,
@@ -770,7 +1286,7 @@ async def get_diagnostic_tests(
     if category:
         query["category"] = category
     
-    tests = await diagnostic_tests_collection.find(query).to_list(500)
+    tests = await diagnostic_tests_catalog_collection.find(query).to_list(500)
     
     result = []
     for test in tests:
@@ -784,8 +1300,9 @@ async def get_diagnostic_tests(
     return result
 
 @app.get("/api/diagnostic-tests/{test_id}")
+@coalesce("/api/diagnostic-tests/{test_id}")
 async def get_diagnostic_test(test_id: str):
-    test = await diagnostic_tests_collection.find_one({"id": test_id})
+    test = await diagnostic_tests_catalog_collection.find_one({"id": test_id})
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
     test.pop("_id", None)
@@ -798,6 +1315,7 @@ async def create_diagnostic_test(test: DiagnosticTestCreate, current_user: dict
     data["active"] = True
     data["created_at"] = datetime.utcnow()
     await diagnostic_tests_collection.insert_one(data)
+    mark_stale("diagnostic-tests")
     return {"message": "Test created", "id": data["id"]}
 
 @app.put("/api/diagnostic-tests/{test_id}")
@@ -808,6 +1326,7 @@ async def update_diagnostic_test(test_id: str, test: DiagnosticTestCreate, curre
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Test not found")
+    mark_stale("diagnostic-tests")
     return {"message": "Test updated"}
 
 @app.delete("/api/diagnostic-tests/{test_id}")
@@ -818,6 +1337,7 @@ async def delete_diagnostic_test(test_id: str, current_user: dict = Depends(requ
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Test not found")
+    mark_stale("diagnostic-tests")
     return {"message": "Test deactivated"}
 
 # ==================== Diagnostic Bookings ====================
@@ -826,37 +1346,50 @@ async def get_diagnostic_bookings(
     test_id: Optional[str] = None,
     filter_status: Optional[str] = None,
     date: Optional[str] = None,
+    phone: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     query = {}
     if test_id:
         query["test_id"] = test_id
+    if phone:
+        query["patient_phone_normalized"] = normalize_phone(phone)
     if filter_status:
         query["status"] = filter_status
     if date:
         query["date_time"] = {"$regex": f"^{date}"}
     
-    bookings = await diagnostic_bookings_collection.find(query).sort("date_time", -1).to_list(500)
-    
-    # Get tests for mapping
-    tests = await diagnostic_tests_collection.find().to_list(500)
-    test_map = {t["id"]: t for t in tests}
-    
-    for booking in bookings:
-        booking.pop("_id", None)
-        booking["test"] = test_map.get(booking.get("test_id"), {})
-    
-    return bookings
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"date_time": -1}},
+        {"$limit": 500},
+        *lookup_summary("diagnostic_tests", "test_id", "test", TEST_SUMMARY_FIELDS),
+    ]
+    return await diagnostic_bookings_collection.aggregate(pipeline, batchSize=500).to_list(500)
 
 @app.post("/api/diagnostic-bookings")
-async def create_diagnostic_booking(booking: DiagnosticBookingCreate):
+async def create_diagnostic_booking(
+    booking: DiagnosticBookingCreate,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await run_idempotent(
+        "diagnostic_bookings", idempotency_key, booking.dict(), response,
+        lambda: _create_diagnostic_booking(booking),
+        admit=lambda: check_rate_limits("diagnostic_bookings", request, booking.patient_phone),
+    )
+
+async def _create_diagnostic_booking(booking: DiagnosticBookingCreate):
     data = booking.dict()
     data["id"] = str(uuid.uuid4())
-    data["reference_number"] = f"DGN-{uuid.uuid4().hex[:8].upper()}"
+    data["patient_phone_normalized"] = normalize_phone(booking.patient_phone)
+    data["reference_number"] = await diagnostic_references.next()
     data["status"] = "new"
     data["created_at"] = datetime.utcnow()
     
     await diagnostic_bookings_collection.insert_one(data)
+    publish_booking("diagnostic_booking", "created", data)
     
     # Get test info
     test = await diagnostic_tests_collection.find_one({"id": booking.test_id})
@@ -898,19 +1431,99 @@ async def create_diagnostic_booking(booking: DiagnosticBookingCreate):
 
 @app.put("/api/diagnostic-bookings/{booking_id}")
 async def update_diagnostic_booking(booking_id: str, update_data: dict, current_user: dict = Depends(get_current_user)):
-    allowed_fields = ["status", "notes", "date_time"]
-    update = {k: v for k, v in update_data.items() if k in allowed_fields}
+    update = {k: v for k, v in update_data.items() if k in BOOKING_UPDATE_FIELDS}
     
-    result = await diagnostic_bookings_collection.update_one(
+    booking = await diagnostic_bookings_collection.find_one_and_update(
         {"id": booking_id},
-        {"$set": update}
+        {"$set": update},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
-    if result.matched_count == 0:
+    if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
+    publish_booking("diagnostic_booking", "cancelled" if booking.get("status") == "cancelled" else "updated", booking)
     return {"message": "Booking updated"}
 
+@app.post("/api/diagnostic-bookings/bulk-update")
+async def bulk_update_diagnostic_bookings(data: BulkBookingUpdate, current_user: dict = Depends(get_current_user)):
+    return await bulk_update_bookings(diagnostic_bookings_collection, "diagnostic_booking", data.updates)
+
+# ==================== Patient Lookup ====================
+PATIENT_HISTORY_SORT = [("date_time", -1), ("id", -1)]
+
+@app.get("/api/patients/bookings")
+async def lookup_patient_bookings(
+    phone: Optional[str] = None,
+    reference: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """A patient's appointments and diagnostic bookings, newest first.
+
+    Find the patient by phone (any formatting) or by an APT-/DGN- reference
+    number. Pass the returned ``next_before`` as ``before`` for the next page.
+    """
+    if reference:
+        reference = reference.strip().upper()
+        if not is_valid_reference(reference):
+            raise HTTPException(status_code=400, detail="Invalid reference number")
+        appointment_tiers = [appointments_collection, appointments_archive_collection]
+        diagnostic_tiers = [diagnostic_bookings_collection, diagnostic_bookings_archive_collection]
+        if reference.startswith("DGN-"):
+            collections = diagnostic_tiers
+        elif reference.startswith("APT-"):
+            collections = appointment_tiers
+        else:
+            collections = appointment_tiers + diagnostic_tiers
+        booking = None
+        for collection in collections:
+            booking = await collection.find_one({"reference_number": reference}, {"_id": 0, "patient_phone": 1})
+            if booking:
+                break
+        if not booking:
+            raise HTTPException(status_code=404, detail="Booking not found")
+        phone_key = normalize_phone(booking.get("patient_phone"))
+    elif phone:
+        phone_key = normalize_phone(phone)
+    else:
+        raise HTTPException(status_code=400, detail="Provide a phone number or reference number")
+    if not phone_key:
+        raise HTTPException(status_code=400, detail="Invalid phone number")
+
+    query = {"patient_phone_normalized": phone_key}
+    if before:
+        before_date_time, _, before_id = before.partition("|")
+        query["$or"] = [
+            {"date_time": {"$lt": before_date_time}},
+            {"date_time": before_date_time, "id": {"$lt": before_id}},
+        ]
+
+    # Hot and archived bookings alike; one extra row tells us whether another page exists
+    appointments, diagnostic_bookings = await asyncio.gather(
+        find_across(
+            appointments_collection, appointments_archive_collection, query, PATIENT_HISTORY_SORT, limit + 1,
+            pipeline_tail=[
+                *lookup_summary("doctors", "doctor_id", "doctor", DOCTOR_SUMMARY_FIELDS),
+                {"$addFields": {"kind": "appointment"}},
+            ],
+        ),
+        find_across(
+            diagnostic_bookings_collection, diagnostic_bookings_archive_collection, query, PATIENT_HISTORY_SORT, limit + 1,
+            pipeline_tail=[
+                *lookup_summary("diagnostic_tests", "test_id", "test", TEST_SUMMARY_FIELDS),
+                {"$addFields": {"kind": "diagnostic_booking"}},
+            ],
+        ),
+    )
+    merged = sorted(appointments + diagnostic_bookings, key=lambda b: (b["date_time"], b["id"]), reverse=True)
+    page = merged[:limit]
+    next_before = f"{page[-1]['date_time']}|{page[-1]['id']}" if len(merged) > limit else None
+    return {"phone": phone_key, "bookings": page, "next_before": next_before}
+
 # ==================== Blog Posts ====================
 @app.get("/api/blog")
+@coalesce("/api/blog")
 async def get_blog_posts(
     category: Optional[str] = None,
     tag: Optional[str] = None,
@@ -925,20 +1538,22 @@ async def get_blog_posts(
     if tag:
         query["tags"] = tag
     
-    posts = await blog_posts_collection.find(query).sort("published_at", -1).limit(limit).to_list(limit)
+    posts = await blog_posts_catalog_collection.find(query).sort("published_at", -1).limit(limit).to_list(limit)
     for post in posts:
         post.pop("_id", None)
+        apply_variant(post, "featured_image", "medium")
     return posts
 
 @app.get("/api/blog/categories")
+@coalesce("/api/blog/categories")
 async def get_blog_categories():
-    posts = await blog_posts_collection.find({"published": True}).to_list(500)
+    posts = await blog_posts_catalog_collection.find({"published": True}).to_list(500)
     categories = list(set(p.get("category") for p in posts if p.get("category")))
     return categories
 
 @app.get("/api/blog/{slug}")
 async def get_blog_post(slug: str):
-    post = await blog_posts_collection.find_one({"slug": slug})
+    post = await blog_posts_catalog_collection.find_one({"slug": slug})
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
@@ -949,6 +1564,7 @@ async def get_blog_post(slug: str):
     )
     
     post.pop("_id", None)
+    apply_variant(post, "featured_image", "medium")
     return post
 
 @app.post("/api/blog")
@@ -958,23 +1574,25 @@ async def create_blog_post(post: BlogPostCreate, current_user: dict = Depends(re
     if existing:
         raise HTTPException(status_code=400, detail="Slug already exists")
     
-    data = post.dict()
+    data = await link_image(post.dict(), "featured_image")
     data["id"] = str(uuid.uuid4())
     data["views"] = 0
     data["published_at"] = datetime.utcnow()
     data["created_at"] = datetime.utcnow()
     
     await blog_posts_collection.insert_one(data)
+    mark_stale("blog")
     return {"message": "Post created", "id": data["id"]}
 
 @app.put("/api/blog/{post_id}")
 async def update_blog_post(post_id: str, post: BlogPostCreate, current_user: dict = Depends(require_admin)):
     result = await blog_posts_collection.update_one(
         {"id": post_id},
-        {"$set": post.dict()}
+        {"$set": await link_image(post.dict(), "featured_image")}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Post not found")
+    mark_stale("blog")
     return {"message": "Post updated"}
 
 @app.delete("/api/blog/{post_id}")
@@ -982,8 +1600,30 @@ async def delete_blog_post(post_id: str, current_user: dict = Depends(require_ad
     result = await blog_posts_collection.delete_one({"id": post_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Post not found")
+    mark_stale("blog")
     return {"message": "Post deleted"}
 
+# ==================== Patient Notifications ====================
+@app.get("/api/notifications")
+async def get_notifications(
+    acknowledged: Optional[bool] = False,
+    limit: int = Query(100, ge=1, le=500),
+    current_user: dict = Depends(get_current_user)
+):
+    """Queued patient notifications, newest first; reception sends the WhatsApp text"""
+    query = {} if acknowledged is None else {"acknowledged": acknowledged}
+    return await notifications_collection.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
+
+@app.put("/api/notifications/{notification_id}/acknowledge")
+async def acknowledge_notification(notification_id: str, current_user: dict = Depends(get_current_user)):
+    result = await notifications_collection.update_one(
+        {"id": notification_id},
+        {"$set": {"acknowledged": True, "acknowledged_by": current_user.get("username")}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return {"message": "Notification acknowledged"}
+
 # ==================== Contact Messages ====================
 @app.get("/api/contact-messages")
 async def get_contact_messages(current_user: dict = Depends(get_current_user)):
@@ -993,7 +1633,9 @@ async def get_contact_messages(current_user: dict = Depends(get_current_user)):
     return messages
 
 @app.post("/api/contact")
-async def submit_contact(name: str, email: str, subject: str, message: str, phone: Optional[str] = None):
+async def submit_contact(request: Request, name: str, email: str, subject: str, message: str, phone: Optional[str] = None):
+    await check_rate_limits("contact", request, phone)
+    
     data = {
         "id": str(uuid.uuid4()),
         "name": name,
@@ -1017,37 +1659,43 @@ async def mark_message_read(message_id: str, current_user: dict = Depends(get_cu
         raise HTTPException(status_code=404, detail="Message not found")
     return {"message": "Marked as read"}
 
+# ==================== Archival ====================
+@app.post("/api/archive/run")
+async def run_booking_archival(current_user: dict = Depends(require_admin)):
+    """Move finished bookings past the archive horizon to the cold tier now"""
+    return await run_archival()
+
 # ==================== Analytics ====================
 @app.get("/api/analytics/dashboard")
 async def get_dashboard_analytics(current_user: dict = Depends(get_current_user)):
     today = datetime.utcnow().strftime("%Y-%m-%d")
     
     # Counts
-    total_doctors = await doctors_collection.count_documents({"active": True})
-    total_tests = await diagnostic_tests_collection.count_documents({"active": True})
+    total_doctors = await doctors_reporting_collection.count_documents({"active": True})
+    total_tests = await diagnostic_tests_reporting_collection.count_documents({"active": True})
     
     # Today's appointments
-    today_appointments = await appointments_collection.count_documents({
+    today_appointments = await appointments_reporting_collection.count_documents({
         "date_time": {"$regex": f"^{today}"}
     })
     
     # Today's diagnostic bookings
-    today_diagnostics = await diagnostic_bookings_collection.count_documents({
+    today_diagnostics = await diagnostic_bookings_reporting_collection.count_documents({
         "date_time": {"$regex": f"^{today}"}
     })
     
     # Appointment status breakdown
     appointment_stats = {}
     for apt_status in ["new", "confirmed", "completed", "cancelled", "no_show"]:
-        appointment_stats[apt_status] = await appointments_collection.count_documents({"status": apt_status})
+        appointment_stats[apt_status] = await appointments_reporting_collection.count_documents({"status": apt_status})
     
     # Recent appointments
-    recent_appointments = await appointments_collection.find().sort("created_at", -1).limit(5).to_list(5)
+    recent_appointments = await appointments_reporting_collection.find().sort("created_at", -1).limit(5).to_list(5)
     for apt in recent_appointments:
         apt.pop("_id", None)
     
     # Unread messages
-    unread_messages = await contact_messages_collection.count_documents({"read": False})
+    unread_messages = await contact_messages_reporting_collection.count_documents({"read": False})
     
     return {
         "total_doctors": total_doctors,
@@ -1068,10 +1716,10 @@ async def get_bookings_analytics(
     result = []
     for i in range(days):
         date = (datetime.utcnow() - timedelta(days=i)).strftime("%Y-%m-%d")
-        apt_count = await appointments_collection.count_documents({
+        apt_count = await appointments_reporting_collection.count_documents({
             "date_time": {"$regex": f"^{date}"}
         })
-        dgn_count = await diagnostic_bookings_collection.count_documents({
+        dgn_count = await diagnostic_bookings_reporting_collection.count_documents({
             "date_time": {"$regex": f"^{date}"}
         })
         result.append({
@@ -1082,14 +1730,44 @@ async def get_bookings_analytics(
     
     return result[::-1]  # Reverse to get chronological order
 
-# ==================== Export ====================
-@app.get("/api/export/appointments")
-async def export_appointments(
+def _analytics_window(start_date: Optional[str], end_date: Optional[str]):
+    """Parse an inclusive YYYY-MM-DD range into [start, end); defaults to the last 30 days"""
+    try:
+        end = datetime.strptime(end_date, "%Y-%m-%d") if end_date else datetime.utcnow().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        start = datetime.strptime(start_date, "%Y-%m-%d") if start_date else end - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    end += timedelta(days=1)
+    if start >= end or (end - start).days > 731:
+        raise HTTPException(status_code=400, detail="Date range must be between 1 and 731 days")
+    return start, end
+
+@app.get("/api/analytics/utilization")
+async def get_utilization_analytics(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    doctor_id: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Export appointments as CSV-ready data"""
+    """Per-doctor slot utilization, no-show rate and booking lead time"""
+    start, end = _analytics_window(start_date, end_date)
+    return await utilization_report(start, end, doctor_id)
+
+@app.get("/api/analytics/utilization/heatmap")
+async def get_utilization_heatmap(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    doctor_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Booked slots by weekday and hour"""
+    start, end = _analytics_window(start_date, end_date)
+    return await heatmap_report(start, end, doctor_id)
+
+# ==================== Export ====================
+def _export_date_query(start_date: Optional[str], end_date: Optional[str]) -> dict:
     query = {}
     if start_date:
         query["date_time"] = {"$gte": start_date}
@@ -1098,12 +1776,43 @@ async def export_appointments(
             query["date_time"]["$lte"] = end_date + "T23:59:59"
         else:
             query["date_time"] = {"$lte": end_date + "T23:59:59"}
-    
-    appointments = await appointments_collection.find(query).sort("date_time", -1).to_list(5000)
-    
-    # Get doctors
-    doctors = await doctors_collection.find().to_list(100)
-    doctor_map = {d["id"]: d["name"] for d in doctors}
+    return query
+
+async def _name_map(collection) -> dict:
+    return {d["id"]: d["name"] for d in await collection.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None)}
+
+def _columnar_response(export_format: str, name: str, chunks) -> StreamingResponse:
+    media_type, extension = COLUMNAR_FORMATS[export_format]
+    filename = f"{name}_{datetime.utcnow().strftime('%Y-%m-%d')}.{extension}"
+    return StreamingResponse(
+        chunks, media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/api/export/appointments")
+async def export_appointments(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    export_format: str = Query("json", alias="format"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Export appointments as CSV-ready rows, or stream them as Parquet / Arrow"""
+    query = _export_date_query(start_date, end_date)
+    doctor_map = await _name_map(doctors_reporting_collection)
+
+    if export_format in COLUMNAR_FORMATS:
+        return _columnar_response(export_format, "appointments", stream_bookings(
+            export_format, APPOINTMENT_SCHEMA,
+            appointments_reporting_collection, appointments_archive_reporting_collection, query,
+            doctor_map, "doctor_name", "doctor_id", include_cold=may_be_archived(start_date),
+        ))
+    if export_format != "json":
+        raise HTTPException(status_code=400, detail="format must be json, parquet or arrow")
+
+    appointments = await find_across(
+        appointments_reporting_collection, appointments_archive_reporting_collection,
+        query, [("date_time", -1)], 5000, include_cold=may_be_archived(start_date)
+    )
     
     export_data = []
     for apt in appointments:
@@ -1120,6 +1829,24 @@ async def export_appointments(
     
     return export_data
 
+@app.get("/api/export/diagnostic-bookings")
+async def export_diagnostic_bookings(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    export_format: str = Query("parquet", alias="format"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream diagnostic bookings as Parquet or Arrow IPC"""
+    if export_format not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be parquet or arrow")
+    test_map = await _name_map(diagnostic_tests_reporting_collection)
+    return _columnar_response(export_format, "diagnostic_bookings", stream_bookings(
+        export_format, DIAGNOSTIC_BOOKING_SCHEMA,
+        diagnostic_bookings_reporting_collection, diagnostic_bookings_archive_reporting_collection,
+        _export_date_query(start_date, end_date),
+        test_map, "test_name", "test_id", include_cold=may_be_archived(start_date),
+    ))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,69 @@
+"""Slot generation on integer minute offsets.
+
+A day's slots are a NumPy range of minutes after midnight
+(``arange(start, end, slot_minutes)``, the same slots the old
+``while current < end`` loop produced), and free slots are a vectorized
+set difference against the booked offsets. Strings are only produced at
+the response boundary, from a precomputed table of "HH:MM" labels.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+# "HH:MM" for every minute of the day, indexed by offset
+MINUTE_LABELS = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(MINUTES_PER_DAY)], dtype=object)
+
+def parse_minutes(value: str) -> int:
+    """"HH:MM" to minutes after midnight"""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def day_window(schedule: Optional[dict], exception: Optional[dict]) -> Tuple[Optional[Tuple[int, int, int]], Optional[str]]:
+    """(start, end, step) in minutes for one day, or None with the reason there are no slots"""
+    if exception and not exception.get("is_available", False):
+        return None, "Doctor not available on this date"
+    if not schedule:
+        return None, "No schedule for this day"
+    start_time = (exception.get("custom_start_time") if exception else None) or schedule["start_time"]
+    end_time = (exception.get("custom_end_time") if exception else None) or schedule["end_time"]
+    return (parse_minutes(start_time), parse_minutes(end_time), schedule.get("slot_minutes", 15)), None
+
+def slot_offsets(start: int, end: int, step: int) -> np.ndarray:
+    return np.arange(start, end, step, dtype=np.int32)
+
+def booking_minute(date_time) -> Optional[int]:
+    """Minute offset of a "YYYY-MM-DD HH:MM" booking time, or None if it is malformed"""
+    if not isinstance(date_time, str):
+        return None
+    try:
+        return parse_minutes(date_time[11:16])
+    except (TypeError, ValueError):
+        return None
+
+def booked_offsets(date_times: Iterable[str]) -> np.ndarray:
+    """Minute offsets of "YYYY-MM-DD HH:MM" booking times (all on one day).
+
+    Malformed legacy values are skipped rather than failing the whole listing.
+    """
+    minutes = (booking_minute(dt) for dt in date_times)
+    return np.fromiter((m for m in minutes if m is not None), dtype=np.int32)
+
+def free_offsets(offsets: np.ndarray, booked: np.ndarray) -> np.ndarray:
+    if booked.size == 0:
+        return offsets
+    return offsets[~np.isin(offsets, booked, assume_unique=False)]
+
+def format_slots(date: str, offsets: np.ndarray) -> List[Dict[str, str]]:
+    """Response shape of get_available_slots: [{"time": "09:00", "datetime": "2025-01-15 09:00"}]"""
+    offsets = offsets[offsets < MINUTES_PER_DAY]
+    prefix = f"{date} "
+    return [{"time": label, "datetime": prefix + label} for label in MINUTE_LABELS[offsets]]
+
+def bookings_by_date(date_times: Iterable[str]) -> Dict[str, List[str]]:
+    """Group booked "YYYY-MM-DD HH:MM" strings by their date"""
+    grouped: Dict[str, List[str]] = {}
+    for dt in date_times:
+        if isinstance(dt, str):
+            grouped.setdefault(dt[:10], []).append(dt)
+    return grouped
@@ -0,0 +1,266 @@
+"""Slow MongoDB operation log with explain-plan capture.
+
+SlowQueryRecorder is a pymongo command listener that records every
+command slower than SLOW_QUERY_THRESHOLD_MS, grouped by collection,
+command and filter shape (values replaced by 1). Shapes seen at least
+SLOW_QUERY_EXPLAIN_AFTER times are explained once to flag COLLSCANs. A
+background task periodically adds each worker's counts since the last
+flush to the ``slow_queries`` collection with $inc/$max upserts, so the
+admin endpoint sees totals across all workers, and trims the collection
+to the top-N shapes by total time.
+"""
+import asyncio
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo import UpdateOne, monitoring
+
+from metrics import current_request
+
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+SLOW_QUERY_EXPLAIN_AFTER = int(os.environ.get("SLOW_QUERY_EXPLAIN_AFTER", "5"))
+SLOW_QUERY_TOP_N = int(os.environ.get("SLOW_QUERY_TOP_N", "50"))
+SLOW_QUERY_FLUSH_SECONDS = int(os.environ.get("SLOW_QUERY_FLUSH_SECONDS", "60"))
+# Shapes tracked in memory per worker; the least seen are evicted first
+SLOW_QUERY_MAX_ENTRIES = int(os.environ.get("SLOW_QUERY_MAX_ENTRIES", "1000"))
+
+SLOW_QUERIES_COLLECTION = "slow_queries"
+
+# Commands that are never interesting or that we issue ourselves
+IGNORED_COMMANDS = {
+    "explain", "hello", "isMaster", "ismaster", "ping", "buildInfo", "endSessions",
+    "saslStart", "saslContinue", "killCursors", "createIndexes",
+}
+# Fields the driver adds to commands that explain must not receive
+DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber"}
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+
+def query_shape(value):
+    """Replace literal values with 1, keeping field names and operators"""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = [query_shape(v) for v in value]
+        # $in/$nin lists collapse to one element so list length is not a new shape
+        if shapes and all(s == 1 for s in shapes):
+            return [1]
+        return shapes
+    return 1
+
+def command_filter(command_name, command):
+    """Extract (filter, sort) from a command document"""
+    if command_name == "find":
+        return command.get("filter", {}), command.get("sort")
+    if command_name in ("count", "distinct", "findAndModify"):
+        return command.get("query", {}), command.get("sort")
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline", [])
+        match = next((stage["$match"] for stage in pipeline if "$match" in stage), {})
+        sort = next((stage["$sort"] for stage in pipeline if "$sort" in stage), None)
+        return match, sort
+    if command_name == "update":
+        updates = command.get("updates") or [{}]
+        return updates[0].get("q", {}), None
+    if command_name == "delete":
+        deletes = command.get("deletes") or [{}]
+        return deletes[0].get("q", {}), None
+    return None, None
+
+def plan_stages(plan):
+    """Yield every stage name in an explain winning plan"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for key in ("inputStage", "queryPlan"):
+            if key in plan:
+                yield from plan_stages(plan[key])
+        for child in plan.get("inputStages", []):
+            yield from plan_stages(child)
+
+class SlowQueryRecorder(monitoring.CommandListener):
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS):
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+        self._started: Dict[tuple, dict] = {}
+        self.entries: Dict[str, dict] = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if collection == SLOW_QUERIES_COLLECTION:
+            return
+        stats = current_request.get()
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = {
+                "command": event.command,
+                "database": event.database_name,
+                "collection": collection if isinstance(collection, str) else "",
+                "route": stats.route if stats is not None else None,
+            }
+
+    def _finished(self, event):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+        self.record(event.command_name, started, duration_ms)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def record(self, command_name, started, duration_ms):
+        filter_doc, sort_doc = command_filter(command_name, started["command"])
+        shape = {"filter": query_shape(filter_doc) if filter_doc is not None else None}
+        if sort_doc:
+            shape["sort"] = dict(sort_doc)
+        shape_json = json.dumps(shape, sort_keys=True, default=str)
+        key = f"{started['collection']}|{command_name}|{shape_json}"
+        route = started["route"] or "background"
+        print(
+            f"Slow query {duration_ms:.1f}ms {command_name} on {started['collection']} "
+            f"from {route}: {shape_json}"
+        )
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= SLOW_QUERY_MAX_ENTRIES:
+                    # Prefer evicting shapes whose counts are already flushed
+                    evicted = min(self.entries.values(), key=lambda e: (e["count"] > 0, e["_seen"]))
+                    del self.entries[evicted["key"]]
+                entry = self.entries[key] = {
+                    "key": key,
+                    "collection": started["collection"],
+                    "command": command_name,
+                    "shape": shape_json,
+                    "routes": [],
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "plan": None,
+                    "collscan": None,
+                    "first_seen": datetime.utcnow(),
+                    "_seen": 0,
+                }
+            # count/total_ms/max_ms cover this worker since its last flush
+            entry["count"] += 1
+            entry["_seen"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["last_seen"] = datetime.utcnow()
+            if route not in entry["routes"] and len(entry["routes"]) < 10:
+                entry["routes"].append(route)
+            # Keep one raw sample (in memory only) for explain
+            if SLOW_QUERY_EXPLAIN and entry["plan"] is None and command_name in EXPLAINABLE_COMMANDS:
+                entry["_sample"] = (started["database"], started["command"])
+
+    def top(self, n=SLOW_QUERY_TOP_N):
+        """This worker's shapes since its last flush, by total time"""
+        with self._lock:
+            entries = sorted(self.entries.values(), key=lambda e: e["total_ms"], reverse=True)[:n]
+            return [{k: v for k, v in e.items() if not k.startswith("_")} for e in entries]
+
+    def reset(self):
+        with self._lock:
+            self.entries.clear()
+
+    async def explain_offenders(self, client):
+        """Explain repeated offenders once each and flag collection scans"""
+        if not SLOW_QUERY_EXPLAIN:
+            return
+        with self._lock:
+            pending = [
+                (e, e.pop("_sample")) for e in list(self.entries.values())
+                if e["plan"] is None and "_sample" in e and e["_seen"] >= SLOW_QUERY_EXPLAIN_AFTER
+            ]
+        for entry, (database, command) in pending:
+            explainable = {k: v for k, v in command.items() if k not in DRIVER_FIELDS}
+            try:
+                result = await client[database].command(
+                    {"explain": explainable, "verbosity": "queryPlanner"}
+                )
+            except Exception as e:
+                entry["plan"] = f"explain failed: {e}"
+                continue
+            planner = result.get("queryPlanner", {})
+            if not planner and "stages" in result:
+                planner = result["stages"][0].get("$cursor", {}).get("queryPlanner", {})
+            stages = list(plan_stages(planner.get("winningPlan", {})))
+            entry["plan"] = " <- ".join(stages) or "unknown"
+            entry["collscan"] = "COLLSCAN" in stages
+            if entry["collscan"]:
+                print(f"COLLSCAN on {entry['collection']} for {entry['shape']}")
+
+    def _take_pending(self):
+        """Copy and zero the counts gathered since the last flush"""
+        with self._lock:
+            pending = []
+            for e in self.entries.values():
+                if e["count"] or (e["plan"] is not None and not e.get("_plan_flushed")):
+                    pending.append({k: v for k, v in e.items() if not k.startswith("_")})
+                    e["count"], e["total_ms"], e["max_ms"] = 0, 0.0, 0.0
+                    e["_plan_flushed"] = e["plan"] is not None
+            return pending
+
+    def _restore_pending(self, pending):
+        """Put counts back after a failed flush so the next one includes them"""
+        with self._lock:
+            for p in pending:
+                e = self.entries.get(p["key"])
+                if e is not None:
+                    e["count"] += p["count"]
+                    e["total_ms"] += p["total_ms"]
+                    e["max_ms"] = max(e["max_ms"], p["max_ms"])
+                    e["_plan_flushed"] = False
+
+    async def flush(self, db):
+        """Explain pending offenders, add this worker's counts and keep the top-N"""
+        await self.explain_offenders(db.client)
+        pending = self._take_pending()
+        collection = db[SLOW_QUERIES_COLLECTION]
+        if pending:
+            requests = []
+            for p in pending:
+                update = {
+                    "$setOnInsert": {"collection": p["collection"], "command": p["command"], "shape": p["shape"]},
+                    "$inc": {"count": p["count"], "total_ms": p["total_ms"]},
+                    "$max": {"max_ms": p["max_ms"], "last_seen": p["last_seen"]},
+                    "$min": {"first_seen": p["first_seen"]},
+                    "$addToSet": {"routes": {"$each": p["routes"]}},
+                }
+                if p["plan"] is not None:
+                    update["$set"] = {"plan": p["plan"], "collscan": p["collscan"]}
+                requests.append(UpdateOne({"key": p["key"]}, update, upsert=True))
+            try:
+                await collection.bulk_write(requests, ordered=False)
+            except Exception:
+                self._restore_pending(pending)
+                raise
+        beyond_top = await collection.find({}, {"_id": 0, "key": 1}).sort("total_ms", -1).skip(
+            SLOW_QUERY_TOP_N
+        ).to_list(None)
+        if beyond_top:
+            await collection.delete_many({"key": {"$in": [e["key"] for e in beyond_top]}})
+
+slow_query_log = SlowQueryRecorder()
+
+async def run_flush_loop(get_db, interval: Optional[int] = None):
+    """Background task started by the app lifespan"""
+    while True:
+        await asyncio.sleep(interval or SLOW_QUERY_FLUSH_SECONDS)
+        try:
+            await slow_query_log.flush(get_db())
+        except Exception as e:
+            print(f"Error flushing slow query log: {e}")
@@ -0,0 +1,211 @@
+"""Precompressed static snapshots of the public catalog responses.
+
+The public pages load settings, specialties, doctors, diagnostic tests and
+blog posts on every visit, although only admins change them. Each of these
+default public responses is rendered here to a file on disk, once as plain
+JSON and once each for gzip and brotli. The file is named by the SHA-256 of
+its content (``doctors.3f9a0c1b2d4e.json``), so it can be cached forever. A
+small ``manifest.json`` maps each snapshot name to its current file and is
+the only file that must be revalidated.
+
+Admin writes call ``mark_stale``. The worker waits SNAPSHOT_DEBOUNCE_SECONDS
+so that a burst of edits leads to one rebuild, then renders the affected
+snapshots with the same handlers that serve the live API. Catalog reads may
+come from a secondary, so every rebuild is repeated once after
+SNAPSHOT_SETTLE_SECONDS to pick up replication lag. A rebuild whose content
+is unchanged writes nothing.
+
+All workers share SNAPSHOT_DIR, so only the worker that handled an admin
+write rebuilds. Publishing happens under an exclusive lock on the directory:
+the manifest is re-read from disk, one entry is changed, and the manifest is
+written back. An entry only replaces a newer render, so a worker with an
+older view can never roll a snapshot back. The file a manifest points to is
+never pruned.
+
+SNAPSHOT_DIR is meant to be served by the reverse proxy at /api/snapshots/,
+with nginx ``gzip_static``/``brotli_static``, so a public page load never
+reaches Python or Mongo. GET /api/snapshots/{file} serves the same files
+from disk when no proxy is in front.
+"""
+import asyncio
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+import brotli
+from fastapi.encoders import jsonable_encoder
+
+from compression import negotiate
+from metrics import registry
+
+SNAPSHOT_DIR = os.environ.get(
+    "SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "snapshots")
+)
+SNAPSHOT_DEBOUNCE_SECONDS = float(os.environ.get("SNAPSHOT_DEBOUNCE_SECONDS", "2"))
+SNAPSHOT_SETTLE_SECONDS = float(os.environ.get("SNAPSHOT_SETTLE_SECONDS", "30"))
+# Older files stay on disk for clients still holding a previous manifest
+SNAPSHOT_KEEP_VERSIONS = int(os.environ.get("SNAPSHOT_KEEP_VERSIONS", "3"))
+
+URL_PREFIX = "/api/snapshots/"
+MANIFEST = "manifest.json"
+LOCK_FILE = ".lock"
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+MANIFEST_CACHE_CONTROL = "no-cache"
+# Preferred first
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+FILE_NAME = re.compile(r"^[a-z-]+\.[0-9a-f]{12}\.json$")
+
+_builders: Dict[str, Callable[[], Awaitable]] = {}
+_pending = set()
+_wake = asyncio.Event()
+
+def register(name: str, builder: Callable[[], Awaitable]):
+    """Snapshot ``name`` is whatever ``builder()`` returns, encoded like a JSONResponse"""
+    _builders[name] = builder
+
+def mark_stale(*names: str):
+    """Schedule a rebuild of ``names`` (all snapshots when none are given)"""
+    _pending.update(names or _builders)
+    _wake.set()
+
+def encode(payload) -> bytes:
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+def file_for(name: str, accept_encoding: str = ""):
+    """(path, content encoding or None) of the best file for a request, or None for unknown names"""
+    if name != MANIFEST and not FILE_NAME.match(name):
+        return None
+    path = os.path.join(SNAPSHOT_DIR, name)
+    # Same q-value and wildcard rules as CompressionMiddleware
+    encoding = negotiate(accept_encoding)
+    suffix = dict(ENCODINGS).get(encoding)
+    if suffix and os.path.exists(path + suffix):
+        return path + suffix, encoding
+    return path, None
+
+def _write(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _write_snapshot(file_name: str, body: bytes) -> dict:
+    """Write the plain and precompressed files; returns their sizes"""
+    path = os.path.join(SNAPSHOT_DIR, file_name)
+    variants = {
+        "": body,
+        ".gz": gzip.compress(body, compresslevel=9, mtime=0),
+        ".br": brotli.compress(body, quality=11),
+    }
+    # Compressed files first, so the plain file only appears once all exist
+    for suffix in (".gz", ".br", ""):
+        _write(path + suffix, variants[suffix])
+    return {"bytes": len(body), "gzip_bytes": len(variants[".gz"]), "br_bytes": len(variants[".br"])}
+
+@contextmanager
+def _locked():
+    """Exclusive lock on SNAPSHOT_DIR, shared by all worker processes"""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(os.path.join(SNAPSHOT_DIR, LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _read_manifest() -> Dict[str, dict]:
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, MANIFEST), "rb") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _prune(name: str, current: str):
+    versions = sorted(
+        (f for f in os.listdir(SNAPSHOT_DIR) if FILE_NAME.match(f) and f.split(".")[0] == name),
+        key=lambda f: os.path.getmtime(os.path.join(SNAPSHOT_DIR, f)),
+        reverse=True,
+    )
+    for old in versions[SNAPSHOT_KEEP_VERSIONS:]:
+        if old == current:
+            continue
+        for suffix in ("", ".gz", ".br"):
+            try:
+                os.remove(os.path.join(SNAPSHOT_DIR, old + suffix))
+            except FileNotFoundError:
+                pass
+
+def _publish(name: str, body: bytes, rendered_at: float) -> bool:
+    """Write a render and point the manifest at it, unless it is unchanged or older"""
+    version = hashlib.sha256(body).hexdigest()[:12]
+    with _locked():
+        manifest = _read_manifest()
+        entry = manifest.get(name, {})
+        if entry.get("version") == version or entry.get("rendered_at", 0) > rendered_at:
+            return False
+        file_name = f"{name}.{version}.json"
+        sizes = _write_snapshot(file_name, body)
+        manifest[name] = {
+            "version": version,
+            "url": URL_PREFIX + file_name,
+            "built_at": datetime.utcnow().isoformat(),
+            "rendered_at": rendered_at,
+            **sizes,
+        }
+        _write_snapshot(MANIFEST, json.dumps(manifest, separators=(",", ":")).encode("utf-8"))
+        _prune(name, file_name)
+        return True
+
+async def build(name: str) -> bool:
+    """Render one snapshot; returns True when its content changed"""
+    rendered_at = time.time()
+    body = encode(await _builders[name]())
+    changed = await asyncio.to_thread(_publish, name, body, rendered_at)
+    registry.inc(
+        "snapshot_builds_total", "Snapshot rebuilds by outcome",
+        ("name", "outcome"), (name, "changed" if changed else "unchanged"),
+    )
+    return changed
+
+async def build_all(names: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+    results = {}
+    for name in sorted(names if names is not None else _builders):
+        try:
+            results[name] = await build(name)
+        except Exception as e:
+            print(f"Error building snapshot {name}: {e}")
+    return results
+
+def manifest() -> Dict[str, dict]:
+    return _read_manifest()
+
+async def run_snapshot_worker():
+    """Background task started by the app lifespan: builds everything, then rebuilds on mark_stale"""
+    loop = asyncio.get_running_loop()
+    await build_all()
+    settling, settle_at = set(), None
+    while True:
+        timeout = None if settle_at is None else max(0.0, settle_at - loop.time())
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            names, settling, settle_at = settling, set(), None
+            await build_all(names)
+            continue
+        await asyncio.sleep(SNAPSHOT_DEBOUNCE_SECONDS)
+        _wake.clear()
+        names = set(_pending)
+        _pending.clear()
+        await build_all(names)
+        if SNAPSHOT_SETTLE_SECONDS > 0:
+            settling |= names
+            settle_at = loop.time() + SNAPSHOT_SETTLE_SECONDS
@@ -0,0 +1,86 @@
+"""Token-bucket rate limits and priority admission; no MongoDB needed."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import admission
+from admission import PUBLIC, STAFF, ConcurrencyLimiter, InMemoryRateLimitStore, request_priority
+from auth import create_access_token
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_bucket_allows_burst_then_refills(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    store = InMemoryRateLimitStore()
+
+    async def main():
+        results = [await store.take("k", 3, 1.0) for _ in range(4)]
+        assert [allowed for allowed, _ in results] == [True, True, True, False]
+        assert results[-1][1] == 1.0
+
+        clock.now += 0.5
+        allowed, retry_after = await store.take("k", 3, 1.0)
+        assert not allowed and retry_after == 0.5
+
+        clock.now += 0.5
+        assert (await store.take("k", 3, 1.0))[0]
+        # Refill never exceeds the burst capacity
+        clock.now += 3600
+        assert [(await store.take("k", 3, 1.0))[0] for _ in range(4)] == [True, True, True, False]
+        # Buckets are independent per key
+        assert (await store.take("other", 3, 1.0))[0]
+    asyncio.run(main())
+
+def test_public_requests_are_capped_at_their_share():
+    limiter = ConcurrencyLimiter(4, 0.5, 0.1)
+
+    async def main():
+        assert await limiter.acquire(PUBLIC) is None
+        assert await limiter.acquire(PUBLIC) is None
+        assert await limiter.acquire(PUBLIC) == "capacity"
+        # Staff still get the reserved part
+        assert await limiter.acquire(STAFF) is None
+        assert await limiter.acquire(STAFF) is None
+        assert limiter.active == 4
+    asyncio.run(main())
+
+def test_released_slot_goes_to_a_waiting_staff_request():
+    limiter = ConcurrencyLimiter(2, 0.5, 1.0)
+
+    async def main():
+        assert await limiter.acquire(STAFF) is None
+        assert await limiter.acquire(STAFF) is None
+        waiting = asyncio.create_task(limiter.acquire(STAFF))
+        await asyncio.sleep(0)
+        limiter.release()
+        assert await waiting is None
+        # The slot was handed over, not freed for public traffic
+        assert limiter.active == 2
+        assert await limiter.acquire(PUBLIC) == "capacity"
+    asyncio.run(main())
+
+def test_staff_request_times_out_when_no_slot_frees():
+    limiter = ConcurrencyLimiter(1, 0.5, 0.05)
+
+    async def main():
+        assert await limiter.acquire(STAFF) is None
+        assert await limiter.acquire(STAFF) == "capacity"
+    asyncio.run(main())
+
+def test_only_valid_bearer_tokens_get_staff_priority():
+    token = create_access_token({"sub": "admin"})
+
+    def scope(*headers):
+        return {"path": "/api/auth/login", "headers": list(headers)}
+
+    assert request_priority(scope()) == PUBLIC
+    assert request_priority(scope((b"authorization", b"Bearer not-a-token"))) == PUBLIC
+    assert request_priority(scope((b"authorization", f"Bearer {token}".encode()))) == STAFF
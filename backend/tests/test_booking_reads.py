@@ -0,0 +1,80 @@
+"""Booking reads embed a JSON-serializable doctor/test summary.
+
+Runs against the MongoDB at MONGO_URL in a throwaway database (mongomock
+does not implement $lookup with ``let``); skipped when none is reachable.
+"""
+import asyncio
+import os
+import sys
+import uuid
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import ServerSelectionTimeoutError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import server
+
+DOCTOR = {
+    "id": "doctor-1", "name": "Dr. Test", "specialty_id": "specialty-1", "qualifications": "MBBS",
+    "fee": "1500", "bio": "Long bio", "photo": "data:image/png;base64," + "A" * 1000, "active": True,
+}
+TEST = {
+    "id": "test-1", "name": "CBC", "category": "lab_tests", "price": 800, "preparation": None,
+    "report_time": "Same day", "description": "Complete blood count", "active": True,
+}
+
+def booking(**fields):
+    return {
+        "id": str(uuid.uuid4()), "reference_number": f"REF-{uuid.uuid4().hex[:8]}",
+        "date_time": "2030-01-01 10:00", "status": "new",
+        "patient_name": "Test Patient", "patient_phone": "03001234567",
+        "patient_phone_normalized": "923001234567", **fields,
+    }
+
+def run_with_db(check):
+    """Run ``check()`` against a fresh database, dropping it afterwards"""
+    async def main():
+        database.DATABASE_NAME = f"sadiqabad_medical_test_{uuid.uuid4().hex[:8]}"
+        database.MONGO_SERVER_SELECTION_TIMEOUT_MS = 1000
+        db = database.connect()
+        try:
+            await db.command("ping")
+        except ServerSelectionTimeoutError:
+            database.close()
+            pytest.skip(f"No MongoDB at {database.MONGO_URL}")
+        try:
+            await db.doctors.insert_one(dict(DOCTOR))
+            await db.diagnostic_tests.insert_one(dict(TEST))
+            await check(db)
+        finally:
+            await database.client.drop_database(database.DATABASE_NAME)
+            database.close()
+    asyncio.run(main())
+
+def test_appointment_reads_serialize_with_doctor_summary():
+    async def check(db):
+        appointment = booking(doctor_id=DOCTOR["id"])
+        dangling = booking(doctor_id="missing-doctor")
+        await db.appointments.insert_many([appointment, dangling])
+
+        found = jsonable_encoder(await server.get_appointment(appointment["id"]))
+        assert found["doctor"] == {f: DOCTOR[f] for f in server.DOCTOR_SUMMARY_FIELDS}
+        assert jsonable_encoder(await server.get_appointment(dangling["id"]))["doctor"] == {}
+
+        listed = jsonable_encoder(await server.get_appointments(current_user={}))
+        assert {a["id"] for a in listed} == {appointment["id"], dangling["id"]}
+        assert all("_id" not in a and "photo" not in a["doctor"] for a in listed)
+    run_with_db(check)
+
+def test_diagnostic_booking_reads_serialize_with_test_summary():
+    async def check(db):
+        diagnostic = booking(test_id=TEST["id"])
+        await db.diagnostic_bookings.insert_one(diagnostic)
+
+        listed = jsonable_encoder(await server.get_diagnostic_bookings(current_user={}))
+        assert listed[0]["test"] == {f: TEST[f] for f in server.TEST_SUMMARY_FIELDS}
+        assert "_id" not in listed[0]
+    run_with_db(check)
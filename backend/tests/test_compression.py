@@ -0,0 +1,64 @@
+"""Accept-Encoding negotiation and Vary handling; no MongoDB needed."""
+import os
+import sys
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import CompressedCache, CompressionMiddleware, negotiate
+
+def test_negotiate_prefers_brotli_on_ties():
+    assert negotiate("gzip, deflate, br") == "br"
+    assert negotiate("gzip;q=0.5, br;q=0.5") == "br"
+
+def test_negotiate_ranks_by_q_value():
+    assert negotiate("br;q=0.1, gzip") == "gzip"
+    assert negotiate("gzip;q=0.9, br;q=0.8") == "gzip"
+    assert negotiate("BR; q=0.2, GZIP; q=0.3") == "gzip"
+
+def test_negotiate_honours_refusals():
+    assert negotiate("br;q=0, gzip") == "gzip"
+    assert negotiate("br;q=0, gzip;q=0") is None
+    assert negotiate("br;q=0") is None
+    assert negotiate("identity") is None
+    assert negotiate("") is None
+    assert negotiate("gzip;q=nonsense") is None
+
+def test_negotiate_wildcard_covers_unlisted_encodings():
+    assert negotiate("*") == "br"
+    assert negotiate("br;q=0, *") == "gzip"
+    assert negotiate("*;q=0.2, gzip;q=0.1") == "br"
+    assert negotiate("*;q=0") is None
+
+def make_client():
+    big = {"items": ["repeated text"] * 500}
+    app = Starlette(routes=[
+        Route("/big", lambda request: JSONResponse(big)),
+        Route("/small", lambda request: JSONResponse({"ok": True})),
+        Route("/varied", lambda request: JSONResponse(big, headers={"Vary": "Accept-Encoding"})),
+        Route("/png", lambda request: Response(b"\x89PNG" * 1000, media_type="image/png")),
+    ])
+    app.add_middleware(CompressionMiddleware, cache=CompressedCache())
+    return TestClient(app)
+
+def test_every_compressible_response_varies_on_accept_encoding():
+    client = make_client()
+    for path, accept, encoding in [
+        ("/big", "br", "br"),
+        ("/big", "br;q=0.1, gzip", "gzip"),
+        ("/big", "identity", None),
+        ("/small", "br", None),
+    ]:
+        response = client.get(path, headers={"Accept-Encoding": accept})
+        assert response.headers.get("content-encoding") == encoding, (path, accept)
+        assert response.headers["vary"] == "Accept-Encoding", (path, accept)
+
+def test_vary_is_not_duplicated_or_added_to_binary_responses():
+    client = make_client()
+    assert client.get("/varied", headers={"Accept-Encoding": "gzip"}).headers["vary"] == "Accept-Encoding"
+    png = client.get("/png", headers={"Accept-Encoding": "br"})
+    assert "content-encoding" not in png.headers and "vary" not in png.headers
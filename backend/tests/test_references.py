@@ -0,0 +1,67 @@
+"""Reference number check digits and block allocation; no MongoDB needed."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import references
+from references import ReferenceAllocator, format_reference, is_valid_reference, luhn_digit
+
+class FakeCounters:
+    """Stands in for ``counters``: find_one_and_update with $inc, upsert and AFTER"""
+
+    def __init__(self):
+        self.values = {}
+        self.calls = 0
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        self.calls += 1
+        key = query["id"]
+        self.values[key] = self.values.get(key, 0) + update["$inc"]["value"]
+        return {"value": self.values[key]}
+
+def test_luhn_digit_matches_known_values():
+    # 7992739871 is the textbook Luhn example with check digit 3
+    assert luhn_digit("7992739871") == "3"
+    assert luhn_digit("00000000") == "0"
+
+def test_format_reference_pads_and_appends_check_digit():
+    assert format_reference("APT", 1234) == "APT-000012344"
+    assert format_reference("DGN", 123456789) == "DGN-1234567897"
+
+def test_is_valid_reference_catches_typos_but_accepts_legacy():
+    reference = format_reference("APT", 42)
+    assert is_valid_reference(reference)
+    last = int(reference[-1])
+    assert not is_valid_reference(reference[:-1] + str((last + 1) % 10))
+    # A transposition of two adjacent different digits is caught too
+    assert not is_valid_reference("APT-000021344")
+    for legacy in ("APT-1A2B3C4D", "APT-12345678", "DGN-ab12cd34"):
+        assert is_valid_reference(legacy)
+
+def test_allocator_hands_out_sequential_numbers_from_blocks(monkeypatch):
+    counters = FakeCounters()
+    monkeypatch.setattr(references, "counters_collection", counters)
+    allocator = ReferenceAllocator("APT", block_size=3)
+
+    async def main():
+        return [await allocator.next() for _ in range(7)]
+    minted = asyncio.run(main())
+    assert minted == [format_reference("APT", n) for n in range(1, 8)]
+    assert counters.calls == 3
+
+def test_allocators_sharing_a_counter_never_overlap(monkeypatch):
+    counters = FakeCounters()
+    monkeypatch.setattr(references, "counters_collection", counters)
+    first, second = ReferenceAllocator("APT", block_size=5), ReferenceAllocator("APT", block_size=5)
+
+    async def main():
+        minted = []
+        for _ in range(12):
+            minted.append(await first.next())
+            minted.append(await second.next())
+        return minted
+    minted = asyncio.run(main())
+    assert len(set(minted)) == len(minted)
+    assert all(is_valid_reference(r) for r in minted)
@@ -0,0 +1,39 @@
+"""Slot arithmetic, including malformed legacy booking times; no MongoDB needed."""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slots import booked_offsets, booking_minute, bookings_by_date, format_slots, free_offsets, slot_offsets
+
+def test_booking_minute_parses_time_of_day():
+    assert booking_minute("2030-01-01 09:30") == 570
+    assert booking_minute("2030-01-01 00:00") == 0
+
+def test_booking_minute_is_none_for_malformed_values():
+    for value in (None, "", "2030-01-01", "2030-01-01 9h30", "2030-01-01 ab:cd", 20300101, ["2030-01-01 09:00"]):
+        assert booking_minute(value) is None, value
+
+def test_booked_offsets_skip_malformed_legacy_times():
+    booked = booked_offsets(["2030-01-01 09:00", None, "2030-01-01", "2030-01-01 xx:yy", "2030-01-01 09:30"])
+    assert booked.tolist() == [540, 570]
+    assert booked_offsets([None, "bad"]).size == 0
+
+def test_free_offsets_remove_booked_slots():
+    offsets = slot_offsets(540, 600, 15)
+    assert offsets.tolist() == [540, 555, 570, 585]
+    assert free_offsets(offsets, booked_offsets(["2030-01-01 09:15", "broken"])).tolist() == [540, 570, 585]
+    assert free_offsets(offsets, np.array([], dtype=np.int32)).tolist() == offsets.tolist()
+    # A booking off the slot grid does not block anything
+    assert free_offsets(offsets, booked_offsets(["2030-01-01 09:07"])).tolist() == offsets.tolist()
+
+def test_format_slots_and_grouping():
+    assert format_slots("2030-01-01", np.array([540, 1500], dtype=np.int32)) == [
+        {"time": "09:00", "datetime": "2030-01-01 09:00"},
+    ]
+    assert bookings_by_date(["2030-01-01 09:00", None, "2030-01-02 10:00", 5]) == {
+        "2030-01-01": ["2030-01-01 09:00"],
+        "2030-01-02": ["2030-01-02 10:00"],
+    }
@@ -0,0 +1,191 @@
+"""Walk-in token queue per doctor session.
+
+A session is one doctor's OPD on one date. Token numbers come from a
+per-session counter document bumped with one atomic find_one_and_update
+($inc, upsert), so OPD counters issuing at the same time never get
+duplicate numbers, and counters for different doctors never touch the
+same document.
+
+Pre-booked patients join the same queue when reception checks them in.
+Every entry has a ``queue_minute``: the issue time for walk-ins and the
+booked slot time for appointments, so a patient booked for 10:30 who
+arrives early is called around 10:30, among the walk-ins who arrived
+then. Calling the next patient claims the first waiting entry on the
+(doctor_id, date, status, queue_minute, token_number) index with
+find_one_and_update, so two counters never call the same patient.
+
+Display screens read a small summary through an in-process cache that
+is refreshed at most every QUEUE_DISPLAY_CACHE_SECONDS and dropped on
+local writes.
+"""
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import queue_sessions_collection, queue_tokens_collection
+from metrics import registry
+from slots import parse_minutes
+
+QUEUE_DISPLAY_CACHE_SECONDS = float(os.environ.get("QUEUE_DISPLAY_CACHE_SECONDS", "2"))
+QUEUE_DISPLAY_NEXT = int(os.environ.get("QUEUE_DISPLAY_NEXT", "5"))
+# Appointment date_time strings are clinic local time (PKT by default)
+CLINIC_UTC_OFFSET_MINUTES = int(os.environ.get("CLINIC_UTC_OFFSET_MINUTES", "300"))
+
+ORDER = [("queue_minute", 1), ("token_number", 1)]
+
+_display_cache: Dict[Tuple[str, str], Tuple[float, dict]] = {}
+
+def clinic_now() -> datetime:
+    return datetime.utcnow() + timedelta(minutes=CLINIC_UTC_OFFSET_MINUTES)
+
+def session_id(doctor_id: str, date: str) -> str:
+    return f"{doctor_id}:{date}"
+
+def _invalidate(doctor_id: str, date: str):
+    _display_cache.pop((doctor_id, date), None)
+    _display_cache.pop(("*", date), None)
+
+async def next_token_number(doctor_id: str, date: str) -> int:
+    """Atomically take the session's next token number"""
+    for attempt in range(2):
+        try:
+            session = await queue_sessions_collection.find_one_and_update(
+                {"id": session_id(doctor_id, date)},
+                {
+                    "$inc": {"last_number": 1},
+                    "$setOnInsert": {"doctor_id": doctor_id, "date": date, "created_at": datetime.utcnow()},
+                },
+                projection={"_id": 0, "last_number": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            return session["last_number"]
+        except DuplicateKeyError:
+            # Two counters opened the session at once; the retry finds the document
+            if attempt:
+                raise
+
+async def issue_token(doctor_id: str, date: str, kind: str, queue_minute: int, patient: dict) -> dict:
+    number = await next_token_number(doctor_id, date)
+    entry = {
+        **patient,
+        "id": str(uuid.uuid4()),
+        "doctor_id": doctor_id,
+        "date": date,
+        "kind": kind,
+        "token_number": number,
+        "label": str(number) if kind == "walk_in" else f"A{number}",
+        "queue_minute": queue_minute,
+        "status": "waiting",
+        "issued_at": datetime.utcnow(),
+    }
+    await queue_tokens_collection.insert_one(entry)
+    entry.pop("_id", None)
+    _invalidate(doctor_id, date)
+    registry.inc("queue_tokens_issued_total", "Queue tokens issued", ("kind",), (kind,))
+    return entry
+
+async def issue_walk_in(doctor_id: str, patient: dict) -> dict:
+    now = clinic_now()
+    return await issue_token(doctor_id, now.strftime("%Y-%m-%d"), "walk_in", now.hour * 60 + now.minute, patient)
+
+async def check_in(appointment: dict) -> dict:
+    """Queue a pre-booked patient at their slot time; raises DuplicateKeyError if already checked in"""
+    return await issue_token(
+        appointment["doctor_id"],
+        appointment["date_time"][:10],
+        "appointment",
+        parse_minutes(appointment["date_time"][11:16]),
+        {
+            "appointment_id": appointment["id"],
+            "reference_number": appointment.get("reference_number"),
+            "patient_name": appointment["patient_name"],
+            "patient_phone": appointment.get("patient_phone"),
+        },
+    )
+
+async def call_next(doctor_id: str, date: str, called_by: Optional[str] = None) -> Optional[dict]:
+    """Finish the patient being seen and call the next waiting one"""
+    now = datetime.utcnow()
+    await queue_tokens_collection.update_many(
+        {"doctor_id": doctor_id, "date": date, "status": "called"},
+        {"$set": {"status": "served", "served_at": now}},
+    )
+    entry = await queue_tokens_collection.find_one_and_update(
+        {"doctor_id": doctor_id, "date": date, "status": "waiting"},
+        {"$set": {"status": "called", "called_at": now, "called_by": called_by}},
+        sort=ORDER,
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    await queue_sessions_collection.update_one(
+        {"id": session_id(doctor_id, date)},
+        {"$set": {
+            "now_serving": entry["label"] if entry else None,
+            "now_serving_name": entry["patient_name"] if entry else None,
+            "updated_at": now,
+        }},
+    )
+    _invalidate(doctor_id, date)
+    return entry
+
+async def set_token_status(token_id: str, status: str) -> Optional[dict]:
+    entry = await queue_tokens_collection.find_one_and_update(
+        {"id": token_id},
+        {"$set": {"status": status, "updated_at": datetime.utcnow()}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if entry:
+        _invalidate(entry["doctor_id"], entry["date"])
+    return entry
+
+async def session_queue(doctor_id: str, date: str) -> list:
+    """All of the session's entries in calling order"""
+    return await queue_tokens_collection.find(
+        {"doctor_id": doctor_id, "date": date}, {"_id": 0}
+    ).sort(ORDER).to_list(None)
+
+async def _load_display(doctor_id: str, date: str) -> dict:
+    session = await queue_sessions_collection.find_one({"id": session_id(doctor_id, date)}, {"_id": 0}) or {}
+    waiting = {"doctor_id": doctor_id, "date": date, "status": "waiting"}
+    upcoming = await queue_tokens_collection.find(waiting, {"_id": 0, "label": 1}).sort(ORDER).limit(
+        QUEUE_DISPLAY_NEXT
+    ).to_list(QUEUE_DISPLAY_NEXT)
+    return {
+        "doctor_id": doctor_id,
+        "date": date,
+        "now_serving": session.get("now_serving"),
+        "next": [entry["label"] for entry in upcoming],
+        "waiting": await queue_tokens_collection.count_documents(waiting),
+        "issued": session.get("last_number", 0),
+    }
+
+async def _load_board(date: str) -> dict:
+    sessions = await queue_sessions_collection.find(
+        {"date": date}, {"_id": 0, "doctor_id": 1, "now_serving": 1, "last_number": 1}
+    ).to_list(None)
+    return {"date": date, "sessions": sessions}
+
+async def _cached(key: Tuple[str, str], load) -> dict:
+    hit = _display_cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    value = await load()
+    if len(_display_cache) > 1000:
+        _display_cache.clear()
+    _display_cache[key] = (time.monotonic() + QUEUE_DISPLAY_CACHE_SECONDS, value)
+    return value
+
+async def display(doctor_id: str, date: str) -> dict:
+    """Now serving, the next few labels and the waiting count for one session"""
+    return await _cached((doctor_id, date), lambda: _load_display(doctor_id, date))
+
+async def display_board(date: str) -> dict:
+    """Now serving for every session of the day, for the lobby screen"""
+    return await _cached(("*", date), lambda: _load_board(date))
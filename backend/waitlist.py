@@ -0,0 +1,228 @@
+"""Waitlist with automatic backfill of freed appointment slots.
+
+Patients join a doctor's waitlist for a date range. When a cancellation,
+a reschedule or a bulk status change frees a slot, the earliest waiting
+entry whose range covers the slot's date is claimed with one
+find_one_and_update on the (doctor_id, status, created_at) index, so a
+burst of cancellations costs one indexed claim per slot and never scans
+the whole waitlist.
+
+The slot is then held in ``slot_holds`` (unique per doctor and time, TTL
+on expires_at) for WAITLIST_HOLD_MINUTES. While the hold is live the
+slot is hidden from the slot listings and only the offer code books it.
+Offers that are declined, cancelled or left to expire release the hold
+and the slot moves on to the next patient in line.
+"""
+import asyncio
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import (
+    appointments_collection, doctors_collection, waitlist_collection, slot_holds_collection
+)
+from email_service import get_waitlist_offer_message, get_waitlist_offer_whatsapp_message
+from metrics import registry
+from notifications import queue_notifications
+
+WAITLIST_HOLD_MINUTES = int(os.environ.get("WAITLIST_HOLD_MINUTES", "30"))
+WAITLIST_MIN_NOTICE_MINUTES = int(os.environ.get("WAITLIST_MIN_NOTICE_MINUTES", "60"))
+WAITLIST_EXPIRY_POLL_SECONDS = int(os.environ.get("WAITLIST_EXPIRY_POLL_SECONDS", "30"))
+WAITLIST_EXPIRY_BATCH_SIZE = int(os.environ.get("WAITLIST_EXPIRY_BATCH_SIZE", "200"))
+
+ACTIVE_STATUSES = ["new", "confirmed"]
+
+# Running backfills, kept referenced until they finish
+_tasks = set()
+
+def freed_slot(before: Optional[dict], after: Optional[dict]) -> Optional[Tuple[str, str]]:
+    """(doctor_id, date_time) that an appointment change released, if any"""
+    if not before or before.get("status") not in ACTIVE_STATUSES:
+        return None
+    if after and after.get("status") in ACTIVE_STATUSES and after.get("date_time") == before.get("date_time") \
+            and after.get("doctor_id") == before.get("doctor_id"):
+        return None
+    return before["doctor_id"], before["date_time"]
+
+async def is_held(doctor_id: str, date_time: str, token: Optional[str] = None) -> bool:
+    """True when the slot is held for a waitlisted patient other than the holder of ``token``"""
+    hold = await slot_holds_collection.find_one(
+        {"doctor_id": doctor_id, "date_time": date_time, "expires_at": {"$gt": datetime.utcnow()}},
+        {"_id": 0, "token": 1},
+    )
+    return bool(hold) and hold["token"] != token
+
+async def held_times(doctor_id: str, start_date: str, end_date: str) -> List[str]:
+    """date_time of every live hold for the doctor in [start_date, end_date)"""
+    holds = await slot_holds_collection.find(
+        {
+            "doctor_id": doctor_id,
+            "date_time": {"$gte": start_date, "$lt": end_date},
+            "expires_at": {"$gt": datetime.utcnow()},
+        },
+        {"_id": 0, "date_time": 1},
+    ).to_list(None)
+    return [hold["date_time"] for hold in holds]
+
+async def _notify_offer(entry: dict, date_time: str, token: str, expires_at: datetime):
+    doctor = await doctors_collection.find_one({"id": entry["doctor_id"]}, {"_id": 0, "name": 1})
+    doctor_name = doctor["name"] if doctor else "Doctor"
+    expires = expires_at.strftime("%Y-%m-%d %H:%M")
+    subject, message = get_waitlist_offer_message(entry["patient_name"], token, date_time, doctor_name, expires)
+    await queue_notifications([{
+        "type": "waitlist_offer",
+        "booking_kind": "waitlist",
+        "booking_id": entry["id"],
+        "patient_name": entry["patient_name"],
+        "patient_phone": entry["patient_phone"],
+        "patient_email": entry.get("patient_email"),
+        "subject": subject,
+        "message": message,
+        "whatsapp_message": get_waitlist_offer_whatsapp_message(
+            entry["patient_name"], token, date_time, doctor_name, expires
+        ),
+    }])
+
+async def offer_slot(doctor_id: str, date_time: str) -> Optional[dict]:
+    """Offer a free slot to the first waiting patient; returns the claimed entry"""
+    now = datetime.utcnow()
+    if datetime.strptime(date_time, "%Y-%m-%d %H:%M") < now + timedelta(minutes=WAITLIST_MIN_NOTICE_MINUTES):
+        return None
+    if await appointments_collection.find_one(
+        {"doctor_id": doctor_id, "date_time": date_time, "status": {"$in": ACTIVE_STATUSES}}, {"_id": 1}
+    ):
+        return None
+
+    date = date_time[:10]
+    token = secrets.token_hex(4).upper()
+    expires_at = now + timedelta(minutes=WAITLIST_HOLD_MINUTES)
+    entry = await waitlist_collection.find_one_and_update(
+        {"doctor_id": doctor_id, "status": "waiting", "date_from": {"$lte": date}, "date_to": {"$gte": date}},
+        {"$set": {
+            "status": "offered",
+            "offer": {"date_time": date_time, "token": token, "offered_at": now, "expires_at": expires_at},
+        }},
+        sort=[("created_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not entry:
+        return None
+
+    try:
+        # Takes over an expired hold the TTL monitor has not removed yet
+        await slot_holds_collection.update_one(
+            {"doctor_id": doctor_id, "date_time": date_time, "expires_at": {"$lte": now}},
+            {"$set": {"waitlist_id": entry["id"], "token": token, "expires_at": expires_at}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Already held for someone else; the entry keeps its place in line
+        await waitlist_collection.update_one(
+            {"id": entry["id"], "status": "offered", "offer.token": token},
+            {"$set": {"status": "waiting"}, "$unset": {"offer": ""}},
+        )
+        return None
+
+    await _notify_offer(entry, date_time, token, expires_at)
+    registry.inc("waitlist_offers_total", "Freed slots offered to waitlisted patients", ("outcome",), ("offered",))
+    return entry
+
+async def backfill_slots(slots: Iterable[Tuple[str, str]]) -> int:
+    """Offer each freed slot in time order; returns how many were offered"""
+    slots = sorted(set(slots), key=lambda slot: (slot[1], slot[0]))
+    if not slots:
+        return 0
+    # One query drops the doctors nobody is waiting for
+    waiting = set(await waitlist_collection.distinct(
+        "doctor_id", {"doctor_id": {"$in": list({doctor_id for doctor_id, _ in slots})}, "status": "waiting"}
+    ))
+    offered = 0
+    for doctor_id, date_time in slots:
+        if doctor_id not in waiting:
+            continue
+        if await offer_slot(doctor_id, date_time):
+            offered += 1
+        else:
+            registry.inc("waitlist_offers_total", "Freed slots offered to waitlisted patients", ("outcome",), ("none",))
+    return offered
+
+def schedule_backfill(slots: Iterable[Tuple[str, str]]):
+    """Run backfill_slots in the background so the cancelling request returns at once"""
+    slots = [slot for slot in slots if slot]
+    if not slots:
+        return
+    task = asyncio.create_task(_run_backfill(slots))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+async def _run_backfill(slots: List[Tuple[str, str]]):
+    try:
+        await backfill_slots(slots)
+    except Exception as e:
+        print(f"Error backfilling freed slots: {e}")
+
+async def find_offer(entry_id: str, token: str) -> Optional[dict]:
+    """The entry if ``token`` is its live offer code"""
+    return await waitlist_collection.find_one({
+        "id": entry_id,
+        "status": "offered",
+        "offer.token": token.upper(),
+        "offer.expires_at": {"$gt": datetime.utcnow()},
+    }, {"_id": 0})
+
+async def complete_offer(entry: dict, appointment_id: str):
+    """Mark an accepted offer booked and drop its hold"""
+    token = entry["offer"]["token"]
+    await waitlist_collection.update_one(
+        {"id": entry["id"], "status": "offered", "offer.token": token},
+        {"$set": {"status": "booked", "appointment_id": appointment_id, "booked_at": datetime.utcnow()}},
+    )
+    await slot_holds_collection.delete_one({"token": token, "waitlist_id": entry["id"]})
+    registry.inc("waitlist_offers_total", "Freed slots offered to waitlisted patients", ("outcome",), ("booked",))
+
+async def release_offer(entry: dict, status: str) -> bool:
+    """End a live offer with ``status`` and pass its slot to the next patient"""
+    offer = entry.get("offer") or {}
+    result = await waitlist_collection.update_one(
+        {"id": entry["id"], "status": "offered", "offer.token": offer.get("token")},
+        {"$set": {"status": status, "ended_at": datetime.utcnow()}},
+    )
+    if result.modified_count == 0:
+        return False
+    await slot_holds_collection.delete_one({"token": offer["token"], "waitlist_id": entry["id"]})
+    registry.inc("waitlist_offers_total", "Freed slots offered to waitlisted patients", ("outcome",), (status,))
+    await offer_slot(entry["doctor_id"], offer["date_time"])
+    return True
+
+async def expire_offers(limit: int = WAITLIST_EXPIRY_BATCH_SIZE) -> int:
+    """Release offers whose hold ran out; uses the (status, offer.expires_at) index"""
+    expired = await waitlist_collection.find(
+        {"status": "offered", "offer.expires_at": {"$lte": datetime.utcnow()}}, {"_id": 0}
+    ).sort("offer.expires_at", 1).to_list(limit)
+    released = 0
+    for entry in expired:
+        released += await release_offer(entry, "expired")
+    return released
+
+async def run_expiry_loop(interval: int = WAITLIST_EXPIRY_POLL_SECONDS):
+    """Background task started by the app lifespan"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await expire_offers()
+        except Exception as e:
+            print(f"Error expiring waitlist offers: {e}")
+
+async def join_waitlist(data: dict) -> dict:
+    data["id"] = str(uuid.uuid4())
+    data["status"] = "waiting"
+    data["created_at"] = datetime.utcnow()
+    await waitlist_collection.insert_one(data)
+    data.pop("_id", None)
+    return data
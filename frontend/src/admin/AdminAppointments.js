@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { getAppointments, getDoctors, updateAppointment, exportAppointments } from '../services/api';
+import { getAppointments, getDoctors, updateAppointment, bulkUpdateAppointments, exportAppointments, subscribeToBookings } from '../services/api';
 import { Search, Filter, Download, Eye, Edit, X, Phone } from 'lucide-react';
 import { format, parseISO } from 'date-fns';
 
@@ -12,6 +12,8 @@ const AdminAppointments = () => {
   const [selectedDate, setSelectedDate] = useState('');
   const [showModal, setShowModal] = useState(false);
   const [selectedAppointment, setSelectedAppointment] = useState(null);
+  const [checkedIds, setCheckedIds] = useState([]);
+  const [bulkStatus, setBulkStatus] = useState('confirmed');
 
   const statuses = ['new', 'confirmed', 'completed', 'cancelled', 'no_show'];
 
@@ -37,6 +39,20 @@ const AdminAppointments = () => {
 
   useEffect(() => { fetchData(); }, [selectedDoctor, selectedStatus, selectedDate]);
 
+  // Apply live changes instead of polling; new bookings need doctor names, so re-fetch
+  useEffect(() => {
+    const params = { kinds: 'appointment', doctor_id: selectedDoctor, date: selectedDate };
+    return subscribeToBookings(params, (event) => {
+      if (event.type === 'appointment.updated' || event.type === 'appointment.cancelled') {
+        setAppointments((prev) => prev
+          .map((a) => (a.id === event.booking.id ? { ...a, ...event.booking } : a))
+          .filter((a) => !selectedStatus || a.status === selectedStatus));
+      } else {
+        fetchData();
+      }
+    });
+  }, [selectedDoctor, selectedStatus, selectedDate]);
+
   const handleStatusChange = async (id, status) => {
     try {
       await updateAppointment(id, { status });
@@ -46,6 +62,24 @@ const AdminAppointments = () => {
     }
   };
 
+  const toggleChecked = (id) => {
+    setCheckedIds((prev) => prev.includes(id) ? prev.filter((x) => x !== id) : [...prev, id]);
+  };
+
+  const handleBulkStatus = async () => {
+    try {
+      const response = await bulkUpdateAppointments(checkedIds.map((id) => ({ id, status: bulkStatus })));
+      const failed = response.data.results.filter((r) => r.result !== 'updated');
+      if (failed.length > 0) {
+        alert(`${failed.length} appointment(s) could not be updated`);
+      }
+      setCheckedIds([]);
+      fetchData();
+    } catch (error) {
+      alert('Failed to update status');
+    }
+  };
+
   const handleExport = async () => {
     try {
       const response = await exportAppointments(selectedDate, selectedDate);
@@ -107,6 +141,20 @@ const AdminAppointments = () => {
             <option value="">All Status</option>
             {statuses.map(s => <option key={s} value={s}>{s.charAt(0).toUpperCase() + s.slice(1)}</option>)}
           </select>
+          {checkedIds.length > 0 && (
+            <div className="flex items-center gap-2">
+              <select
+                value={bulkStatus}
+                onChange={(e) => setBulkStatus(e.target.value)}
+                className="input-field max-w-xs"
+              >
+                {statuses.map(s => <option key={s} value={s}>{s.charAt(0).toUpperCase() + s.slice(1)}</option>)}
+              </select>
+              <button onClick={handleBulkStatus} className="btn-primary">
+                Update {checkedIds.length} selected
+              </button>
+            </div>
+          )}
           <button onClick={handleExport} className="btn-secondary flex items-center gap-2 ml-auto">
             <Download size={18} /> Export CSV
           </button>
@@ -119,6 +167,13 @@ const AdminAppointments = () => {
           <table className="w-full">
             <thead className="bg-gray-50">
               <tr>
+                <th className="py-3 px-4">
+                  <input
+                    type="checkbox"
+                    checked={appointments.length > 0 && checkedIds.length === appointments.length}
+                    onChange={(e) => setCheckedIds(e.target.checked ? appointments.map((a) => a.id) : [])}
+                  />
+                </th>
                 <th className="text-left py-3 px-4 font-medium text-gray-700">Reference</th>
                 <th className="text-left py-3 px-4 font-medium text-gray-700">Patient</th>
                 <th className="text-left py-3 px-4 font-medium text-gray-700">Doctor</th>
@@ -130,6 +185,9 @@ const AdminAppointments = () => {
             <tbody className="divide-y">
               {appointments.map((apt) => (
                 <tr key={apt.id} className="hover:bg-gray-50">
+                  <td className="py-3 px-4">
+                    <input type="checkbox" checked={checkedIds.includes(apt.id)} onChange={() => toggleChecked(apt.id)} />
+                  </td>
                   <td className="py-3 px-4 font-medium text-primary-600">{apt.reference_number}</td>
                   <td className="py-3 px-4">
                     <div>
@@ -164,7 +222,7 @@ const AdminAppointments = () => {
                 </tr>
               ))}
               {appointments.length === 0 && (
-                <tr><td colSpan={6} className="py-8 text-center text-gray-500">No appointments found</td></tr>
+                <tr><td colSpan={7} className="py-8 text-center text-gray-500">No appointments found</td></tr>
               )}
             </tbody>
           </table>
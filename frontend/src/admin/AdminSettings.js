@@ -11,7 +11,7 @@ const AdminSettings = () => {
   useEffect(() => {
     const fetchSettings = async () => {
       try {
-        const res = await getSettings();
+        const res = await getSettings({ live: true });
         setSettings(res.data || {});
       } catch (error) {
         console.error('Failed to fetch settings:', error);
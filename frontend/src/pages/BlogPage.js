@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Link, useSearchParams } from 'react-router-dom';
-import { getBlogPosts, getBlogCategories } from '../services/api';
+import { getBlogPosts, getBlogCategories, imageUrl } from '../services/api';
 import { Calendar, User, Eye, Tag, ArrowRight } from 'lucide-react';
 import { format, parseISO } from 'date-fns';
 
@@ -110,11 +110,17 @@ const BlogPage = () => {
                   {posts.map((post) => (
                     <article key={post.id} className="card overflow-hidden hover:shadow-lg transition-shadow">
                       {post.featured_image && (
-                        <img
-                          src={post.featured_image}
-                          alt={post.title}
-                          className="w-full h-48 object-cover"
-                        />
+                        <picture>
+                          {post.featured_image_webp && (
+                            <source srcSet={imageUrl(post.featured_image_webp)} type="image/webp" />
+                          )}
+                          <img
+                            src={imageUrl(post.featured_image)}
+                            alt={post.title}
+                            className="w-full h-48 object-cover"
+                            loading="lazy"
+                          />
+                        </picture>
                       )}
                       <div className="p-6">
                         <div className="flex items-center gap-4 text-sm text-gray-500 mb-3">
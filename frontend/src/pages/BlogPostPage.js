@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { getBlogPost, getBlogPosts } from '../services/api';
+import { getBlogPost, getBlogPosts, imageUrl } from '../services/api';
 import { Calendar, User, Eye, Tag, ArrowLeft, Share2, Facebook, Twitter } from 'lucide-react';
 import { format, parseISO } from 'date-fns';
 
@@ -65,11 +65,16 @@ const BlogPostPage = () => {
 
             <div className="card overflow-hidden">
               {post.featured_image && (
-                <img
-                  src={post.featured_image}
-                  alt={post.title}
-                  className="w-full h-64 md:h-96 object-cover"
-                />
+                <picture>
+                  {post.featured_image_webp && (
+                    <source srcSet={imageUrl(post.featured_image_webp)} type="image/webp" />
+                  )}
+                  <img
+                    src={imageUrl(post.featured_image)}
+                    alt={post.title}
+                    className="w-full h-64 md:h-96 object-cover"
+                  />
+                </picture>
               )}
               <div className="p-6 md:p-8">
                 <div className="flex flex-wrap items-center gap-4 text-sm text-gray-500 mb-4">
@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useSearchParams, useNavigate } from 'react-router-dom';
-import { getDoctors, getSpecialties, getAvailableSlots, createAppointment } from '../services/api';
+import { getDoctors, getSpecialties, getAvailableSlots, createAppointment, newIdempotencyKey } from '../services/api';
 import { useSite } from '../context/SiteContext';
 import { Calendar, Clock, User, Phone, Mail, CheckCircle, ArrowLeft, ArrowRight, MessageCircle } from 'lucide-react';
 import { format, addDays, parseISO } from 'date-fns';
@@ -18,6 +18,7 @@ const BookAppointmentPage = () => {
   const [submitting, setSubmitting] = useState(false);
   const [confirmation, setConfirmation] = useState(null);
   const [error, setError] = useState('');
+  const idempotencyKey = useRef(newIdempotencyKey());
 
   const [selectedSpecialty, setSelectedSpecialty] = useState('');
   const [selectedDoctor, setSelectedDoctor] = useState(searchParams.get('doctor') || '');
@@ -89,7 +90,7 @@ const BookAppointmentPage = () => {
         patient_email: patientData.email || undefined,
         patient_gender: patientData.gender || undefined,
         notes: patientData.notes || undefined
-      });
+      }, idempotencyKey.current);
 
       setConfirmation({
         referenceNumber: response.data.reference_number,
@@ -98,6 +99,7 @@ const BookAppointmentPage = () => {
         dateTime: selectedSlot
       });
       setStep(4);
+      idempotencyKey.current = newIdempotencyKey();
     } catch (error) {
       setError(error.response?.data?.detail || 'Failed to book appointment. Please try again.');
     } finally {
@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useSearchParams, useNavigate } from 'react-router-dom';
-import { getDiagnosticTests, createDiagnosticBooking } from '../services/api';
+import { getDiagnosticTests, createDiagnosticBooking, newIdempotencyKey } from '../services/api';
 import { useSite } from '../context/SiteContext';
 import { Calendar, Clock, TestTube, CheckCircle, ArrowLeft, ArrowRight, MessageCircle, FileText } from 'lucide-react';
 import { format, addDays, parseISO } from 'date-fns';
@@ -16,6 +16,7 @@ const BookDiagnosticPage = () => {
   const [submitting, setSubmitting] = useState(false);
   const [confirmation, setConfirmation] = useState(null);
   const [error, setError] = useState('');
+  const idempotencyKey = useRef(newIdempotencyKey());
 
   const [selectedCategory, setSelectedCategory] = useState('');
   const [selectedTest, setSelectedTest] = useState(searchParams.get('test') || '');
@@ -74,7 +75,7 @@ const BookDiagnosticPage = () => {
         patient_email: patientData.email || undefined,
         patient_gender: patientData.gender || undefined,
         notes: patientData.notes || undefined
-      });
+      }, idempotencyKey.current);
 
       const testInfo = tests.find(t => t.id === selectedTest);
       setConfirmation({
@@ -85,6 +86,7 @@ const BookDiagnosticPage = () => {
         preparation: response.data.preparation
       });
       setStep(4);
+      idempotencyKey.current = newIdempotencyKey();
     } catch (error) {
       setError(error.response?.data?.detail || 'Failed to book test. Please try again.');
     } finally {
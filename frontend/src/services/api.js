@@ -33,19 +33,65 @@ api.interceptors.response.use(
   }
 );
 
+// Idempotency keys let booking retries replay the first response
+export const newIdempotencyKey = () =>
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+
+const idempotencyHeaders = (key) => (key ? { headers: { 'Idempotency-Key': key } } : {});
+
 // Auth
 export const login = (username, password) =>
   api.post('/api/auth/login', { username, password });
 
 export const getMe = () => api.get('/api/auth/me');
 
+// Public catalog snapshots: precompressed static JSON built by the backend
+// after admin edits (see backend/snapshots.py). Any failure falls back to
+// the live endpoint.
+const SNAPSHOT_MANIFEST_TTL_MS = 60 * 1000;
+let snapshotManifest = null;
+let snapshotManifestAt = 0;
+const getSnapshotManifest = () => {
+  if (!snapshotManifest || Date.now() - snapshotManifestAt > SNAPSHOT_MANIFEST_TTL_MS) {
+    snapshotManifestAt = Date.now();
+    snapshotManifest = axios
+      .get(`${API_URL}/api/snapshots/manifest.json`)
+      .then((res) => res.data)
+      .catch(() => {
+        snapshotManifest = null;
+        return null;
+      });
+  }
+  return snapshotManifest;
+};
+const fromSnapshot = async (name, live, select = (data) => data) => {
+  const manifest = await getSnapshotManifest();
+  const entry = manifest && manifest[name];
+  if (entry) {
+    try {
+      const res = await axios.get(`${API_URL}${entry.url}`);
+      return { ...res, data: select(res.data) };
+    } catch (error) {
+      // fall through to the live API
+    }
+  }
+  return live();
+};
+const isDefaultQuery = (params, allowed = []) =>
+  Object.entries(params).every(
+    ([key, value]) => value == null || value === '' || allowed.includes(key) || (key === 'active_only' && `${value}` === 'true')
+  );
+
 // Settings
-export const getSettings = () => api.get('/api/settings');
+export const getSettings = ({ live = false } = {}) =>
+  live ? api.get('/api/settings') : fromSnapshot('settings', () => api.get('/api/settings'));
 export const updateSettings = (data) => api.put('/api/settings', data);
 
 // Specialties
-export const getSpecialties = (activeOnly = true) =>
-  api.get(`/api/specialties?active_only=${activeOnly}`);
+export const getSpecialties = (activeOnly = true) => {
+  const live = () => api.get(`/api/specialties?active_only=${activeOnly}`);
+  return activeOnly ? fromSnapshot('specialties', live) : live();
+};
 export const createSpecialty = (data) => api.post('/api/specialties', data);
 export const updateSpecialty = (id, data) => api.put(`/api/specialties/${id}`, data);
 export const deleteSpecialty = (id) => api.delete(`/api/specialties/${id}`);
@@ -57,7 +103,8 @@ export const getDoctors = (params = {}) => {
     Object.entries(params).filter(([_, v]) => v != null && v !== '')
   );
   const queryString = new URLSearchParams(cleanParams).toString();
-  return api.get(`/api/doctors${queryString ? `?${queryString}` : ''}`);
+  const live = () => api.get(`/api/doctors${queryString ? `?${queryString}` : ''}`);
+  return isDefaultQuery(cleanParams) ? fromSnapshot('doctors', live) : live();
 };
 export const getDoctor = (id) => api.get(`/api/doctors/${id}`);
 export const createDoctor = (data) => api.post('/api/doctors', data);
@@ -80,6 +127,8 @@ export const deleteScheduleException = (id) => api.delete(`/api/schedule-excepti
 // Available Slots
 export const getAvailableSlots = (doctorId, date) =>
   api.get(`/api/available-slots/${doctorId}?date=${date}`);
+export const getAvailableSlotsRange = (doctorId, startDate, days = 7) =>
+  api.get(`/api/available-slots/${doctorId}/range?start_date=${startDate}&days=${days}`);
 
 // Appointments
 export const getAppointments = (params = {}) => {
@@ -90,9 +139,51 @@ export const getAppointments = (params = {}) => {
   return api.get(`/api/appointments${queryString ? `?${queryString}` : ''}`);
 };
 export const getAppointment = (id) => api.get(`/api/appointments/${id}`);
-export const createAppointment = (data) => api.post('/api/appointments', data);
+export const createAppointment = (data, idempotencyKey) =>
+  api.post('/api/appointments', data, idempotencyHeaders(idempotencyKey));
 export const updateAppointment = (id, data) => api.put(`/api/appointments/${id}`, data);
 export const cancelAppointment = (id) => api.delete(`/api/appointments/${id}`);
+export const bulkUpdateAppointments = (updates) => api.post('/api/appointments/bulk-update', { updates });
+
+// Live booking feed (Server-Sent Events); returns an unsubscribe function.
+// The EventSource URL carries a short-lived stream token, never the login
+// token, so a closed stream is reopened with a fresh one from the last event.
+export const subscribeToBookings = (params = {}, onEvent) => {
+  let source = null;
+  let lastEventId = null;
+  let stopped = false;
+  const handler = (e) => {
+    lastEventId = e.lastEventId || lastEventId;
+    onEvent(JSON.parse(e.data));
+  };
+  const connect = async () => {
+    let token;
+    try {
+      token = (await api.post('/api/live/token')).data.token;
+    } catch (error) {
+      if (!stopped && error.response?.status !== 401) setTimeout(connect, 5000);
+      return;
+    }
+    if (stopped) return;
+    const cleanParams = Object.fromEntries(
+      Object.entries({ ...params, token, since: lastEventId })
+        .filter(([_, v]) => v != null && v !== '')
+    );
+    source = new EventSource(`${API_URL}/api/live/bookings?${new URLSearchParams(cleanParams)}`);
+    ['appointment.created', 'appointment.updated', 'appointment.cancelled',
+     'diagnostic_booking.created', 'diagnostic_booking.updated', 'diagnostic_booking.cancelled',
+     'resync'].forEach((type) => source.addEventListener(type, handler));
+    source.onerror = () => {
+      // The browser retries by itself unless the stream was refused (e.g. expired token)
+      if (source.readyState === EventSource.CLOSED && !stopped) setTimeout(connect, 3000);
+    };
+  };
+  connect();
+  return () => {
+    stopped = true;
+    if (source) source.close();
+  };
+};
 
 // Diagnostic Tests
 export const getDiagnosticTests = (params = {}) => {
@@ -100,7 +191,8 @@ export const getDiagnosticTests = (params = {}) => {
     Object.entries(params).filter(([_, v]) => v != null && v !== '')
   );
   const queryString = new URLSearchParams(cleanParams).toString();
-  return api.get(`/api/diagnostic-tests${queryString ? `?${queryString}` : ''}`);
+  const live = () => api.get(`/api/diagnostic-tests${queryString ? `?${queryString}` : ''}`);
+  return isDefaultQuery(cleanParams) ? fromSnapshot('diagnostic-tests', live) : live();
 };
 export const getDiagnosticTest = (id) => api.get(`/api/diagnostic-tests/${id}`);
 export const createDiagnosticTest = (data) => api.post('/api/diagnostic-tests', data);
@@ -115,8 +207,19 @@ export const getDiagnosticBookings = (params = {}) => {
   const queryString = new URLSearchParams(cleanParams).toString();
   return api.get(`/api/diagnostic-bookings${queryString ? `?${queryString}` : ''}`);
 };
-export const createDiagnosticBooking = (data) => api.post('/api/diagnostic-bookings', data);
+export const createDiagnosticBooking = (data, idempotencyKey) =>
+  api.post('/api/diagnostic-bookings', data, idempotencyHeaders(idempotencyKey));
 export const updateDiagnosticBooking = (id, data) => api.put(`/api/diagnostic-bookings/${id}`, data);
+export const bulkUpdateDiagnosticBookings = (updates) => api.post('/api/diagnostic-bookings/bulk-update', { updates });
+
+// Patient lookup by phone or APT-/DGN- reference, paged with `before`
+export const lookupPatientBookings = (params = {}) => {
+  const cleanParams = Object.fromEntries(
+    Object.entries(params).filter(([_, v]) => v != null && v !== '')
+  );
+  const queryString = new URLSearchParams(cleanParams).toString();
+  return api.get(`/api/patients/bookings${queryString ? `?${queryString}` : ''}`);
+};
 
 // Blog
 export const getBlogPosts = (params = {}) => {
@@ -124,7 +227,12 @@ export const getBlogPosts = (params = {}) => {
     Object.entries(params).filter(([_, v]) => v != null && v !== '')
   );
   const queryString = new URLSearchParams(cleanParams).toString();
-  return api.get(`/api/blog${queryString ? `?${queryString}` : ''}`);
+  const live = () => api.get(`/api/blog${queryString ? `?${queryString}` : ''}`);
+  // The snapshot holds the newest 50 published posts
+  const limit = Number(cleanParams.limit || 10);
+  return isDefaultQuery(cleanParams, ['limit']) && limit <= 50
+    ? fromSnapshot('blog', live, (posts) => posts.slice(0, limit))
+    : live();
 };
 export const getBlogPost = (slug) => api.get(`/api/blog/${slug}`);
 export const getBlogCategories = () => api.get('/api/blog/categories');
@@ -143,6 +251,56 @@ export const markMessageRead = (id) => api.put(`/api/contact-messages/${id}/read
 // Analytics
 export const getDashboardAnalytics = () => api.get('/api/analytics/dashboard');
 export const getBookingsAnalytics = (days = 7) => api.get(`/api/analytics/bookings?days=${days}`);
+export const getUtilizationAnalytics = (params = {}) => {
+  const cleanParams = Object.fromEntries(
+    Object.entries(params).filter(([_, v]) => v != null && v !== '')
+  );
+  const queryString = new URLSearchParams(cleanParams).toString();
+  return api.get(`/api/analytics/utilization${queryString ? `?${queryString}` : ''}`);
+};
+export const getUtilizationHeatmap = (params = {}) => {
+  const cleanParams = Object.fromEntries(
+    Object.entries(params).filter(([_, v]) => v != null && v !== '')
+  );
+  const queryString = new URLSearchParams(cleanParams).toString();
+  return api.get(`/api/analytics/utilization/heatmap${queryString ? `?${queryString}` : ''}`);
+};
+
+// Waitlist
+export const joinWaitlist = (data) => api.post('/api/waitlist', data);
+export const getWaitlist = (params = {}) => {
+  const cleanParams = Object.fromEntries(
+    Object.entries(params).filter(([_, v]) => v != null && v !== '')
+  );
+  const queryString = new URLSearchParams(cleanParams).toString();
+  return api.get(`/api/waitlist${queryString ? `?${queryString}` : ''}`);
+};
+export const acceptWaitlistOffer = (id, token) => api.post(`/api/waitlist/${id}/accept`, { token });
+export const declineWaitlistOffer = (id, token) => api.post(`/api/waitlist/${id}/decline`, { token });
+export const cancelWaitlistEntry = (id) => api.delete(`/api/waitlist/${id}`);
+
+// Walk-in Token Queue
+export const issueWalkInToken = (data) => api.post('/api/queue/tokens', data);
+export const checkInAppointment = (appointmentId) => api.post(`/api/queue/check-in/${appointmentId}`);
+export const getQueue = (doctorId, date) => api.get(`/api/queue/${doctorId}${date ? `?date=${date}` : ''}`);
+export const callNextToken = (doctorId) => api.post(`/api/queue/${doctorId}/call-next`);
+export const updateQueueToken = (id, status) => api.put(`/api/queue/tokens/${id}`, { status });
+export const getQueueDisplay = (doctorId) => api.get(`/api/queue/${doctorId}/display`);
+export const getQueueBoard = () => api.get('/api/queue/display');
+
+// Images
+export const uploadImage = (file) => {
+  const formData = new FormData();
+  formData.append('file', file);
+  return api.post('/api/images', formData, { headers: { 'Content-Type': 'multipart/form-data' } });
+};
+// Resized variants come back as /api/images/... paths on the backend host
+export const imageUrl = (path) => (path && path.startsWith('/api/') ? `${API_URL}${path}` : path);
+
+// Rescheduling & Notifications
+export const getRescheduleJob = (jobId) => api.get(`/api/reschedule-jobs/${jobId}`);
+export const getNotifications = (acknowledged = false) => api.get(`/api/notifications?acknowledged=${acknowledged}`);
+export const acknowledgeNotification = (id) => api.put(`/api/notifications/${id}/acknowledge`);
 
 // Export
 export const exportAppointments = (startDate, endDate) => {
@@ -151,5 +309,12 @@ export const exportAppointments = (startDate, endDate) => {
   if (endDate) params.append('end_date', endDate);
   return api.get(`/api/export/appointments?${params.toString()}`);
 };
+// Columnar download; `kind` is 'appointments' or 'diagnostic-bookings', `format` 'parquet' or 'arrow'
+export const exportBookingsColumnar = (kind, format, startDate, endDate) => {
+  const params = new URLSearchParams({ format });
+  if (startDate) params.append('start_date', startDate);
+  if (endDate) params.append('end_date', endDate);
+  return api.get(`/api/export/${kind}?${params.toString()}`, { responseType: 'blob' });
+};
 
 export default api;